@@ -0,0 +1,67 @@
+"""
+Access control for the HTTP endpoints.
+
+Admin endpoints (bulk export/import, diagnostics, stats): set ADMIN_TOKEN in
+.env and send it as `Authorization: Bearer <token>`. Without a token configured
+they are disabled: behind a reverse proxy every request looks local, so the
+client address can't stand in for a token.
+
+Chat API endpoints: set API_TOKEN to require it as a bearer token; without one
+they are open, like the chat UI itself.
+
+Behind a reverse proxy, list its address in TRUSTED_PROXIES so API rate limits
+use the client address from X-Forwarded-For instead of the proxy's own.
+"""
+import hashlib
+import hmac
+import logging
+import os
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+API_TOKEN = os.getenv('API_TOKEN', '')
+TRUSTED_PROXIES = {host.strip() for host in os.getenv('TRUSTED_PROXIES', '').split(',') if host.strip()}
+
+if not ADMIN_TOKEN:
+    logger.warning("ADMIN_TOKEN is not set: admin endpoints (export/import, diagnostics, stats) are disabled")
+
+def _bearer_token(request: Request) -> str:
+    return request.headers.get('authorization', '').removeprefix('Bearer ').strip()
+
+def client_address(request: Request) -> str:
+    """The address of the client, looking through X-Forwarded-For set by a trusted proxy."""
+    host = request.client.host if request.client else 'unknown'
+    if host in TRUSTED_PROXIES:
+        # The last address not added by one of our proxies is the client's; earlier ones can be forged
+        for forwarded in reversed(request.headers.get('x-forwarded-for', '').split(',')):
+            forwarded = forwarded.strip()
+            if forwarded and forwarded not in TRUSTED_PROXIES:
+                return forwarded
+    return host
+
+def client_identity(request: Request) -> str:
+    """Who a request counts against for rate limits: its bearer token if any, else its address."""
+    token = _bearer_token(request)
+    if token:
+        # Never keep the token itself around as a key
+        return 'token:' + hashlib.sha256(token.encode()).hexdigest()[:16]
+    return f"ip:{client_address(request)}"
+
+def require_api_token(request: Request) -> None:
+    """FastAPI dependency for the chat API; a no-op unless API_TOKEN is set."""
+    if API_TOKEN and not hmac.compare_digest(_bearer_token(request), API_TOKEN):
+        raise HTTPException(status_code=401, detail='Invalid API token')
+
+def require_admin(request: Request) -> None:
+    """FastAPI dependency that rejects non-admin requests with 403."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail='Admin endpoints are disabled; set ADMIN_TOKEN')
+    if not hmac.compare_digest(_bearer_token(request), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail='Admin access required')
@@ -0,0 +1,160 @@
+"""
+Admission control for chat generations, shared by the chat UI and the HTTP API.
+
+Every reply has to be admitted before it is generated:
+- the prompt must not be longer than `max_prompt_chars`;
+- each user (browser session, API token or client address) draws from a token bucket that
+  refills at `rate_limit.per_minute` with room for `rate_limit.burst`;
+- a conversation generates one reply at a time. Up to `queue_depth` further
+  messages wait for it, anything beyond that is turned away;
+- a user runs at most `max_generations_per_user` replies at once, across all
+  of their conversations.
+
+`max_output_tokens` caps the length of chat replies (Ollama's num_predict).
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from . import config
+
+# Token buckets kept for this many distinct users; the least recently seen are dropped
+MAX_TRACKED_USERS = 10000
+
+class AdmissionError(Exception):
+    """A generation was refused; `status` is the matching HTTP status code."""
+
+    def __init__(self, message: str, status: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Allows `capacity` requests at once, refilled at `rate` requests per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class Ticket:
+    """An admitted generation; `async with` it to wait for its turn and run."""
+
+    def __init__(self, controller: 'AdmissionController', conversation_key: str, user_key: str):
+        self._controller = controller
+        self.conversation_key = conversation_key
+        self.user_key = user_key
+        self._held = []
+        self._released = False
+
+    async def acquire(self) -> None:
+        """Wait until the conversation and the user have a free slot."""
+        try:
+            for lock in (self._controller._conversation_lock(self.conversation_key),
+                         self._controller._user_slots(self.user_key)):
+                await lock.acquire()
+                self._held.append(lock)
+        except BaseException:
+            self.release()
+            raise
+
+    async def __aenter__(self) -> 'Ticket':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """Free the ticket's place; safe to call more than once."""
+        if self._released:
+            return
+        self._released = True
+        for lock in reversed(self._held):
+            lock.release()
+        self._held.clear()
+        self._controller._finished(self.conversation_key, self.user_key)
+
+class AdmissionController:
+    """Tracks rate limits and in-flight generations per user and conversation."""
+
+    def __init__(self):
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        # Admitted tickets per conversation and per user, running or waiting
+        self._pending: Dict[str, int] = {}
+        self._user_pending: Dict[str, int] = {}
+
+    def _conversation_lock(self, key: str) -> asyncio.Lock:
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    def _user_slots(self, key: str) -> asyncio.Semaphore:
+        limit = max(1, int(config.get_config().get('max_generations_per_user') or 1))
+        return self._slots.setdefault(key, asyncio.Semaphore(limit))
+
+    def _finished(self, conversation_key: str, user_key: str) -> None:
+        self._pending[conversation_key] -= 1
+        if not self._pending[conversation_key]:
+            # Idle conversations keep no state
+            del self._pending[conversation_key]
+            self._locks.pop(conversation_key, None)
+        self._user_pending[user_key] -= 1
+        if not self._user_pending[user_key]:
+            # Neither do idle users, apart from their token bucket
+            del self._user_pending[user_key]
+            self._slots.pop(user_key, None)
+
+    def busy(self, conversation_key: str) -> bool:
+        """True while a reply is being generated (or queued) for the conversation."""
+        return self._pending.get(conversation_key, 0) > 0
+
+    def _take_token(self, user_key: str) -> float:
+        limits: Dict[str, Any] = config.get_config().get('rate_limit') or {}
+        per_minute = limits.get('per_minute') or 0
+        if per_minute <= 0:
+            return 0.0
+        bucket = self._buckets.get(user_key)
+        if bucket is None:
+            bucket = self._buckets[user_key] = TokenBucket(per_minute / 60, max(1, limits.get('burst', 1)))
+            while len(self._buckets) > MAX_TRACKED_USERS:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(user_key)
+        return bucket.take()
+
+    def admit(self, conversation_key: str, user_key: str, prompt: str) -> Ticket:
+        """Check the limits for a new generation, raising AdmissionError if it is refused."""
+        cfg = config.get_config()
+        max_chars = cfg.get('max_prompt_chars') or 0
+        if max_chars and len(prompt) > max_chars:
+            raise AdmissionError(f"Message is too long ({len(prompt)} characters, limit {max_chars})", 413)
+        queue_depth = cfg.get('queue_depth', 0)
+        if self._pending.get(conversation_key, 0) > queue_depth:
+            raise AdmissionError("A reply is already being generated for this conversation", 409)
+        retry_after = self._take_token(user_key)
+        if retry_after:
+            raise AdmissionError(f"Too many messages, try again in {math.ceil(retry_after)} s", 429, retry_after)
+        self._pending[conversation_key] = self._pending.get(conversation_key, 0) + 1
+        self._user_pending[user_key] = self._user_pending.get(user_key, 0) + 1
+        return Ticket(self, conversation_key, user_key)
+
+def generation_options() -> Optional[Dict[str, Any]]:
+    """Ollama options enforcing the output limit of chat replies, if one is set."""
+    max_tokens = config.get_config().get('max_output_tokens') or 0
+    return {'num_predict': max_tokens} if max_tokens > 0 else None
+
+# Shared controller for the process
+controller = AdmissionController()
@@ -0,0 +1,148 @@
+"""
+Headless chat API for programmatic clients, mounted on the NiceGUI/FastAPI app.
+
+    POST /api/conversations                      create a conversation
+    GET  /api/conversations                      list conversations
+    GET  /api/conversations/{id}                 get one conversation
+    POST /api/conversations/{id}/messages        send a message, reply streams as SSE
+
+Replies stream as Server-Sent Events: `token` events carry {"text": ...},
+followed by a final `done` event (or `error`). Generation and storage go
+through the same `llm`, `conversations` and `db` code as the chat page.
+Set API_TOKEN in .env to require `Authorization: Bearer <token>`.
+"""
+import asyncio
+import json
+import math
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from nicegui import app
+from pydantic import BaseModel
+
+from . import admission
+from . import compression
+from . import config
+from . import conversations
+from . import db
+from . import llm
+from . import memory
+from . import residency
+from .admin import client_identity, require_api_token
+
+logger = logging.getLogger(__name__)
+
+# Keeps fire-and-forget summary tasks referenced until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+class CreateConversation(BaseModel):
+    title: str = 'New Conversation'
+
+class SendMessage(BaseModel):
+    content: str
+    model: Optional[str] = None
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _summary(conversation_id: str, conversation: Dict[str, Any]) -> Dict[str, Any]:
+    # Listings leave archived messages out, so their count is unknown until the conversation is opened
+    archived = bool(conversation.get('archived'))
+    return {
+        'id': conversation_id,
+        'summary': conversation.get('summary', ''),
+        'message_count': None if archived else conversation.get('fork_point', 0) + len(compression.messages_of(conversation)),
+        'archived': archived,
+        'parent': conversation.get('parent'),
+        'updated_at': conversation.get('updated_at'),
+    }
+
+@app.post('/api/conversations', dependencies=[Depends(require_api_token)])
+async def create_conversation(body: CreateConversation) -> Dict[str, Any]:
+    conversation_id = conversations.new_conversation_id(body.title.strip() or 'New Conversation')
+    if not await db.run_async(db.save_conversation, conversation_id, {'messages': [], 'summary': ''}):
+        raise HTTPException(status_code=503, detail='Storage unavailable')
+    return {'id': conversation_id}
+
+@app.get('/api/conversations', dependencies=[Depends(require_api_token)])
+async def list_conversations(limit: int = 100) -> List[Dict[str, Any]]:
+    stored = await db.run_async(db.get_all_conversations)
+    return [_summary(cid, conversation) for cid, conversation in list(stored.items())[:limit]]
+
+@app.get('/api/conversations/{conversation_id}', dependencies=[Depends(require_api_token)])
+async def get_conversation(conversation_id: str) -> Dict[str, Any]:
+    conversation = await db.run_async(db.get_conversation, conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail='Conversation not found')
+    # Branches store only their own messages; include the prefix shared with the parent
+    messages = await db.run_async(conversations.resolve_messages, db.get_conversation, conversation_id)
+    return {'id': conversation_id, **conversation, 'messages': messages}
+
+@app.post('/api/conversations/{conversation_id}/messages', dependencies=[Depends(require_api_token)])
+async def send_message(conversation_id: str, body: SendMessage, request: Request) -> StreamingResponse:
+    conversation = await db.run_async(db.get_conversation, conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail='Conversation not found')
+    try:
+        ticket = admission.controller.admit(f"conversation:{conversation_id}", client_identity(request), body.content)
+    except admission.AdmissionError as e:
+        headers = {'Retry-After': str(math.ceil(e.retry_after))} if e.retry_after else None
+        raise HTTPException(status_code=e.status, detail=str(e), headers=headers)
+    # Queued requests wait here, before the response starts
+    await ticket.acquire()
+    model_name = body.model or config.get_default_model() or ''
+    bot_name = config.get_config().get('bot_name', 'Bot')
+    # The conversation's own summary plus related past conversations (see app/memory.py).
+    # Like the chat page, other branches of the same conversation are not recalled.
+    stored = await db.run_async(db.get_all_conversations)
+    own_tree = conversations.tree_members(stored, conversation_id) if conversation_id in stored else [conversation_id]
+    system_prompt = conversations.system_prompt_from_summary(
+        await memory.recall(body.content, conversation.get('summary', ''), exclude=own_tree))
+
+    async def stream() -> AsyncIterator[str]:
+        reply = ''
+        final: Dict[str, Any] = {}
+        reasoning: List[str] = []
+        try:
+            try:
+                async for chunk in llm.generate_ollama_response(
+                    f"api:{conversation_id}", body.content, model_name, system_prompt,
+                    keep_alive=residency.manager.keep_alive_for('chat'),
+                    on_done=final.update,
+                    options=admission.generation_options(),
+                    on_thinking=reasoning.append,
+                ):
+                    if chunk:
+                        reply += chunk
+                        yield _sse('token', {'text': chunk})
+            except Exception as e:
+                logger.error(f"API generation failed for {conversation_id}: {e}")
+                yield _sse('error', {'detail': str(e)})
+                return
+            # Token counts, timings and reasoning are stored with the reply, as on the chat page
+            meta = llm.generation_stats(model_name, final) if final else {}
+            if reasoning and config.get_config().get('store_reasoning', True):
+                meta['reasoning'] = ''.join(reasoning)
+            bot_message = (bot_name, reply, meta) if meta else (bot_name, reply)
+            new_messages = [('You', body.content), bot_message]
+            await db.run_async(db.append_messages, conversation_id, new_messages)
+        finally:
+            ticket.release()
+        yield _sse('done', {'conversation_id': conversation_id, 'model': model_name})
+        # Refresh the summary after the stream has closed, like the chat page's auto-save
+        messages = await db.run_async(conversations.resolve_messages, db.get_conversation, conversation_id)
+        task = asyncio.create_task(_update_summary(conversation_id, messages))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    # The background task frees the ticket if the client disconnects before the stream starts
+    return StreamingResponse(stream(), media_type='text/event-stream', background=BackgroundTask(ticket.release),
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def _update_summary(conversation_id: str, messages: List[Any]) -> None:
+    summary = await conversations.summarize_conversation(messages)
+    await db.run_async(db.save_conversation, conversation_id, {'summary': summary})
+    await memory.index.update(conversation_id, summary)
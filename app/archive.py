@@ -0,0 +1,94 @@
+"""
+Cold storage for idle conversations.
+
+Conversations not updated for ARCHIVE_AFTER_DAYS days have their messages
+packed into a single compressed `archive` field (see app/compression.py), which
+drops their per-message rows and keeps them out of search. Opening one
+restores it transparently. Set ARCHIVE_AFTER_DAYS=0 (the default) to disable.
+
+Run a single pass by hand with `python -m app.archive`.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from . import compression
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '100'))
+
+class Archiver:
+    """Periodically moves idle conversations to the archive tier."""
+
+    def __init__(self, after_days: float = ARCHIVE_AFTER_DAYS):
+        self.after_days = after_days
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    def archive_idle(self, now: Optional[float] = None) -> int:
+        """Archive one batch of idle conversations (blocking); returns how many were archived."""
+        store = db.get_store()
+        cutoff = (now or time.time()) - self.after_days * 86400
+        archived = 0
+        for conversation_id in store.idle_conversations(cutoff, ARCHIVE_BATCH_SIZE):
+            conversation = store.get_conversation(conversation_id)
+            if not conversation or not conversation.get('messages'):
+                continue
+            archive = compression.pack_archive(compression.messages_of(conversation))
+            # Conversations touched since they were read are left alone
+            if store.archive_conversation(conversation_id, archive, conversation['updated_at']):
+                archived += 1
+        if archived:
+            logger.info(f"Archived {archived} idle conversations")
+        return archived
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await db.run_async(self.archive_idle)
+            except Exception as e:
+                logger.error(f"Archiving idle conversations failed: {e}")
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        """Start archiving in the background, if enabled."""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Shared archiver instance for the process
+archiver = Archiver()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if not archiver.enabled:
+        raise SystemExit("Set ARCHIVE_AFTER_DAYS to a positive number of days")
+    total = 0
+    while True:
+        count = archiver.archive_idle()
+        total += count
+        if count < ARCHIVE_BATCH_SIZE:
+            break
+    print(f"Archived {total} conversations")
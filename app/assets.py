@@ -0,0 +1,179 @@
+"""
+Self-hosted static assets: page CSS/JS, bundled fonts and generated avatars.
+Nothing the chat UI renders should need a request to an external host, so the
+app keeps working in air-gapped deployments.
+
+Page stylesheets and scripts under app/static/css and app/static/js are served
+at content-hashed URLs (e.g. /static/css/chat.3f2a9c1b.css), pre-compressed and
+marked immutable, so repeat visits load them from the browser cache. The hashes
+are computed once per process; restart after editing those files.
+
+Fonts are bundled once with `python -m app.assets fetch-fonts` on a machine
+with internet access; without them the UI falls back to system fonts.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, NamedTuple, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from nicegui import app
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).parent / 'static'
+FONTS_DIR = STATIC_DIR / 'fonts'
+FONTS_CSS = FONTS_DIR / 'fonts.css'
+ASSETS_URL = '/assets'
+HASHED_URL = '/static'
+# Directories whose files are served under content-hashed names
+HASHED_DIRS = ('css', 'js')
+
+# Fonts referenced by the UI stylesheets
+FONT_FAMILIES_URL = (
+    'https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700'
+    '&family=Fira+Code:wght@400;500;600&display=swap'
+)
+
+# Generated avatars and content-hashed files never change, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Fonts are named by version by Google Fonts, so a long cache is safe
+FONT_CACHE_AGE = 30 * 24 * 3600
+
+# Palettes per avatar variant: (foreground saturation/lightness, background)
+_AVATAR_STYLES = {
+    'user': ('70%, 65%', '#312e81'),
+    'bot': ('75%, 55%', '#164e63'),
+}
+
+app.add_static_files(ASSETS_URL, STATIC_DIR, max_cache_age=FONT_CACHE_AGE)
+
+class HashedAsset(NamedTuple):
+    path: str # Path relative to STATIC_DIR, e.g. css/chat.css
+    url: str
+    content: bytes
+    gzipped: bytes
+    media_type: str
+    etag: str
+
+@lru_cache(maxsize=None)
+def _hashed_assets() -> Dict[str, HashedAsset]:
+    """Index the hashed asset directories by URL name, e.g. css/chat.3f2a9c1b.css."""
+    assets = {}
+    for directory in HASHED_DIRS:
+        for file in sorted((STATIC_DIR / directory).glob('*')):
+            if not file.is_file():
+                continue
+            content = file.read_bytes()
+            digest = hashlib.sha256(content).hexdigest()[:10]
+            name = f'{directory}/{file.stem}.{digest}{file.suffix}'
+            media_type = mimetypes.guess_type(file.name)[0] or 'application/octet-stream'
+            assets[name] = HashedAsset(
+                path=f'{directory}/{file.name}',
+                url=f'{HASHED_URL}/{name}',
+                content=content,
+                gzipped=gzip.compress(content, compresslevel=9),
+                media_type=f'{media_type}; charset=utf-8' if media_type.startswith('text/') else media_type,
+                etag=f'"{digest}"',
+            )
+    return assets
+
+def asset_url(path: str) -> str:
+    """Return the content-hashed URL of a file under app/static/css or app/static/js."""
+    for asset in _hashed_assets().values():
+        if asset.path == path:
+            return asset.url
+    raise FileNotFoundError(f'No static asset {path}')
+
+def link_tags(*paths: str) -> str:
+    """Return <link>/<script> tags referencing the given hashed assets."""
+    tags = []
+    for path in paths:
+        url = asset_url(path)
+        if path.endswith('.js'):
+            tags.append(f'<script src="{url}" defer></script>')
+        else:
+            tags.append(f'<link rel="stylesheet" href="{url}">')
+    return '\n'.join(tags)
+
+@app.get(HASHED_URL + '/{name:path}', include_in_schema=False)
+def hashed_asset(name: str, request: Request) -> Response:
+    asset = _hashed_assets().get(name)
+    if asset is None:
+        return Response(status_code=404)
+    headers = {'Cache-Control': IMMUTABLE_CACHE_CONTROL, 'ETag': asset.etag, 'Vary': 'Accept-Encoding'}
+    if request.headers.get('if-none-match') == asset.etag:
+        return Response(status_code=304, headers=headers)
+    if 'gzip' in request.headers.get('accept-encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return Response(asset.gzipped, media_type=asset.media_type, headers=headers)
+    return Response(asset.content, media_type=asset.media_type, headers=headers)
+
+def head_html() -> str:
+    """Return the <head> markup for bundled assets, empty if none are bundled."""
+    if FONTS_CSS.exists():
+        return f'<link rel="stylesheet" href="{ASSETS_URL}/fonts/fonts.css">'
+    return ''
+
+def avatar_url(seed: str, variant: str = 'bot') -> str:
+    """URL of the locally generated avatar for a name."""
+    return f'/avatars/{variant}.svg?seed={quote(seed, safe="")}'
+
+@lru_cache(maxsize=256)
+def render_avatar(seed: str, variant: str = 'bot') -> Tuple[bytes, str]:
+    """Render a symmetric 5x5 identicon as SVG; returns (svg bytes, ETag)."""
+    saturation_lightness, background = _AVATAR_STYLES.get(variant, _AVATAR_STYLES['bot'])
+    digest = hashlib.sha256(f'{variant}:{seed}'.encode()).digest()
+    hue = digest[0] * 360 // 256
+    cells = []
+    for row in range(5):
+        for col in range(3):
+            if digest[1 + row * 3 + col] & 1:
+                cells.append((col, row))
+                if col < 2:
+                    cells.append((4 - col, row)) # Mirror for a face-like symmetric shape
+    rects = ''.join(f'<rect x="{10 + x * 16}" y="{10 + y * 16}" width="16" height="16"/>' for x, y in cells)
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">'
+        f'<rect width="100" height="100" fill="{background}"/>'
+        f'<g fill="hsl({hue}, {saturation_lightness})">{rects}</g></svg>'
+    ).encode()
+    return svg, f'"{hashlib.sha1(svg).hexdigest()[:16]}"'
+
+@app.get('/avatars/{variant}.svg', include_in_schema=False)
+def avatar(variant: str, request: Request, seed: str = '') -> Response:
+    svg, etag = render_avatar(seed, variant)
+    headers = {'Cache-Control': IMMUTABLE_CACHE_CONTROL, 'ETag': etag}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(svg, media_type='image/svg+xml', headers=headers)
+
+def fetch_fonts() -> None:
+    """Download the UI fonts into app/static/fonts and write a local fonts.css."""
+    import httpx
+    FONTS_DIR.mkdir(parents=True, exist_ok=True)
+    # A modern user agent makes Google Fonts serve woff2
+    headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/124.0 Safari/537.36'}
+    with httpx.Client(headers=headers, timeout=30, follow_redirects=True) as client:
+        css = client.get(FONT_FAMILIES_URL).raise_for_status().text
+        for url in sorted(set(re.findall(r'url\((https://[^)]+)\)', css))):
+            name = url.rsplit('/', 1)[-1]
+            (FONTS_DIR / name).write_bytes(client.get(url).raise_for_status().content)
+            css = css.replace(url, name)
+            logger.info(f"Bundled font {name}")
+    FONTS_CSS.write_text(css)
+    logger.info(f"Wrote {FONTS_CSS}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ['fetch-fonts']:
+        fetch_fonts()
+    else:
+        print('usage: python -m app.assets fetch-fonts')
+        sys.exit(2)
@@ -0,0 +1,191 @@
+"""
+Headless batch processing of prompts through Ollama.
+
+Reads prompts from a JSONL file as a stream, runs them with bounded
+concurrency per model and appends one result line per prompt to the output
+file as soon as it finishes. The output file doubles as the checkpoint: a
+rerun skips prompts that already have a successful result and retries the
+ones that failed.
+
+    python -m app.batch prompts.jsonl results.jsonl --concurrency 2
+
+Input lines look like {"id": "q1", "prompt": "...", "model": "...", "system": "..."};
+only the prompt is required. Use --prompt-field/--id-field for other layouts.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import config
+from . import llm
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BatchStats:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    output_chars: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at
+        processed = self.succeeded + self.failed
+        return {
+            'total': self.total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'elapsed_s': round(elapsed, 2),
+            'prompts_per_s': round(processed / elapsed, 3) if elapsed else 0.0,
+            'chars_per_s': round(self.output_chars / elapsed, 1) if elapsed else 0.0,
+        }
+
+def completed_ids(output_path: Path) -> Set[str]:
+    """Return ids with a successful result in an existing output file."""
+    done: Set[str] = set()
+    if not output_path.exists():
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A line cut short by a crash
+            if not result.get('error'):
+                done.add(str(result.get('id')))
+    return done
+
+def iter_prompts(input_path: Path, prompt_field: str, id_field: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (id, record) for each prompt line without reading the whole file."""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed line {line_number}: {e}")
+                continue
+            if not record.get(prompt_field):
+                logger.warning(f"Skipping line {line_number}: no '{prompt_field}' field")
+                continue
+            yield str(record.get(id_field, line_number)), record
+
+async def run_batch(
+    input_path: Path,
+    output_path: Path,
+    model_name: Optional[str] = None,
+    concurrency: int = 2,
+    system_prompt: Optional[str] = None,
+    prompt_field: str = 'prompt',
+    id_field: str = 'id',
+) -> BatchStats:
+    """Run every prompt in input_path and append results to output_path."""
+    stats = BatchStats()
+    done = completed_ids(output_path)
+    default_model = model_name or config.get_default_model() or ''
+    semaphores: Dict[str, asyncio.Semaphore] = {}
+    # Enough workers to keep every model's slots busy; the queue bounds read-ahead
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+
+    # Make sure a result from a crashed run doesn't share a line with the next one
+    if output_path.exists() and output_path.stat().st_size:
+        with open(output_path, 'rb') as f:
+            f.seek(-1, 2)
+            needs_newline = f.read(1) != b'\n'
+    else:
+        needs_newline = False
+    output = open(output_path, 'a', encoding='utf-8')
+    if needs_newline:
+        output.write('\n')
+
+    async def process(prompt_id: str, record: Dict[str, Any]) -> None:
+        model = record.get('model') or default_model
+        semaphore = semaphores.setdefault(model, asyncio.Semaphore(concurrency))
+        async with semaphore:
+            start = time.monotonic()
+            response = ''
+            error = None
+            try:
+                async for chunk in llm.generate_ollama_response(
+                    client_id=f"batch:{prompt_id}",
+                    user_input=record[prompt_field],
+                    model_name=model,
+                    system_prompt=record.get('system', system_prompt),
+                ):
+                    response += chunk
+                if llm.is_error_reply(response):
+                    error = response.strip()
+            except Exception as e:
+                error = str(e)
+        result = {'id': prompt_id, 'model': model, 'response': response, 'error': error,
+                  'elapsed_s': round(time.monotonic() - start, 3)}
+        output.write(json.dumps(result, ensure_ascii=False) + '\n')
+        output.flush()
+        if error:
+            stats.failed += 1
+            logger.warning(f"Prompt {prompt_id} failed: {error}")
+        else:
+            stats.succeeded += 1
+            stats.output_chars += len(response)
+
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await process(*item)
+            finally:
+                queue.task_done()
+
+    workers: List[asyncio.Task] = [asyncio.create_task(worker()) for _ in range(concurrency * 4)]
+    try:
+        for prompt_id, record in iter_prompts(input_path, prompt_field, id_field):
+            stats.total += 1
+            if prompt_id in done:
+                stats.skipped += 1
+                continue
+            await queue.put((prompt_id, record))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        output.close()
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m app.batch', description='Run a JSONL file of prompts through Ollama.')
+    parser.add_argument('input', type=Path, help='JSONL file with one prompt per line')
+    parser.add_argument('output', type=Path, help='JSONL file results are appended to (also the resume checkpoint)')
+    parser.add_argument('--model', help='model for lines without a "model" field (default: configured default model)')
+    parser.add_argument('--concurrency', type=int, default=2, help='concurrent generations per model')
+    parser.add_argument('--system', help='system prompt for lines without a "system" field')
+    parser.add_argument('--prompt-field', default='prompt')
+    parser.add_argument('--id-field', default='id')
+    args = parser.parse_args(argv)
+
+    config.load_config()
+    stats = asyncio.run(run_batch(
+        args.input, args.output, args.model, max(1, args.concurrency),
+        args.system, args.prompt_field, args.id_field,
+    ))
+    summary = stats.summary()
+    logger.info(f"Batch finished: {summary}")
+    print(json.dumps(summary))
+    return 1 if stats.failed else 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
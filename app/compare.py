@@ -0,0 +1,90 @@
+"""
+Side-by-side model comparison: one prompt fanned out to several models at once.
+
+All streams run concurrently, up to `compare_max_parallel` at a time, so a
+comparison takes about as long as its slowest model. Requests go through the
+normal backend router, which spreads them across the configured Ollama hosts.
+Each stream records its time to first token and its generation speed.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from . import config
+from . import llm
+from . import residency
+
+@dataclass
+class CompareStream:
+    """The reply of one model in a comparison, updated as it streams."""
+    model: str
+    text: str = ''
+    queued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: int = 0
+    final: Dict[str, Any] = field(default_factory=dict) # Ollama's final chunk
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Seconds from sending the request to the first token."""
+        return self.first_token_at - self.started_at if self.first_token_at and self.started_at else None
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        """Ollama's eval rate once finished; estimated from streamed chunks until then."""
+        if self.final.get('eval_count') and self.final.get('eval_duration'):
+            return self.final['eval_count'] / (self.final['eval_duration'] / 1e9)
+        if self.first_token_at and self.chunks > 1:
+            elapsed = (self.finished_at or time.monotonic()) - self.first_token_at
+            return (self.chunks - 1) / elapsed if elapsed > 0 else None
+        return None
+
+async def _run(stream: CompareStream, prompt: str, system_prompt: Optional[str],
+               semaphore: asyncio.Semaphore, on_update: Callable[[CompareStream], None],
+               options: Optional[Dict[str, Any]]) -> None:
+    async with semaphore:
+        stream.started_at = time.monotonic()
+        on_update(stream)
+        try:
+            async for chunk in llm.generate_ollama_response(
+                f"compare:{stream.model}", prompt, stream.model, system_prompt,
+                keep_alive=residency.manager.keep_alive_for('chat'),
+                on_done=stream.final.update,
+                options=options,
+            ):
+                if not chunk:
+                    continue
+                if stream.first_token_at is None:
+                    stream.first_token_at = time.monotonic()
+                stream.chunks += 1
+                stream.text += chunk
+                on_update(stream)
+            if llm.is_error_reply(stream.text):
+                stream.error = stream.text.strip()
+        except Exception as e:
+            stream.error = str(e)
+        finally:
+            stream.finished_at = time.monotonic()
+            on_update(stream)
+
+async def compare(
+    prompt: str,
+    models: Sequence[str],
+    on_update: Callable[[CompareStream], None] = lambda stream: None,
+    system_prompt: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[CompareStream]:
+    """Stream `prompt` from every model concurrently; on_update is called after every change."""
+    limit = max(1, int(config.get_config().get('compare_max_parallel') or 1))
+    semaphore = asyncio.Semaphore(limit)
+    streams = [CompareStream(model) for model in dict.fromkeys(models)]
+    await asyncio.gather(*(_run(stream, prompt, system_prompt, semaphore, on_update, options) for stream in streams))
+    return streams
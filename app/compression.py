@@ -0,0 +1,100 @@
+"""
+Compression of stored message bodies and packing of archived conversations.
+
+MESSAGE_COMPRESSION=zlib (or zstd, with the optional `zstandard` package)
+compresses message bodies longer than MESSAGE_COMPRESSION_MIN_BYTES when they
+are written. They are stored as bytes tagged with their codec and only
+decompressed when a conversation is opened. Compressed bodies are not matched
+by search.
+
+Archived conversations (see app/archive.py) keep their messages as a single
+compressed, base64-encoded `archive` field, which works in every backend.
+"""
+import base64
+import json
+import logging
+import os
+import zlib
+from typing import Any, Dict, List, Sequence
+
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError: # Optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+COMPRESSION = os.getenv('MESSAGE_COMPRESSION', 'none').lower()
+MIN_BYTES = int(os.getenv('MESSAGE_COMPRESSION_MIN_BYTES', '2048'))
+
+# First byte of a compressed value names its codec
+_ZLIB = b'z'
+_ZSTD = b's'
+
+if COMPRESSION == 'zstd' and zstandard is None:
+    logger.warning("MESSAGE_COMPRESSION=zstd needs the zstandard package, using zlib")
+
+def _codec() -> bytes:
+    return _ZSTD if COMPRESSION == 'zstd' and zstandard is not None else _ZLIB
+
+def compress_bytes(data: bytes) -> bytes:
+    if _codec() == _ZSTD:
+        return _ZSTD + zstandard.ZstdCompressor(level=6).compress(data)
+    return _ZLIB + zlib.compress(data, 6)
+
+def decompress_bytes(value: bytes) -> bytes:
+    if value[:1] == _ZSTD:
+        return zstandard.ZstdDecompressor().decompress(value[1:])
+    return zlib.decompress(value[1:])
+
+def compress_text(text: Any) -> Any:
+    """Compress a message body if compression is enabled and it is large enough."""
+    if COMPRESSION in ('zlib', 'zstd') and isinstance(text, str):
+        data = text.encode()
+        if len(data) >= MIN_BYTES:
+            packed = compress_bytes(data)
+            # Incompressible bodies stay plain
+            if len(packed) < len(data):
+                return packed
+    return text
+
+def decompress_text(value: Any) -> Any:
+    return decompress_bytes(bytes(value)).decode() if isinstance(value, (bytes, bytearray)) else value
+
+def compress_messages(messages: Sequence[Sequence[Any]]) -> List[Any]:
+    """Compress the bodies of (sender, content, ...) messages for storage."""
+    if COMPRESSION not in ('zlib', 'zstd'):
+        return list(messages)
+    return [(message[0], compress_text(message[1]), *message[2:]) for message in messages]
+
+def expand_messages(messages: Sequence[Sequence[Any]]) -> List[Any]:
+    return [(message[0], decompress_text(message[1]), *message[2:])
+            if isinstance(message[1], (bytes, bytearray)) else message for message in messages]
+
+def pack_archive(messages: Sequence[Sequence[Any]]) -> str:
+    """Pack plain messages into the text stored in an archived conversation."""
+    data = json.dumps([list(message) for message in messages], ensure_ascii=False).encode()
+    return base64.b64encode(compress_bytes(data)).decode('ascii')
+
+def unpack_archive(archive: str) -> List[tuple]:
+    return [tuple(message) for message in json.loads(decompress_bytes(base64.b64decode(archive)))]
+
+def messages_of(conversation: Dict[str, Any]) -> List[Any]:
+    """Return a stored conversation's plain messages, unpacking them on first use.
+
+    The conversation dict is updated in place, so later calls are free.
+    """
+    messages = conversation.get('messages') or []
+    if conversation.get('archive'):
+        # Messages appended after archiving come after the archived ones
+        messages = unpack_archive(conversation.pop('archive')) + expand_messages(messages)
+        conversation['messages'] = messages
+    elif any(isinstance(message[1], (bytes, bytearray)) for message in messages):
+        messages = expand_messages(messages)
+        conversation['messages'] = messages
+    return messages
@@ -19,7 +19,28 @@ DEFAULT_CONFIG = {
     "default_model": None, # Will be populated by available models if None
     "source_urls": [],
     "theme_dark_mode": False,
-    "available_models_cache": [] # Cache for available models
+    "available_models_cache": [], # Cache for available models
+    "preload_models": [], # Models loaded at startup; defaults to default_model when empty
+    "keep_alive": {"chat": "30m", "background": "5m"}, # Ollama keep_alive per model class
+    "residency_poll_interval": 30, # Seconds between /api/ps polls
+    "persist_rendered_html": False, # Store rendered message HTML alongside saved conversations
+    "llm_titles": False, # Replace the local keyphrase title with an LLM-generated one in the background
+    "max_prompt_chars": 16000, # Longer chat messages are refused (0 = no limit)
+    "max_output_tokens": 0, # Cap on chat reply length in tokens (0 = model default)
+    "rate_limit": {"per_minute": 20, "burst": 5}, # Messages per user (token bucket); per_minute 0 = off
+    "queue_depth": 1, # Messages that may wait behind a reply in progress, per conversation
+    "max_generations_per_user": 2, # Replies a user can have in progress at once
+    "compare_max_parallel": 4, # Models streamed at the same time in compare mode
+    "embedding_model": None, # Ollama embedding model for recalling related conversations (None = off)
+    "memory_top_k": 3, # Related conversation summaries recalled per message at most
+    "memory_min_score": 0.3, # Minimum cosine similarity of a recalled summary
+    "memory_token_budget": 600, # Approximate tokens of summaries added to the system prompt
+    "store_reasoning": True, # Keep the <think> reasoning of thinking models with their replies (False = drop it)
+    # Settings per background call type: model, num_predict, num_ctx, temperature, stop, keep_alive, stream
+    "generation_profiles": {
+        "title": {"num_predict": 24, "temperature": 0.2},
+        "summary": {"num_predict": 200, "temperature": 0.2}
+    }
 }
 
 # In-memory storage for the current configuration
@@ -95,3 +116,11 @@ def get_default_model() -> Optional[str]:
 def set_default_model(model_name: Optional[str]) -> None:
     # \"\"\"Sets the default model.\"\"\"
     update_config_value("default_model", model_name)
+
+def get_ollama_base_urls() -> List[str]:
+    # \"\"\"Returns the Ollama backend pool; accepts a single URL, a comma-separated string or a list.\"\"\"
+    value = get_config().get("ollama_base_url") or DEFAULT_CONFIG["ollama_base_url"]
+    if isinstance(value, str):
+        value = value.split(',')
+    urls = [str(url).strip().rstrip('/') for url in value if str(url).strip()]
+    return urls or [DEFAULT_CONFIG["ollama_base_url"]]
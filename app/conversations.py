@@ -0,0 +1,287 @@
+"""
+Conversation logic shared by the chat UI and the HTTP API: titles, summaries,
+system prompts, persistence and branching. Nothing here depends on NiceGUI.
+
+Branches share storage with the conversation they were forked from. A fork
+stores `parent` (the conversation holding the shared prefix), `fork_point` (the
+number of messages taken from it) and only the messages added afterwards, so
+editing or regenerating a message never copies the history before it.
+"""
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from . import compression
+from . import config
+from . import db
+from . import llm
+from . import memory
+from . import residency
+from . import titles
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Where a message is stored: (id of the conversation holding it, offset in its own messages).
+# Branches that share a message share its cell.
+Cell = Tuple[str, int]
+# Returns the stored conversation for an id, or None
+Lookup = Callable[[str], Optional[Dict[str, Any]]]
+
+# Ollama context tokens after the message in a cell, per model (see remember_context)
+CONTEXT_CACHE_SIZE = 256
+_context_cache: 'OrderedDict[Tuple[str, Cell], List[int]]' = OrderedDict()
+
+# Keeps fire-and-forget title upgrades and memory updates referenced until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+def new_conversation_id(title: str) -> str:
+    """Build a storage key: a timestamp prefix (for ordering and uniqueness) plus the title."""
+    # Microseconds keep ids unique when a conversation is forked several times in a second
+    prefix = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    return f"{prefix}_{title}"
+
+def conversation_title(conversation_id: str) -> str:
+    """The human title part of a storage key."""
+    return conversation_id.split('_', 1)[1] if '_' in conversation_id else conversation_id
+
+def display_title(lookup: Lookup, conversation_id: str) -> str:
+    """The title to show: an upgraded `title` stored on the conversation or its ancestors, else the key's."""
+    for _, conversation in reversed(_chain(lookup, conversation_id)):
+        if conversation.get('title'):
+            return conversation['title']
+    return conversation_title(conversation_id)
+
+def system_prompt_from_summary(summary: Optional[str]) -> Optional[str]:
+    """Turn a stored summary into the system prompt; None selects llm's default prompt."""
+    return summary + '\n\n' if summary else None
+
+async def save_conversation(
+    messages: List[Tuple[str, str]],
+    conversation_id: Optional[str] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    parent: Optional[str] = None,
+    fork_point: int = 0,
+    on_title: Optional[Callable[[str, str], None]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Summarize and persist a conversation, generating its id from a title on first save.
+
+    `messages` is the full message list; for a branch (`parent` set) only the
+    messages after `fork_point` are stored. New conversations are titled locally;
+    with `llm_titles` enabled an LLM title replaces it in the background and
+    `on_title(conversation_id, title)` is called once it is stored.
+    """
+    upgrade_title = False
+    if not conversation_id:
+        conversation_id = new_conversation_id(titles.title_from_messages(messages))
+        upgrade_title = config.get_config().get('llm_titles', False)
+    with tracing.span('conversation.summarize', messages=len(messages)):
+        summary = await summarize_conversation(messages)
+    conversation = {'messages': messages[fork_point:] if parent else messages, 'summary': summary, **(extra or {})}
+    if parent:
+        conversation.update(parent=parent, fork_point=fork_point)
+    await db.run_async(db.save_conversation, conversation_id, conversation)
+    _spawn(memory.index.update(conversation_id, summary))
+    if upgrade_title:
+        # Opened here so the request's trace stays open until the upgrade ends
+        span = tracing.start_span('conversation.upgrade_title')
+        _spawn(_upgrade_title(conversation_id, conversation, list(messages), on_title, span))
+    return conversation_id, conversation
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _upgrade_title(conversation_id: str, conversation: Dict[str, Any], messages: List[Tuple[str, str]],
+                         on_title: Optional[Callable[[str, str], None]], span: tracing.Span) -> None:
+    try:
+        title = await generate_llm_title(messages)
+        if not title:
+            return # Keep the local title
+        # The storage key keeps the local title; the upgraded one is stored next to the messages
+        await db.run_async(db.save_conversation, conversation_id, {'title': title})
+        conversation['title'] = title
+        if on_title:
+            on_title(conversation_id, title)
+    finally:
+        span.end()
+
+def _chain(lookup: Lookup, conversation_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Return a conversation and its ancestors as (id, conversation), root first."""
+    chain = []
+    seen = set()
+    while conversation_id and conversation_id not in seen:
+        seen.add(conversation_id)
+        conversation = lookup(conversation_id) or {}
+        chain.append((conversation_id, conversation))
+        conversation_id = conversation.get('parent')
+    chain.reverse()
+    return chain
+
+def resolve_messages(lookup: Lookup, conversation_id: str) -> List[Any]:
+    """Return the full message list of a conversation, including the prefix shared with its parent."""
+    messages: List[Any] = []
+    for _, conversation in _chain(lookup, conversation_id):
+        messages = messages[:conversation.get('fork_point', 0)] + list(compression.messages_of(conversation))
+    return messages
+
+def message_cells(lookup: Lookup, conversation_id: str) -> List[Cell]:
+    """Return the cell of each message in a conversation's full message list."""
+    cells: List[Cell] = []
+    for owner, conversation in _chain(lookup, conversation_id):
+        own = [(owner, offset) for offset in range(len(compression.messages_of(conversation)))]
+        cells = cells[:conversation.get('fork_point', 0)] + own
+    return cells
+
+def message_cell(lookup: Lookup, conversation_id: str, index: int) -> Cell:
+    """The cell of message `index` in a conversation, including messages not saved yet."""
+    conversation = lookup(conversation_id) or {}
+    fork_point = conversation.get('fork_point', 0)
+    if conversation.get('parent') and index < fork_point:
+        parent_cells = message_cells(lookup, conversation['parent'])
+        if index < len(parent_cells):
+            return parent_cells[index]
+    return conversation_id, index - fork_point
+
+def fork(lookup: Lookup, conversation_id: str, index: int) -> Tuple[str, Dict[str, Any]]:
+    """Create (but don't save) a branch sharing the first `index` messages of a conversation.
+
+    The branch points at the conversation that actually stores message index - 1,
+    which keeps chains short when branches are forked again.
+    """
+    cells = message_cells(lookup, conversation_id)
+    parent = cells[index - 1][0] if 0 < index <= len(cells) else conversation_id
+    branch_id = new_conversation_id(conversation_title(conversation_id))
+    return branch_id, {'messages': [], 'summary': '', 'parent': parent, 'fork_point': index}
+
+def tree_members(conversations_by_id: Dict[str, Dict[str, Any]], conversation_id: str) -> List[str]:
+    """Return the ids of every branch in the tree a conversation belongs to, root first."""
+    root = _chain(conversations_by_id.get, conversation_id)[0][0]
+    children = defaultdict(list)
+    for cid, conversation in conversations_by_id.items():
+        if conversation.get('parent'):
+            children[conversation['parent']].append(cid)
+    members, stack = [], [root]
+    while stack:
+        cid = stack.pop()
+        members.append(cid)
+        stack.extend(children.get(cid, []))
+    return members
+
+def is_root(conversations_by_id: Dict[str, Dict[str, Any]], conversation_id: str) -> bool:
+    """True unless the conversation is a branch of another stored conversation."""
+    return conversations_by_id.get(conversation_id, {}).get('parent') not in conversations_by_id
+
+def latest_branch(conversations_by_id: Dict[str, Dict[str, Any]], conversation_id: str) -> str:
+    """The most recently created branch in a conversation's tree."""
+    return max(tree_members(conversations_by_id, conversation_id))
+
+async def load_archived(conversations_by_id: Dict[str, Dict[str, Any]], conversation_id: str) -> None:
+    """Replace the archived conversations in a conversation's tree with their full messages.
+
+    Listed conversations leave archived messages out (see db.get_all_conversations);
+    getting one from the store also moves it back to regular storage.
+    """
+    for member in tree_members(conversations_by_id, conversation_id):
+        if conversations_by_id.get(member, {}).get('archived'):
+            conversation = await db.run_async(db.get_conversation, member)
+            if conversation is not None:
+                conversations_by_id[member] = conversation
+
+def branch_points(conversations_by_id: Dict[str, Dict[str, Any]], conversation_id: str) -> Dict[int, Tuple[List[str], int]]:
+    """Find the messages of a conversation that have alternatives in other branches.
+
+    Returns {message index: (branch ids, position of the current one)} with one
+    branch id per alternative message, in creation order. Each alternative maps
+    to its most recently created branch.
+    """
+    members = tree_members(conversations_by_id, conversation_id)
+    if len(members) < 2:
+        return {}
+    cells = {member: message_cells(conversations_by_id.get, member) for member in members}
+    current = cells[conversation_id]
+    points = {}
+    for index, cell in enumerate(current):
+        options: Dict[Cell, str] = {}
+        for member, member_cells in cells.items():
+            # Alternatives continue from the same prefix, i.e. share the previous message
+            if len(member_cells) > index and (index == 0 or member_cells[index - 1] == current[index - 1]):
+                option = member_cells[index]
+                options[option] = conversation_id if option == cell else max(options.get(option, ''), member)
+        if len(options) > 1:
+            order = sorted(options)
+            points[index] = ([options[option] for option in order], order.index(cell))
+    return points
+
+def remember_context(model_name: str, cell: Cell, context: Optional[List[int]]) -> None:
+    """Keep the Ollama context returned after the message in `cell`.
+
+    Cells are immutable and shared between branches, so a regenerated or edited
+    message continues from its prefix's context and only the new turn is evaluated.
+    """
+    if not context:
+        return
+    _context_cache[(model_name, cell)] = context
+    _context_cache.move_to_end((model_name, cell))
+    while len(_context_cache) > CONTEXT_CACHE_SIZE:
+        _context_cache.popitem(last=False)
+
+def cached_context(model_name: str, cell: Optional[Cell]) -> Optional[List[int]]:
+    """The context remembered for `cell`, if any."""
+    return _context_cache.get((model_name, cell)) if cell else None
+
+async def generate_llm_title(messages: List[Tuple[str, str]]) -> str:
+    """Generate a short descriptive title for the conversation using the LLM; empty on failure."""
+    # Take last up to 10 messages for context
+    snippet = "\n".join(f"{name}: {msg}" for name, msg, *_ in messages[-10:])
+    prompt = (
+    "Generate a concise, relevant title (under 8 words, title case, no markdown) "
+    "for the following conversation:\n\n"
+    f"{snippet}"
+    )
+    title = ""
+    model_name = residency.manager.pick_background_model()
+    
+    try:
+        async for chunk in llm.generate_ollama_response(
+            client_id="system",
+            user_input=prompt,
+            model_name=model_name,
+            system_prompt=None,
+            keep_alive=residency.manager.keep_alive_for('background'),
+            profile='title',
+        ):
+            title += chunk
+    except Exception as e:
+        logger.error(f"Failed to generate title via Ollama: {e}")
+        return ""
+        
+    title = title.strip().strip('"')
+    # In-band stream errors are not titles
+    return '' if llm.is_error_reply(title) else title
+
+async def summarize_conversation(messages: List[Tuple[str, str]]) -> str:
+    # Use the LLM to produce a concise summary of the chat
+    convo_text = "\n".join(f"{name}: {msg}" for name, msg, *_ in messages)
+    prompt = (
+        "Summarize the following conversation between a user and an assistant in 3 concise sentences:\n\n" \
+        + convo_text
+    )
+    summary = ""
+    # stream the summary
+    model_name = residency.manager.pick_background_model()
+    
+    try:
+        async for chunk in llm.generate_ollama_response(
+            client_id="system", user_input=prompt, model_name=model_name, system_prompt=None,
+            keep_alive=residency.manager.keep_alive_for('background'), profile='summary',
+        ):
+            summary += chunk
+    except Exception as e:
+        logger.error(f"Failed to generate summary via Ollama: {e}")
+        return "" # Return empty summary on error
+        
+    return summary.strip()
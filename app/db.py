@@ -1,95 +1,429 @@
-from pymongo import MongoClient
 import os
+import time
+import asyncio
+import contextvars
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
 import logging
 
+from . import compression
+from . import tracing
+
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# Storage backend: "mongo" (default) or "sqlite"
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongo')
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'nicechat.db')
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '4'))
+
 # MongoDB connection details
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
 DB_NAME = os.getenv('DB_NAME', 'nice_chat_ai')
+# Short timeouts so a slow or missing MongoDB never stalls startup or a request for long
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '2000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '2000'))
+# Minimum seconds between reconnect attempts after a failed connection
+MONGO_RECONNECT_INTERVAL = float(os.getenv('MONGO_RECONNECT_INTERVAL', '10'))
 
 # Collections
 CONVERSATIONS_COLLECTION = 'conversations'
 CONFIG_COLLECTION = 'config'
+SESSIONS_COLLECTION = 'sessions'
 
 # Global client and db variables
 client = None
 db = None
+_connect_lock = threading.Lock()
+_last_failure = 0.0
 
 def connect_to_db():
     """Connect to MongoDB and return the database instance"""
-    global client, db
-    try:
-        client = MongoClient(MONGO_URI)
-        # Test connection
-        client.admin.command('ping')
-        db = client[DB_NAME]
-        logger.info(f"Connected to MongoDB: {DB_NAME}")
-        return db
-    except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {e}")
-        return None
+    global client, db, _last_failure
+    with _connect_lock:
+        if db is not None:
+            return db
+        start = time.perf_counter()
+        try:
+            # Deferred so importing this module stays cheap
+            from pymongo import MongoClient
+            client = MongoClient(
+                MONGO_URI,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            )
+            # Test connection
+            client.admin.command('ping')
+            db = client[DB_NAME]
+            logger.info(f"Connected to MongoDB: {DB_NAME} in {time.perf_counter() - start:.2f}s")
+            return db
+        except Exception as e:
+            _last_failure = time.monotonic()
+            if client is not None:
+                client.close()
+                client = None
+            logger.error(f"Failed to connect to MongoDB: {e}")
+            return None
+
+def connect_in_background():
+    """Start connecting to MongoDB on a daemon thread so startup is not blocked"""
+    threading.Thread(target=connect_to_db, name='mongo-connect', daemon=True).start()
 
 def get_db():
-    """Get the database instance, connecting if necessary"""
-    global db
+    """Get the database instance, reconnecting at most every MONGO_RECONNECT_INTERVAL seconds"""
     if db is None:
-        db = connect_to_db()
+        if _last_failure and time.monotonic() - _last_failure < MONGO_RECONNECT_INTERVAL:
+            return None
+        return connect_to_db()
     return db
 
-def save_conversation(conversation_id, conversation_data):
-    """Save conversation to MongoDB"""
-    try:
+class ConversationStore:
+    """Interface implemented by every conversation storage backend.
+
+    Conversations are keyed by id and hold a `messages` list of
+    (sender, content[, ...]) entries plus free-form fields such as `summary`.
+    """
+
+    def save_conversation(self, conversation_id: str, conversation_data: Dict[str, Any]) -> None:
+        """Upsert a conversation, replacing only the fields present in conversation_data."""
+        raise NotImplementedError
+
+    def append_messages(self, conversation_id: str, messages: Sequence[Sequence[Any]]) -> None:
+        """Append messages to a conversation, creating it if needed."""
+        raise NotImplementedError
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_conversations(self) -> Dict[str, Dict[str, Any]]:
+        """Return every conversation keyed by id, most recently updated first.
+
+        Archived conversations are listed without their `archive` field and with
+        `archived` set instead; get_conversation returns them in full.
+        """
+        raise NotImplementedError
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        raise NotImplementedError
+
+    def search_conversations(self, query: str, limit: int = 20) -> List[str]:
+        """Return ids of conversations whose title, fields or messages contain query."""
+        raise NotImplementedError
+
+    def iter_conversations(self, batch_size: int = 500) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (id, conversation) pairs in id order without loading them all at once."""
+        raise NotImplementedError
+
+    def bulk_upsert(self, conversations: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Insert or replace a batch of conversations; returns how many were written.
+
+        created_at/updated_at, when present, are timezone-aware datetimes (see import_conversations).
+        """
+        raise NotImplementedError
+
+    def idle_conversations(self, before: float, limit: int = 100) -> List[str]:
+        """Return ids of unarchived conversations with messages, last updated before the `before` epoch time."""
+        raise NotImplementedError
+
+    def archive_conversation(self, conversation_id: str, archive: str, updated_at: Any) -> bool:
+        """Replace the messages with a packed archive, unless the conversation changed since updated_at."""
+        raise NotImplementedError
+
+    def restore_conversation(self, conversation_id: str, messages: Sequence[Sequence[Any]]) -> None:
+        """Move an archived conversation back to regular message storage."""
+        raise NotImplementedError
+
+    def generation_stats(self, since: float) -> List[Dict[str, Any]]:
+        """Aggregate the reply statistics (see llm.generation_stats) stored since the `since` epoch time.
+
+        Returns one dict per model and UTC day with `model`, `day`, `replies`,
+        sums of the STAT_FIELDS and the list of `load_durations`.
+        """
+        raise NotImplementedError
+
+class MongoConversationStore(ConversationStore):
+    """Conversation storage in the MongoDB `conversations` collection."""
+
+    def __init__(self):
+        self._indexed = False
+
+    def _collection(self):
         db = get_db()
         if db is None:
-            logger.error("No database connection")
-            return False
-        
+            raise ConnectionError("No database connection")
+        collection = db[CONVERSATIONS_COLLECTION]
+        if not self._indexed:
+            collection.create_index('updated_at')
+            collection.create_index('created_at')
+            self._indexed = True
+        return collection
+
+    def save_conversation(self, conversation_id, conversation_data):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        fields = {k: v for k, v in conversation_data.items() if k != 'created_at'}
+        update = {'$set': {**fields, 'updated_at': now}, '$setOnInsert': {'created_at': now}}
+        if 'messages' in fields:
+            # Fresh messages supersede an archived copy
+            update['$unset'] = {'archive': ''}
         # Use conversation_id as the key
-        db[CONVERSATIONS_COLLECTION].update_one(
+        self._collection().update_one({'_id': conversation_id}, update, upsert=True)
+
+    def append_messages(self, conversation_id, messages):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._collection().update_one(
             {'_id': conversation_id},
-            {'$set': conversation_data},
+            {'$push': {'messages': {'$each': [list(m) for m in messages]}},
+             '$set': {'updated_at': now}, '$setOnInsert': {'created_at': now}},
             upsert=True
         )
+
+    def get_conversation(self, conversation_id):
+        doc = self._collection().find_one({'_id': conversation_id})
+        if doc is not None:
+            doc.pop('_id')
+        return doc
+
+    def list_conversations(self):
+        conversations = {}
+        # The packed archive stays on the server; only a flag comes back
+        pipeline = [
+            {'$sort': {'updated_at': -1}},
+            {'$addFields': {'archived': {'$ne': [{'$type': '$archive'}, 'missing']}}},
+            {'$project': {'archive': 0}},
+        ]
+        for doc in self._collection().aggregate(pipeline):
+            conversation_id = doc.pop('_id')
+            if not doc['archived']:
+                del doc['archived']
+            conversations[conversation_id] = doc
+        return conversations
+
+    def delete_conversation(self, conversation_id):
+        self._collection().delete_one({'_id': conversation_id})
+
+    def search_conversations(self, query, limit=20):
+        import re
+        pattern = {'$regex': re.escape(query), '$options': 'i'}
+        cursor = self._collection().find(
+            {'$or': [
+                {'_id': pattern},
+                {'summary': pattern},
+                # messages is a list of [sender, content] pairs
+                {'messages': {'$elemMatch': {'$elemMatch': pattern}}},
+            ]},
+            {'_id': 1}
+        ).sort('updated_at', -1).limit(limit)
+        return [doc['_id'] for doc in cursor]
+
+    def iter_conversations(self, batch_size=500):
+        # A server-side cursor: documents arrive batch_size at a time
+        for doc in self._collection().find().sort('_id', 1).batch_size(batch_size):
+            yield doc.pop('_id'), doc
+
+    def bulk_upsert(self, conversations):
+        from pymongo import ReplaceOne
+        requests = [ReplaceOne({'_id': conversation_id}, doc, upsert=True) for conversation_id, doc in conversations]
+        if not requests:
+            return 0
+        self._collection().bulk_write(requests, ordered=False)
+        return len(requests)
+
+    def idle_conversations(self, before, limit=100):
+        cutoff = datetime.datetime.fromtimestamp(before, datetime.timezone.utc)
+        cursor = self._collection().find(
+            # Conversations without messages have nothing to archive and would fill every batch
+            {'updated_at': {'$lt': cutoff}, 'archive': {'$exists': False}, 'messages.0': {'$exists': True}}, {'_id': 1}
+        ).limit(limit)
+        return [doc['_id'] for doc in cursor]
+
+    def archive_conversation(self, conversation_id, archive, updated_at):
+        # Matching updated_at makes this a no-op if a message arrived meanwhile
+        result = self._collection().update_one(
+            {'_id': conversation_id, 'updated_at': updated_at},
+            {'$set': {'archive': archive}, '$unset': {'messages': ''}}
+        )
+        return result.modified_count == 1
+
+    def restore_conversation(self, conversation_id, messages):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._collection().update_one(
+            {'_id': conversation_id},
+            {'$set': {'messages': [list(m) for m in messages], 'updated_at': now}, '$unset': {'archive': ''}}
+        )
+
+    def generation_stats(self, since):
+        sums = ('prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration', 'total_duration')
+        pipeline = [
+            # Conversations not updated since then can't hold newer replies
+            {'$match': {'updated_at': {'$gte': datetime.datetime.fromtimestamp(since, datetime.timezone.utc)}}},
+            {'$unwind': '$messages'},
+            {'$project': {'stats': {'$arrayElemAt': ['$messages', 2]}}},
+            {'$match': {'stats.model': {'$exists': True}, 'stats.at': {'$gte': since}}},
+            {'$group': {
+                '_id': {
+                    'model': '$stats.model',
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': {'$toDate': {'$multiply': ['$stats.at', 1000]}}}},
+                },
+                'replies': {'$sum': 1},
+                **{field: {'$sum': f'$stats.{field}'} for field in sums},
+                'load_durations': {'$push': '$stats.load_duration'},
+            }},
+            {'$sort': {'_id.day': 1, '_id.model': 1}},
+        ]
+        return [
+            {'model': group['_id']['model'], 'day': group['_id']['day'], **{k: v for k, v in group.items() if k != '_id'}}
+            for group in self._collection().aggregate(pipeline)
+        ]
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+# Storage calls block, so async callers run them here instead of on the event loop
+_executor = ThreadPoolExecutor(max_workers=SQLITE_POOL_SIZE, thread_name_prefix='storage')
+
+def get_store() -> ConversationStore:
+    """Return the conversation store selected by STORAGE_BACKEND, creating it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if STORAGE_BACKEND == 'sqlite':
+                from .sqlite_store import SQLiteConversationStore
+                _store = SQLiteConversationStore(SQLITE_PATH, SQLITE_POOL_SIZE)
+            else:
+                if STORAGE_BACKEND != 'mongo':
+                    logger.warning(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', using MongoDB")
+                _store = MongoConversationStore()
+        return _store
+
+def set_store(store: ConversationStore) -> None:
+    """Replace the conversation store (used by tests and tools)"""
+    global _store
+    _store = store
+
+async def run_async(func, *args):
+    """Run a blocking storage function on the storage thread pool"""
+    # Carry the caller's context (the current trace) into the worker thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, context.run, func, *args)
+
+def save_conversation(conversation_id, conversation_data):
+    """Save conversation to the configured storage backend"""
+    try:
+        with tracing.span('db.save_conversation', fields=sorted(conversation_data)):
+            if 'messages' in conversation_data:
+                conversation_data = {**conversation_data, 'messages': compression.compress_messages(conversation_data['messages'])}
+            get_store().save_conversation(conversation_id, conversation_data)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save conversation: {e}")
+        return False
+
+def append_messages(conversation_id, messages):
+    """Append messages to a stored conversation"""
+    try:
+        with tracing.span('db.append_messages', count=len(messages)):
+            get_store().append_messages(conversation_id, compression.compress_messages(messages))
         return True
     except Exception as e:
-        logger.error(f"Failed to save conversation to MongoDB: {e}")
+        logger.error(f"Failed to append messages: {e}")
         return False
 
+def _exported_time(value: Any) -> Optional[datetime.datetime]:
+    """Parse an exported created_at/updated_at (ISO string or epoch seconds) into a UTC datetime."""
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+def import_conversations(conversations: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    """Upsert a batch of exported conversations; returns how many were written.
+
+    Timestamps are turned back into datetimes and messages are compressed like
+    on save. Unlike the other wrappers this raises on failure, so an import can
+    report how far it got.
+    """
+    prepared = []
+    for conversation_id, conversation in conversations:
+        conversation = dict(conversation)
+        for field in ('created_at', 'updated_at'):
+            if field in conversation:
+                parsed = _exported_time(conversation.pop(field))
+                if parsed is not None:
+                    conversation[field] = parsed
+        if conversation.get('messages'):
+            conversation['messages'] = compression.compress_messages(conversation['messages'])
+        prepared.append((conversation_id, conversation))
+    with tracing.span('db.import_conversations', count=len(prepared)):
+        return get_store().bulk_upsert(prepared)
+
+def get_conversation(conversation_id):
+    """Get a single conversation with plain messages, or None if it doesn't exist.
+
+    Opening an archived conversation moves it back to regular storage.
+    """
+    try:
+        store = get_store()
+        conversation = store.get_conversation(conversation_id)
+        if conversation is None:
+            return None
+        archived = bool(conversation.get('archive'))
+        messages = compression.messages_of(conversation)
+        if archived:
+            try:
+                store.restore_conversation(conversation_id, compression.compress_messages(messages))
+                logger.info(f"Restored archived conversation {conversation_id}")
+            except Exception as e:
+                # The unpacked messages are still returned; restoring is retried on the next open
+                logger.warning(f"Failed to restore archived conversation {conversation_id}: {e}")
+        return conversation
+    except Exception as e:
+        logger.error(f"Failed to get conversation {conversation_id}: {e}")
+        return None
+
 def get_all_conversations():
-    """Get all conversations from MongoDB"""
+    """Get all conversations (bodies stay compressed until compression.messages_of is called)
+
+    Archived conversations come without their archived messages; open them with get_conversation.
+    """
     try:
-        db = get_db()
-        if db is None:
-            logger.error("No database connection")
-            return {}
-        
-        conversations = {}
-        for doc in db[CONVERSATIONS_COLLECTION].find():
-            conversation_id = doc.pop('_id')
-            conversations[conversation_id] = doc
-        return conversations
+        return get_store().list_conversations()
     except Exception as e:
-        logger.error(f"Failed to get conversations from MongoDB: {e}")
+        logger.error(f"Failed to get conversations: {e}")
         return {}
 
 def delete_conversation(conversation_id):
-    """Delete a conversation from MongoDB"""
+    """Delete a conversation"""
     try:
-        db = get_db()
-        if db is None:
-            logger.error("No database connection")
-            return False
-        
-        db[CONVERSATIONS_COLLECTION].delete_one({'_id': conversation_id})
+        get_store().delete_conversation(conversation_id)
         return True
     except Exception as e:
-        logger.error(f"Failed to delete conversation from MongoDB: {e}")
+        logger.error(f"Failed to delete conversation: {e}")
         return False
 
-# Initialize connection when module is imported
-connect_to_db()
+def generation_stats(since):
+    """Reply statistics per model and day since an epoch time (see ConversationStore.generation_stats)"""
+    try:
+        return get_store().generation_stats(since)
+    except Exception as e:
+        logger.error(f"Failed to aggregate generation stats: {e}")
+        return []
+
+def search_conversations(query, limit=20):
+    """Search conversations by title, summary and message text"""
+    try:
+        return get_store().search_conversations(query, limit)
+    except Exception as e:
+        logger.error(f"Failed to search conversations: {e}")
+        return []
@@ -0,0 +1,229 @@
+"""
+Event-loop lag monitor and on-demand sampling profiler.
+
+The monitor ticks on the asyncio loop and a watchdog thread checks that the
+ticks keep coming. When the loop has been stalled for longer than
+LOOP_LAG_THRESHOLD_MS, the watchdog logs the stack the loop thread is stuck
+in, so blocking calls (sync storage, big regexes, file writes) show up with
+their call site. Set LOOP_LAG_THRESHOLD_MS=0 to disable the monitor.
+
+The profiler samples the loop thread's stack every PROFILER_INTERVAL_MS while
+it is switched on and aggregates the samples as folded stacks, the input
+format of flamegraph.pl and speedscope. Both are admin-only (see app/admin.py):
+
+    GET    /api/admin/loop-lag   recent stalls with their stack samples
+    POST   /api/admin/profiler   start sampling (?enabled=false stops it)
+    GET    /api/admin/profiler   download the folded stacks collected so far
+"""
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Any, Counter, Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import Depends
+from fastapi.responses import PlainTextResponse
+from nicegui import app
+
+from .admin import require_admin
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+LOOP_LAG_THRESHOLD_MS = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '250'))
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '10'))
+# Stack samples logged per stall; a long stall is sampled again every half threshold
+MAX_SAMPLES_PER_STALL = 5
+RECENT_STALLS = 20
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _stack_of(thread_id: int) -> Optional[FrameType]:
+    return sys._current_frames().get(thread_id)
+
+class LoopMonitor:
+    """Detects event-loop stalls and records where the loop was stuck."""
+
+    def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self.stalls: Deque[Dict[str, Any]] = collections.deque(maxlen=RECENT_STALLS)
+        self.max_lag_ms = 0.0
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._stall: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    async def _tick(self) -> None:
+        interval = self.threshold / 2
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            lag = now - expected
+            self._heartbeat = now
+            self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+            stall = self._stall
+            if stall is not None:
+                # The watchdog saw this stall; record how long it lasted in the end
+                self._stall = None
+                stall['lag_ms'] = round(lag * 1000, 1)
+                logger.warning(f"Event loop was blocked for {stall['lag_ms']:.0f} ms")
+            elif lag > self.threshold:
+                # Too short for the watchdog to sample, but still worth a line
+                logger.warning(f"Event loop lag of {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._heartbeat
+            if blocked < self.threshold * 1.5: # One tick interval plus the threshold
+                continue
+            stall = self._stall
+            if stall is None:
+                stall = {'at': time.time(), 'lag_ms': None, 'samples': []}
+                self._stall = stall
+                self.stalls.append(stall)
+            if len(stall['samples']) >= MAX_SAMPLES_PER_STALL:
+                continue
+            frame = _stack_of(self._loop_thread)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            stall['samples'].append({'blocked_ms': round(blocked * 1000, 1), 'stack': stack})
+            logger.warning(f"Event loop blocked for {blocked * 1000:.0f} ms in:\n{stack}")
+
+    def start(self) -> None:
+        """Start monitoring the running event loop, if enabled."""
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold * 1000,
+            'max_lag_ms': round(self.max_lag_ms, 1),
+            'stalls': list(self.stalls),
+        }
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack on a background thread."""
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples: Counter[str] = collections.Counter()
+        self.started_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target: Optional[int] = None
+        # The sampler thread updates `samples` while endpoints read it
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = _stack_of(self._target)
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                with self._lock:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self, thread_id: int) -> None:
+        """Start sampling a thread, discarding the previous results."""
+        if self.running:
+            return
+        with self._lock:
+            self.samples.clear()
+        self.started_at = time.time()
+        self._target = thread_id
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.0f} ms interval)")
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread; blocks, so call it off the event loop."""
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+            logger.info(f"Sampling profiler stopped after {self.sample_count()} samples")
+
+    def _snapshot(self) -> Counter[str]:
+        with self._lock:
+            return collections.Counter(self.samples)
+
+    def sample_count(self) -> int:
+        return sum(self._snapshot().values())
+
+    def folded(self) -> str:
+        """The samples as folded stacks, one "frame;frame;frame count" line per stack."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self._snapshot().most_common())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'interval_ms': self.interval * 1000,
+            'samples': self.sample_count(),
+        }
+
+# Shared instances for the process
+monitor = LoopMonitor()
+profiler = SamplingProfiler()
+
+@app.get('/api/admin/loop-lag', include_in_schema=False, dependencies=[Depends(require_admin)])
+def loop_lag_endpoint() -> Dict[str, Any]:
+    return monitor.report()
+
+@app.post('/api/admin/profiler', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def profiler_toggle_endpoint(enabled: bool = True) -> Dict[str, Any]:
+    if enabled:
+        # Async so this runs on the loop thread, which is the one being profiled
+        profiler.start(threading.get_ident())
+    else:
+        # Joining the sampler thread blocks, so it waits on a worker thread
+        await asyncio.to_thread(profiler.stop)
+    return profiler.status()
+
+@app.get('/api/admin/profiler', include_in_schema=False, dependencies=[Depends(require_admin)])
+def profiler_download_endpoint() -> PlainTextResponse:
+    return PlainTextResponse(profiler.folded(), headers={
+        'Content-Disposition': f'attachment; filename="profile-{int(profiler.started_at or 0)}.folded"',
+        'X-Profiler-Samples': str(profiler.sample_count()),
+    })
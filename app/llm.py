@@ -1,45 +1,174 @@
 \
 import httpx
 import json
-from typing import List, Dict, AsyncIterator, Optional
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Callable, List, Dict, AsyncIterator, Optional, Set, Tuple
 import logging
 
 from . import config # Use relative import
+from . import tracing
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+class OllamaBackend:
+    """Runtime state for a single Ollama host in the backend pool."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.in_flight = 0 # Requests currently streaming from this host
+        self.latency: Optional[float] = None # EWMA of time to first chunk, in seconds
+        self.failures = 0 # Consecutive failures, drives the cooldown length
+        self.down_until = 0.0 # monotonic() timestamp before which the host is skipped
+        self.models: Set[str] = set() # Installed models, from /api/tags
+        self.loaded_models: Set[str] = set() # Models resident in memory, from /api/ps
+        self.ps_checked_at = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def mark_success(self, latency: Optional[float] = None) -> None:
+        self.failures = 0
+        self.down_until = 0.0
+        if latency is not None:
+            alpha = OllamaRouter.LATENCY_EWMA_ALPHA
+            self.latency = latency if self.latency is None else alpha * latency + (1 - alpha) * self.latency
+
+    def mark_failure(self) -> None:
+        self.failures += 1
+        cooldown = OllamaRouter.FAILURE_COOLDOWN * min(2 ** (self.failures - 1), 8)
+        self.down_until = time.monotonic() + cooldown
+        logger.warning(f"Ollama backend {self.base_url} marked unhealthy for {cooldown:.0f}s.")
+
+class OllamaRouter:
+    """Routes requests across the configured Ollama backends.
+
+    Hosts are ranked by an estimated cost built from in-flight load, measured
+    latency and model affinity (a host that already has the model loaded skips
+    the cold-load penalty). Unhealthy hosts are skipped until their cooldown
+    expires and are only tried as a last resort.
+    """
+
+    LATENCY_EWMA_ALPHA = 0.3
+    DEFAULT_LATENCY = 1.0 # Seconds, assumed until a host has been measured
+    COLD_LOAD_PENALTY = 5.0 # Seconds, rough cost of loading a model into memory
+    FAILURE_COOLDOWN = 15.0 # Seconds, doubled on consecutive failures
+    PS_TTL = 5.0 # Seconds between /api/ps polls per host
+
+    def __init__(self):
+        self._backends: Dict[str, OllamaBackend] = {}
+
+    def backends(self) -> List[OllamaBackend]:
+        """Return the backend pool, synced with the current configuration."""
+        urls = config.get_ollama_base_urls()
+        for url in urls:
+            if url not in self._backends:
+                self._backends[url] = OllamaBackend(url)
+        for url in list(self._backends):
+            if url not in urls:
+                del self._backends[url]
+        return [self._backends[url] for url in urls]
+
+    def cost(self, backend: OllamaBackend, model_name: Optional[str]) -> float:
+        latency = backend.latency if backend.latency is not None else self.DEFAULT_LATENCY
+        cost = (backend.in_flight + 1) * latency
+        if model_name and model_name not in backend.loaded_models:
+            cost += self.COLD_LOAD_PENALTY
+        return cost
+
+    async def refresh_loaded_models(self, backend: OllamaBackend, client: httpx.AsyncClient) -> None:
+        """Poll /api/ps to learn which models are resident on a host."""
+        try:
+            response = await client.get(f"{backend.base_url}/api/ps", timeout=2)
+            response.raise_for_status()
+            backend.loaded_models = {m['name'] for m in response.json().get('models', [])}
+        except (httpx.RequestError, httpx.HTTPStatusError, json.JSONDecodeError) as e:
+            logger.debug(f"Could not poll /api/ps on {backend.base_url}: {e}")
+        backend.ps_checked_at = time.monotonic()
+
+    async def ranked(self, model_name: Optional[str] = None) -> List[OllamaBackend]:
+        """Return backends best-first for the given model."""
+        backends = self.backends()
+        if len(backends) > 1:
+            now = time.monotonic()
+            stale = [b for b in backends if b.available and now - b.ps_checked_at > self.PS_TTL]
+            if stale:
+                async with httpx.AsyncClient() as client:
+                    await asyncio.gather(*(self.refresh_loaded_models(b, client) for b in stale))
+
+        def has_model(b: OllamaBackend) -> bool:
+            # An unknown catalogue is treated as "may have it"
+            return not model_name or not b.models or model_name in b.models
+
+        healthy = sorted(
+            (b for b in backends if b.available),
+            key=lambda b: (not has_model(b), self.cost(b, model_name)),
+        )
+        unhealthy = sorted((b for b in backends if not b.available), key=lambda b: b.down_until)
+        return healthy + unhealthy
+
+    @asynccontextmanager
+    async def lease(self, backend: OllamaBackend):
+        """Count a request against a backend's in-flight load for its duration."""
+        backend.in_flight += 1
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+
+# Shared router instance for the process
+router = OllamaRouter()
+
 async def check_ollama_connection() -> bool:
-    # \"\"\"Check if the Ollama server is running and reachable.\"\"\"
-    cfg = config.get_config()
-    base_url = cfg.get("ollama_base_url", config.DEFAULT_CONFIG["ollama_base_url"])
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(base_url, timeout=5)
+    # \"\"\"Check if at least one Ollama server in the pool is running and reachable.\"\"\"
+    async def ping(client: httpx.AsyncClient, backend: OllamaBackend) -> bool:
+        try:
+            response = await client.get(backend.base_url, timeout=5)
             response.raise_for_status()
+            backend.mark_success()
+            return True
+        except httpx.RequestError as e:
+            logger.warning(f"Ollama server not reachable at {backend.base_url}: {e}")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during Ollama connection check: {e}")
+        backend.mark_failure()
+        return False
+
+    async with httpx.AsyncClient() as client:
+        results = await asyncio.gather(*(ping(client, b) for b in router.backends()))
+    if any(results):
         logger.info("Ollama server connection successful.")
         return True
+    return False
+
+async def _fetch_backend_models(client: httpx.AsyncClient, backend: OllamaBackend) -> Optional[List[str]]:
+    # \"\"\"Fetch the installed models of a single backend, or None if it failed.\"\"\"
+    try:
+        response = await client.get(f"{backend.base_url}/api/tags", timeout=10)
+        response.raise_for_status()
+        models = [model['name'] for model in response.json().get('models', [])]
+        backend.models = set(models)
+        backend.mark_success()
+        return models
     except httpx.RequestError as e:
-        logger.warning(f"Ollama server not reachable at {base_url}: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during Ollama connection check: {e}")
-        return False
+        logger.error(f"Error fetching Ollama models from {backend.base_url}: {e}")
+    except (httpx.HTTPStatusError, json.JSONDecodeError, KeyError) as e:
+        logger.error(f"Failed to parse Ollama models response from {backend.base_url}: {e}")
+    backend.mark_failure()
+    return None
 
 async def get_available_models() -> List[str]:
-    # \"\"\"Fetch the list of available models from the Ollama server.\"\"\"
-    cfg = config.get_config()
-    base_url = cfg.get("ollama_base_url", config.DEFAULT_CONFIG["ollama_base_url"])
-
-    if not await check_ollama_connection():
-        # No ui.notify here, handle in UI layer
-        return []
+    # \"\"\"Fetch the merged list of available models across all Ollama servers.\"\"\"
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(f"{base_url}/api/tags", timeout=10)
-            response.raise_for_status()
-        models_data = response.json()
-        available_models = sorted([model['name'] for model in models_data.get('models', [])])
+            results = await asyncio.gather(*(_fetch_backend_models(client, b) for b in router.backends()))
+        if all(result is None for result in results):
+            # No ui.notify here, handle in UI layer
+            return []
+        available_models = sorted({name for result in results if result for name in result})
         logger.info(f"Fetched available models: {available_models}")
         # Update cache
         config.set_available_models_cache(available_models)
@@ -48,25 +177,139 @@ async def get_available_models() -> List[str]:
              config.set_default_model(available_models[0])
         config.save_config() # Save cache and potentially new default
         return available_models
-    except httpx.RequestError as e:
-        logger.error(f"Error fetching Ollama models: {e}")
-        return []
-    except json.JSONDecodeError:
-        logger.error("Failed to parse Ollama models response.")
-        return []
     except Exception as e:
         logger.error(f"An unexpected error occurred fetching Ollama models: {e}")
         return []
 
+async def embed(model_name: str, texts: List[str]) -> List[List[float]]:
+    """Embed texts with an Ollama embedding model (/api/embed); raises on failure.
+
+    Like generation, the request goes to the best-ranked backend and fails over
+    to the next one when a host can't be reached.
+    """
+    timeout = config.get_config().get("ollama_timeout", config.DEFAULT_CONFIG["ollama_timeout"])
+    last_error: Optional[Exception] = None
+    for backend in await router.ranked(model_name):
+        try:
+            async with router.lease(backend), httpx.AsyncClient() as client:
+                response = await client.post(f"{backend.base_url}/api/embed",
+                                             json={"model": model_name, "input": texts}, timeout=timeout)
+            if response.status_code >= 500:
+                backend.mark_failure()
+                last_error = httpx.HTTPStatusError(f"status {response.status_code}", request=response.request, response=response)
+                continue
+            response.raise_for_status()
+            return response.json()["embeddings"]
+        except httpx.RequestError as e:
+            backend.mark_failure()
+            last_error = e
+    raise last_error or RuntimeError("No Ollama backend configured")
+
+# Counts and durations (nanoseconds) from Ollama's final chunk that are kept per reply
+STAT_FIELDS = ('prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration', 'load_duration', 'total_duration')
+
+def generation_stats(model_name: str, chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Statistics of one reply, stored as the third field of the assistant message."""
+    return {'model': model_name, 'at': time.time(), **{key: chunk[key] for key in STAT_FIELDS if key in chunk}}
+
+def _timings(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Token counts and durations (in ms) reported in Ollama's final chunk."""
+    timings = {key: chunk[key] for key in ('prompt_eval_count', 'eval_count') if key in chunk}
+    for key in ('load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration'):
+        if key in chunk:
+            timings[f"{key}_ms"] = round(chunk[key] / 1e6, 2) # Reported in nanoseconds
+    return timings
+
+class ThinkingSplitter:
+    """Separates the reasoning of thinking models (a leading <think>...</think>) from the answer.
+
+    Feed it the streamed text; each call returns the (answer, reasoning) text
+    that is complete so far. Tags may be split across chunks, so a possible
+    partial tag is held back until the next chunk. Only a block at the very
+    start counts as reasoning; a <think> later in an answer is left alone.
+    """
+    OPEN, CLOSE = '<think>', '</think>'
+
+    def __init__(self):
+        self._state = 'start' # start -> thinking -> after (skipping blank lines) -> answer
+        self._pending = ''
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        if self._state == 'answer':
+            return text, ''
+        text, self._pending = self._pending + text, ''
+        reasoning = ''
+        if self._state == 'start':
+            stripped = text.lstrip()
+            if self.OPEN.startswith(stripped): # Blank or a partial opening tag
+                self._pending = text
+                return '', ''
+            if not stripped.startswith(self.OPEN):
+                self._state = 'answer'
+                return text, ''
+            self._state, text = 'thinking', stripped[len(self.OPEN):]
+        if self._state == 'thinking':
+            end = text.find(self.CLOSE)
+            if end < 0:
+                keep = next((n for n in range(len(self.CLOSE) - 1, 0, -1) if text.endswith(self.CLOSE[:n])), 0)
+                self._pending = text[len(text) - keep:] if keep else ''
+                return '', text[:len(text) - keep]
+            reasoning, text = text[:end], text[end + len(self.CLOSE):]
+            self._state = 'after'
+        # The answer usually starts with blank lines after the closing tag
+        text = text.lstrip()
+        if text:
+            self._state = 'answer'
+        return text, reasoning
+
+    def flush(self) -> Tuple[str, str]:
+        """Return whatever was held back once the stream has ended."""
+        pending, self._pending = self._pending, ''
+        if self._state == 'thinking': # Cut off before the block was closed
+            return '', pending
+        return (pending if pending.strip() else ''), ''
+
+# Profile settings that are passed to Ollama as model options
+PROFILE_OPTIONS = ('num_predict', 'num_ctx', 'temperature', 'stop')
+
+def generation_profile(name: Optional[str]) -> Dict[str, Any]:
+    """Return a named entry of `generation_profiles`; empty when it isn't defined."""
+    if not name:
+        return {}
+    return (config.get_config().get('generation_profiles') or {}).get(name) or {}
+
+def is_error_reply(text: str) -> bool:
+    """True if a reply holds one of the in-band "[Error...]" chunks generate_ollama_response yields on failure."""
+    return text.lstrip().startswith('[Error') or '\n[Error' in text
+
 async def generate_ollama_response(
     client_id: str,
     user_input: str,
     model_name: str,
-    system_prompt: Optional[str] = None # Add system_prompt parameter
+    system_prompt: Optional[str] = None, # Add system_prompt parameter
+    keep_alive: Optional[str] = None, # How long Ollama keeps the model loaded afterwards
+    context: Optional[List[int]] = None, # Context returned by an earlier call; only the new prompt is evaluated
+    on_done: Optional[Callable[[Dict[str, Any]], None]] = None, # Receives the final chunk (context, timings)
+    options: Optional[Dict[str, Any]] = None, # Ollama model options, e.g. num_predict
+    profile: Optional[str] = None, # Name of a generation profile (model, options, keep_alive, stream)
+    on_thinking: Optional[Callable[[str], None]] = None # Receives reasoning deltas; reasoning is dropped without it
 ) -> AsyncIterator[str]:
-    """Generate a chatbot response using the specified Ollama model via streaming."""
+    """Generate a chatbot response using the specified Ollama model via streaming.
+
+    The request goes to the best-ranked backend; connection failures and 5xx
+    responses fail over to the next one as long as nothing has been streamed yet.
+    A profile's model and keep_alive replace the given ones, and its options
+    are applied under any explicit `options`. A non-streaming profile yields
+    the whole reply as one chunk.
+
+    Only answer text is yielded. The reasoning of thinking models (a leading
+    <think> block, or Ollama's separate `thinking` field) goes to `on_thinking`.
+    """
     cfg = config.get_config()
-    base_url = cfg.get("ollama_base_url", config.DEFAULT_CONFIG["ollama_base_url"])
+    settings = generation_profile(profile)
+    model_name = settings.get('model') or model_name
+    keep_alive = settings.get('keep_alive') or keep_alive
+    options = {**{key: settings[key] for key in PROFILE_OPTIONS if settings.get(key) is not None}, **(options or {})} or None
     timeout = cfg.get("ollama_timeout", config.DEFAULT_CONFIG["ollama_timeout"])
 
     # Define a default system prompt if none is provided
@@ -82,56 +325,105 @@ async def generate_ollama_response(
     if not model_name:
         yield "[Error: No model selected.]"
         return
-    if not await check_ollama_connection():
-        yield "[Error: Ollama server not reachable.]"
-        return
-
-    logger.info(f"Streaming prompt to model {model_name} for client {client_id}...")
 
+    # Ended when the stream finishes or the caller stops reading it
+    span = tracing.start_span('llm.generate', model=model_name, prompt_chars=len(user_input), context=bool(context),
+                              profile=profile or '')
     try:
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                'POST',
-                f"{base_url}/api/generate",
-                json={
-                    "model": model_name,
-                    "prompt": user_input, # Use user_input directly as prompt
-                    "system": system_prompt, # Add the system prompt
-                    "stream": True
-                },
-                timeout=timeout
-            ) as response:
-                if response.status_code != 200:
-                    error_content = await response.aread()
-                    logger.error(f"Ollama API request failed for client {client_id} with status {response.status_code}: {error_content.decode()}")
-                    yield f"\\n[Error: Ollama API request failed with status {response.status_code}]"
-                    return
-
-                async for line in response.aiter_lines():
-                    if line:
-                        try:
-                            chunk_data = json.loads(line)
-                            if 'response' in chunk_data:
-                                yield chunk_data['response']
-                            if chunk_data.get('error'):
-                                logger.error(f"Ollama stream error for client {client_id}: {chunk_data['error']}")
-                                yield f"\\n[Error from Ollama: {chunk_data['error']}]"
-                            if chunk_data.get('done'):
-                                logger.info(f"Ollama stream finished for client {client_id}.")
-                                break
-                        except json.JSONDecodeError:
-                            logger.warning(f"Failed to parse stream chunk for client {client_id}: {line}")
-                        except Exception as e:
-                            logger.error(f"Error processing stream chunk for client {client_id}: {e}")
-                            yield f"\\n[Error processing stream: {e}]"
-
-    except httpx.TimeoutException:
-        logger.warning(f"Ollama generation timed out for client {client_id}.")
-        yield f"\\n[Error: Ollama generation timed out after {timeout} seconds.]"
-    except httpx.RequestError as e:
-        logger.error(f"Ollama API request failed for client {client_id}: {e}")
-        yield f"\\n[Error: Ollama API request failed: {e}]"
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during Ollama generation for client {client_id}: {e}")
-        yield f"\\n[Error: An unexpected error occurred during generation: {e}]"
+        backends = await router.ranked(model_name)
+        span.event('backends_ranked')
+        for backend in backends:
+            base_url = backend.base_url
+            logger.info(f"Streaming prompt to model {model_name} on {base_url} for client {client_id} (request {tracing.request_id()})...")
+            span.event('request_sent', backend=base_url)
+            started = False
+            splitter = ThinkingSplitter()
+            request_start = time.monotonic()
+            payload = {
+                "model": model_name,
+                "prompt": user_input, # Use user_input directly as prompt
+                "system": system_prompt, # Add the system prompt
+                "stream": settings.get('stream', True)
+            }
+            if keep_alive:
+                payload["keep_alive"] = keep_alive
+            if context:
+                payload["context"] = context
+            if options:
+                payload["options"] = options
+
+            try:
+                async with router.lease(backend), httpx.AsyncClient() as client:
+                    async with client.stream(
+                        'POST',
+                        f"{base_url}/api/generate",
+                        json=payload,
+                        timeout=timeout
+                    ) as response:
+                        if response.status_code >= 500:
+                            error_content = await response.aread()
+                            logger.error(f"Ollama backend {base_url} failed for client {client_id} with status {response.status_code}: {error_content.decode()}")
+                            backend.mark_failure()
+                            continue
+                        if response.status_code != 200:
+                            error_content = await response.aread()
+                            logger.error(f"Ollama API request failed for client {client_id} with status {response.status_code}: {error_content.decode()}")
+                            yield f"\n[Error: Ollama API request failed with status {response.status_code}]"
+                            return
 
+                        async for line in response.aiter_lines():
+                            if line:
+                                if not started:
+                                    started = True
+                                    span.event('first_byte')
+                                    backend.mark_success(time.monotonic() - request_start)
+                                    backend.loaded_models.add(model_name)
+                                try:
+                                    chunk_data = json.loads(line)
+                                    answer, reasoning = splitter.feed(chunk_data.get('response') or '')
+                                    if chunk_data.get('done'):
+                                        tail, rest = splitter.flush()
+                                        answer, reasoning = answer + tail, reasoning + rest
+                                    reasoning += chunk_data.get('thinking') or ''
+                                    if reasoning and on_thinking:
+                                        on_thinking(reasoning)
+                                    if answer:
+                                        yield answer
+                                    if chunk_data.get('error'):
+                                        logger.error(f"Ollama stream error for client {client_id}: {chunk_data['error']}")
+                                        yield f"\n[Error from Ollama: {chunk_data['error']}]"
+                                    if chunk_data.get('done'):
+                                        logger.info(f"Ollama stream finished for client {client_id}.")
+                                        span.set(backend=base_url, **_timings(chunk_data))
+                                        if on_done:
+                                            on_done(chunk_data)
+                                        break
+                                except json.JSONDecodeError:
+                                    logger.warning(f"Failed to parse stream chunk for client {client_id}: {line}")
+                                except Exception as e:
+                                    logger.error(f"Error processing stream chunk for client {client_id}: {e}")
+                                    yield f"\n[Error processing stream: {e}]"
+                        return
+
+            except httpx.TimeoutException:
+                logger.warning(f"Ollama generation timed out for client {client_id} on {base_url}.")
+                if not started:
+                    backend.mark_failure()
+                    continue
+                yield f"\n[Error: Ollama generation timed out after {timeout} seconds.]"
+                return
+            except httpx.RequestError as e:
+                logger.error(f"Ollama API request failed for client {client_id} on {base_url}: {e}")
+                if not started:
+                    backend.mark_failure()
+                    continue
+                yield f"\n[Error: Ollama API request failed: {e}]"
+                return
+            except Exception as e:
+                logger.error(f"An unexpected error occurred during Ollama generation for client {client_id}: {e}")
+                yield f"\n[Error: An unexpected error occurred during generation: {e}]"
+                return
+
+        yield "[Error: Ollama server not reachable.]"
+    finally:
+        span.end()
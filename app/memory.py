@@ -0,0 +1,211 @@
+"""
+Semantic memory: recall the summaries of related past conversations.
+
+Each stored conversation summary is embedded once with `embedding_model`
+(an Ollama embedding model such as nomic-embed-text) and kept as a
+normalized float32 row of one NumPy matrix. For a new message, one query
+embedding and a single matrix-vector product find the `memory_top_k` most
+similar summaries above `memory_min_score`, which are added to the system
+prompt as long as they fit in `memory_token_budget`.
+
+The index is built in the background at startup and updated incrementally:
+a saved summary re-embeds only that conversation, a deleted conversation
+drops its row. Without an embedding model (or without NumPy) only the current
+conversation's own summary is used. NumPy is imported only once memory is
+enabled, so it doesn't slow down startup.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import config
+from . import db
+from . import llm
+
+logger = logging.getLogger(__name__)
+
+# Summaries embedded per /api/embed request while building the index
+EMBED_BATCH_SIZE = 32
+
+# Optional dependency, imported on first use (see _import_numpy)
+np = None
+_numpy_missing = False
+
+def _import_numpy() -> bool:
+    """Import NumPy if it is installed; returns whether it is available."""
+    global np, _numpy_missing
+    if np is None and not _numpy_missing:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            _numpy_missing = True
+            logger.warning("Semantic memory needs NumPy; only the conversation's own summary is used")
+    return np is not None
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+def _normalize(vectors: 'np.ndarray') -> 'np.ndarray':
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+class MemoryIndex:
+    """Summary embeddings of stored conversations, one matrix row per conversation."""
+
+    def __init__(self):
+        self._model: Optional[str] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._summaries: Dict[str, str] = {} # The text each row was embedded from
+        self._matrix = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(config.get_config().get('embedding_model')) and _import_numpy()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _check_model(self) -> str:
+        """Return the configured embedding model, dropping the index if it changed."""
+        model = config.get_config().get('embedding_model')
+        if model != self._model:
+            self._model = model
+            self._ids, self._rows, self._summaries, self._matrix = [], {}, {}, None
+        return model
+
+    def _put(self, conversation_id: str, summary: str, vector: 'np.ndarray') -> None:
+        # Callers hold self._lock
+        vector = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        if self._matrix is None or self._matrix.shape[1] != vector.shape[1]:
+            self._ids, self._rows, self._summaries = [], {}, {}
+            self._matrix = np.empty((0, vector.shape[1]), dtype=np.float32)
+        row = self._rows.get(conversation_id)
+        if row is None:
+            self._rows[conversation_id] = len(self._ids)
+            self._ids.append(conversation_id)
+            self._matrix = np.vstack([self._matrix, vector])
+        else:
+            self._matrix[row] = vector[0]
+        self._summaries[conversation_id] = summary
+
+    async def remove(self, conversation_id: str) -> None:
+        """Drop a conversation's row."""
+        async with self._lock:
+            self._remove(conversation_id)
+
+    def _remove(self, conversation_id: str) -> None:
+        # Callers hold self._lock; the last row moves into the freed place
+        row = self._rows.pop(conversation_id, None)
+        if row is None:
+            return
+        self._summaries.pop(conversation_id, None)
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+            self._matrix[row] = self._matrix[last]
+        self._ids.pop()
+        self._matrix = self._matrix[:last]
+
+    async def update(self, conversation_id: str, summary: str) -> None:
+        """Embed a new or changed summary; unchanged summaries cost nothing."""
+        if not self.enabled:
+            return
+        # A sync running meanwhile would otherwise swap the matrix under this row
+        async with self._lock:
+            model = self._check_model()
+            if not summary:
+                self._remove(conversation_id)
+                return
+            if self._summaries.get(conversation_id) == summary:
+                return
+            try:
+                vectors = await llm.embed(model, [summary])
+            except Exception as e:
+                logger.warning(f"Could not embed the summary of {conversation_id}: {e}")
+                return
+            self._put(conversation_id, summary, vectors[0])
+
+    async def sync(self, conversations: Dict[str, Dict[str, Any]]) -> int:
+        """Bring the index in line with the stored conversations; returns how many were embedded."""
+        if not self.enabled:
+            return 0
+        async with self._lock:
+            model = self._check_model()
+            for conversation_id in [cid for cid in self._ids if cid not in conversations]:
+                self._remove(conversation_id)
+            stale = [(cid, conversation.get('summary', '')) for cid, conversation in conversations.items()
+                     if conversation.get('summary') and self._summaries.get(cid) != conversation.get('summary')]
+            for start in range(0, len(stale), EMBED_BATCH_SIZE):
+                batch = stale[start:start + EMBED_BATCH_SIZE]
+                try:
+                    vectors = await llm.embed(model, [summary for _, summary in batch])
+                except Exception as e:
+                    logger.warning(f"Could not embed conversation summaries: {e}")
+                    return start
+                for (conversation_id, summary), vector in zip(batch, vectors):
+                    self._put(conversation_id, summary, vector)
+            if stale:
+                logger.info(f"Memory index: embedded {len(stale)} summaries, {len(self)} in total")
+            return len(stale)
+
+    async def search(self, query: str, exclude: Iterable[str] = ()) -> List[Tuple[str, str, float]]:
+        """Return (conversation id, summary, score) of the most similar summaries, best first."""
+        if not self.enabled or not len(self) or not query.strip():
+            return []
+        cfg = config.get_config()
+        top_k = cfg.get('memory_top_k', 3)
+        min_score = cfg.get('memory_min_score', 0.3)
+        try:
+            vectors = await llm.embed(self._check_model(), [query])
+        except Exception as e:
+            logger.warning(f"Could not embed the message for memory recall: {e}")
+            return []
+        if self._matrix is None or not len(self):
+            return []
+        scores = self._matrix @ _normalize(np.asarray(vectors, dtype=np.float32))[0]
+        excluded: Set[int] = {self._rows[cid] for cid in exclude if cid in self._rows}
+        scores[list(excluded)] = -np.inf
+        # Partial sort: only the best candidates are ordered
+        k = min(top_k + len(excluded), len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self._ids[row], self._summaries[self._ids[row]], float(scores[row]))
+                for row in best[:top_k] if scores[row] >= min_score]
+
+    async def _build(self) -> None:
+        conversations = await db.run_async(db.get_all_conversations)
+        await self.sync(conversations)
+
+    def start(self) -> None:
+        """Build the index in the background, if memory is enabled."""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._build())
+
+async def recall(query: str, own_summary: str = '', exclude: Iterable[str] = ()) -> str:
+    """Build the memory text for the system prompt: the conversation's own summary,
+    then related past summaries, within `memory_token_budget` tokens."""
+    budget = config.get_config().get('memory_token_budget', 600)
+    parts = []
+    if own_summary:
+        parts.append(own_summary)
+        budget -= estimate_tokens(own_summary)
+    related = []
+    for _, summary, _ in await index.search(query, exclude):
+        cost = estimate_tokens(summary)
+        if cost > budget:
+            break
+        related.append(summary)
+        budget -= cost
+    if related:
+        parts.append("Summaries of related earlier conversations:\n" + '\n'.join(f"- {s}" for s in related))
+    return '\n\n'.join(parts)
+
+# Shared index for the process
+index = MemoryIndex()
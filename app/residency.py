@@ -0,0 +1,119 @@
+"""
+Model residency management for the Ollama backend pool.
+Preloads configured models, tracks what is resident via /api/ps and steers
+background work (titles, summaries) to models that are already in memory.
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional, Set
+
+import httpx
+
+from . import config
+from . import llm
+
+logger = logging.getLogger(__name__)
+
+def _same_model(name: str, other: str) -> bool:
+    """Compare model names, treating a missing tag as ":latest" like Ollama does."""
+    def tagged(model: str) -> str:
+        return model if ':' in model else f"{model}:latest"
+    return tagged(name) == tagged(other)
+
+class ResidencyManager:
+    """Keeps the configured models warm and answers "what is loaded right now"."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def keep_alive_for(self, model_class: str) -> Optional[str]:
+        """Return the keep_alive setting for a model class ('chat' or 'background')."""
+        return (config.get_config().get("keep_alive") or {}).get(model_class)
+
+    def preload_targets(self) -> List[str]:
+        """Models to load at startup: `preload_models`, or the default model."""
+        models = config.get_config().get("preload_models") or []
+        if not models and config.get_default_model():
+            models = [config.get_default_model()]
+        return list(dict.fromkeys(models))
+
+    def resident_models(self) -> Set[str]:
+        """Models currently loaded on any healthy backend, as of the last poll."""
+        return {m for b in llm.router.backends() if b.available for m in b.loaded_models}
+
+    def pick_background_model(self, preferred: Optional[str] = None) -> str:
+        """Choose a model for background tasks without forcing a model switch.
+
+        The preferred model wins if it is resident; otherwise any resident model
+        that is installed and can generate is used, falling back to the preferred
+        model. The memory index's `embedding_model` is loaded too but cannot
+        generate text, so it is never picked.
+        """
+        preferred = preferred or config.get_default_model() or ''
+        resident = self.resident_models()
+        if not resident or preferred in resident:
+            return preferred
+        installed = config.get_available_models_cache()
+        embedding_model = config.get_config().get('embedding_model')
+        candidates = sorted(m for m in resident if (not installed or m in installed)
+                            and not (embedding_model and _same_model(m, embedding_model)))
+        return candidates[0] if candidates else preferred
+
+    async def preload(self, model_name: str, keep_alive: Optional[str] = None) -> bool:
+        """Load a model into memory on its best backend without generating anything."""
+        for backend in await llm.router.ranked(model_name):
+            try:
+                async with llm.router.lease(backend), httpx.AsyncClient() as client:
+                    payload = {"model": model_name}
+                    if keep_alive:
+                        payload["keep_alive"] = keep_alive
+                    start = time.monotonic()
+                    response = await client.post(f"{backend.base_url}/api/generate", json=payload,
+                                                 timeout=config.get_config().get("ollama_timeout", 60))
+                    response.raise_for_status()
+                backend.loaded_models.add(model_name)
+                logger.info(f"Preloaded {model_name} on {backend.base_url} in {time.monotonic() - start:.1f}s.")
+                return True
+            except httpx.HTTPStatusError as e:
+                logger.error(f"Failed to preload {model_name} on {backend.base_url}: {e}")
+                return False
+            except httpx.RequestError as e:
+                logger.warning(f"Could not reach {backend.base_url} to preload {model_name}: {e}")
+                backend.mark_failure()
+        return False
+
+    async def poll(self) -> None:
+        """Refresh the resident model sets of every healthy backend."""
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*(llm.router.refresh_loaded_models(b, client)
+                                   for b in llm.router.backends() if b.available))
+
+    async def _run(self) -> None:
+        keep_alive = self.keep_alive_for("chat")
+        for model_name in self.preload_targets():
+            await self.preload(model_name, keep_alive)
+        interval = config.get_config().get("residency_poll_interval", 30)
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Residency poll failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Start preloading and polling in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Shared manager instance for the process
+manager = ResidencyManager()
@@ -0,0 +1,284 @@
+"""
+Pluggable storage for per-client session state.
+
+The chat page keeps the current transcript, selected model and session title
+per browser session (the id in NiceGUI's session cookie, see STORAGE_SECRET). By default these live in process memory; setting
+SESSION_STORE=mongo in .env keeps them in a shared MongoDB collection so that
+several app processes behind a load balancer see the same state.
+
+NiceGUI clients hold a websocket to the process that rendered their page, so
+the load balancer must still use sticky sessions. The shared store makes state
+survive a worker restart or rebalance, and lets any worker read it.
+"""
+import asyncio
+import copy
+import datetime
+import logging
+import os
+import time
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(7 * 24 * 3600)))
+# How often the in-memory store looks for expired entries
+EXPIRY_INTERVAL_SECONDS = 60
+
+class SessionStore:
+    """Interface for namespaced key/value session storage."""
+
+    # Stores doing network I/O are only called off the event loop (see SessionMap)
+    blocking = False
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def keys(self, namespace: str) -> List[str]:
+        raise NotImplementedError
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; the default, and the stand-in for the shared store in tests.
+
+    Entries not written for `ttl_seconds` are dropped, like the TTL index of the shared store.
+    """
+
+    def __init__(self, copy_values: bool = False, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._updated: Dict[Tuple[str, str], float] = {}
+        # When True, values are copied on set/get like a networked store would serialize them
+        self._copy_values = copy_values
+        self._ttl_seconds = ttl_seconds
+        self._next_expiry = time.monotonic() + EXPIRY_INTERVAL_SECONDS
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        value = self._data.get(namespace, {}).get(key)
+        return copy.deepcopy(value) if self._copy_values else value
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        self._data.setdefault(namespace, {})[key] = copy.deepcopy(value) if self._copy_values else value
+        now = time.monotonic()
+        self._updated[(namespace, key)] = now
+        if now >= self._next_expiry:
+            self._next_expiry = now + EXPIRY_INTERVAL_SECONDS
+            self.expire(now - self._ttl_seconds)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._data.get(namespace, {}).pop(key, None)
+        self._updated.pop((namespace, key), None)
+
+    def expire(self, before: float) -> int:
+        """Drop the entries last written before the `before` monotonic time; returns how many."""
+        stale = [entry for entry, updated in self._updated.items() if updated < before]
+        for namespace, key in stale:
+            self.delete(namespace, key)
+        return len(stale)
+
+    def keys(self, namespace: str) -> List[str]:
+        return list(self._data.get(namespace, {}))
+
+class MongoSessionStore(SessionStore):
+    """Shared store backed by the `sessions` collection, expired by a TTL index."""
+
+    blocking = True
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._indexed = False
+
+    def _collection(self):
+        from . import db
+        database = db.get_db()
+        if database is None:
+            return None
+        collection = database[db.SESSIONS_COLLECTION]
+        if not self._indexed:
+            collection.create_index('updated_at', expireAfterSeconds=self._ttl_seconds)
+            collection.create_index('namespace')
+            self._indexed = True
+        return collection
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        collection = self._collection()
+        if collection is None:
+            return None
+        doc = collection.find_one({'_id': f"{namespace}:{key}"}, {'value': 1})
+        return doc.get('value') if doc else None
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        collection = self._collection()
+        if collection is None:
+            logger.error("No database connection, session state not shared")
+            return
+        collection.update_one(
+            {'_id': f"{namespace}:{key}"},
+            {'$set': {'namespace': namespace, 'key': key, 'value': value,
+                      'updated_at': datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        collection = self._collection()
+        if collection is not None:
+            collection.delete_one({'_id': f"{namespace}:{key}"})
+
+    def keys(self, namespace: str) -> List[str]:
+        collection = self._collection()
+        if collection is None:
+            return []
+        return [doc['key'] for doc in collection.find({'namespace': namespace}, {'key': 1})]
+
+class SessionMap(MutableMapping):
+    """Dict-like view of one namespace of the session store.
+
+    Values are cached locally, so in-place mutation (e.g. appending streamed
+    tokens to a transcript) stays in memory until `sync(key)` or an assignment
+    writes it back. With sticky sessions the local cache is always current.
+
+    A blocking store is never called on the event loop: `load(key)` reads a key
+    in the storage thread pool before a page uses it, and writes are queued and
+    flushed from there in order (write-behind).
+    """
+
+    def __init__(self, namespace: str, store: Optional[SessionStore] = None):
+        self.namespace = namespace
+        self._store = store
+        self._cache: Dict[str, Any] = {}
+        # Keys read from the store that had no value, so lookups don't ask again
+        self._absent: Set[str] = set()
+        # Latest unwritten value per key (_DELETED for a deletion), written by _flush
+        self._pending: Dict[str, Any] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def store(self) -> SessionStore:
+        return self._store or get_store()
+
+    async def load(self, key: str) -> None:
+        """Read a key into the local cache without blocking the event loop."""
+        if key in self._cache or key in self._absent:
+            return
+        if key in self._pending: # Forgotten while its last write is still queued
+            self._restore(key)
+            return
+        from . import db
+        value = await db.run_async(self.store.get, self.namespace, key) if self.store.blocking \
+            else self.store.get(self.namespace, key)
+        if key in self._cache or key in self._absent: # Written while it was being read
+            return
+        if value is None:
+            self._absent.add(key)
+        else:
+            self._cache[key] = value
+
+    def _restore(self, key: str) -> None:
+        if self._pending[key] is _DELETED:
+            self._absent.add(key)
+        else:
+            self._cache[key] = self._pending[key]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._cache:
+            if key in self._pending:
+                self._restore(key)
+                return self[key]
+            if key in self._absent:
+                raise KeyError(key)
+            value = self.store.get(self.namespace, key)
+            if value is None:
+                raise KeyError(key)
+            self._cache[key] = value
+        return self._cache[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._cache[key] = value
+        self._absent.discard(key)
+        self._write(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self._cache.pop(key, None)
+        self._absent.add(key)
+        self._write(key, _DELETED)
+
+    def _write(self, key: str, value: Any) -> None:
+        if not self.store.blocking:
+            self._apply(key, value)
+            return
+        self._pending[key] = value
+        try:
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.get_running_loop().create_task(self._flush())
+        except RuntimeError: # No event loop (scripts and tools): write right away
+            self._apply(key, self._pending.pop(key))
+
+    def _apply(self, key: str, value: Any) -> None:
+        if value is _DELETED:
+            self.store.delete(self.namespace, key)
+        else:
+            self.store.set(self.namespace, key, value)
+
+    async def _flush(self) -> None:
+        from . import db
+        while self._pending:
+            key = next(iter(self._pending))
+            value = self._pending.pop(key)
+            # Copied here, so the loop can keep mutating the cached value during the write
+            value = value if value is _DELETED else copy.deepcopy(value)
+            try:
+                await db.run_async(self._apply, key, value)
+            except Exception as e:
+                logger.error(f"Failed to write session state {self.namespace}:{key}: {e}")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(set(self._cache) | set(self.store.keys(self.namespace)))
+
+    def __len__(self) -> int:
+        return len(set(self._cache) | set(self.store.keys(self.namespace)))
+
+    def sync(self, key: str) -> None:
+        """Write a locally mutated value back to the store."""
+        if key in self._cache:
+            self._write(key, self._cache[key])
+
+    def forget(self, key: str) -> None:
+        """Drop the local copy only, e.g. when the last page of a session disconnects.
+
+        Queued writes still go out.
+        """
+        self._cache.pop(key, None)
+        self._absent.discard(key)
+
+# Queued deletion in SessionMap._pending
+_DELETED = object()
+
+_store: Optional[SessionStore] = None
+
+def get_store() -> SessionStore:
+    """Return the configured session store, creating it on first use."""
+    global _store
+    if _store is None:
+        if SESSION_STORE == 'mongo':
+            _store = MongoSessionStore()
+        else:
+            if SESSION_STORE != 'memory':
+                logger.warning(f"Unknown SESSION_STORE '{SESSION_STORE}', using in-process memory")
+            _store = MemorySessionStore()
+        logger.info(f"Session state store: {type(_store).__name__}")
+    return _store
+
+def set_store(store: SessionStore) -> None:
+    """Replace the session store (used by tests and alternative deployments)."""
+    global _store
+    _store = store
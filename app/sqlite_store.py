@@ -0,0 +1,293 @@
+"""
+Embedded SQLite conversation storage.
+
+Used when STORAGE_BACKEND=sqlite. The database runs in WAL mode so reads never
+block on the writer, and a small pool of connections is shared by the storage
+thread executor. Statements are constant, parameterised SQL so sqlite3's
+statement cache keeps them prepared. SQLITE_PATH=:memory: gives a private
+in-memory database, which is what tests use.
+"""
+import datetime
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .db import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+"""
+
+_SELECT_CONVERSATION = "SELECT id, data, created_at, updated_at FROM conversations WHERE id = ?"
+# Listings leave out the packed archive and flag the conversation instead
+_SELECT_CONVERSATIONS = (
+    "SELECT id, json_remove(data, '$.archive'), created_at, updated_at, json_type(data, '$.archive') IS NOT NULL "
+    "FROM conversations ORDER BY updated_at DESC"
+)
+_SELECT_MESSAGES = "SELECT sender, content, extra FROM messages WHERE conversation_id = ? ORDER BY position"
+_SELECT_ALL_MESSAGES = "SELECT conversation_id, sender, content, extra FROM messages ORDER BY conversation_id, position"
+_SELECT_NEXT_POSITION = "SELECT COALESCE(MAX(position) + 1, 0) FROM messages WHERE conversation_id = ?"
+_UPSERT_CONVERSATION = (
+    "INSERT INTO conversations (id, data, created_at, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at"
+)
+_TOUCH_CONVERSATION = (
+    "INSERT INTO conversations (id, data, created_at, updated_at) VALUES (?, '{}', ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at"
+)
+_DELETE_MESSAGES = "DELETE FROM messages WHERE conversation_id = ?"
+_INSERT_MESSAGE = "INSERT INTO messages (conversation_id, position, sender, content, extra) VALUES (?, ?, ?, ?, ?)"
+_DELETE_CONVERSATION = "DELETE FROM conversations WHERE id = ?"
+_SEARCH = (
+    "SELECT c.id FROM conversations c WHERE c.id LIKE ? ESCAPE '\\' OR c.data LIKE ? ESCAPE '\\' "
+    "OR EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.id AND m.content LIKE ? ESCAPE '\\') "
+    "ORDER BY c.updated_at DESC LIMIT ?"
+)
+
+# Conversations without messages have nothing to archive and would fill every batch
+_SELECT_IDLE = (
+    "SELECT id FROM conversations c WHERE updated_at < ? AND json_extract(data, '$.archive') IS NULL "
+    "AND EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.id) "
+    "ORDER BY updated_at LIMIT ?"
+)
+_UPDATE_DATA = "UPDATE conversations SET data = ? WHERE id = ?"
+_UPDATE_DATA_TOUCH = "UPDATE conversations SET data = ?, updated_at = ? WHERE id = ?"
+
+# Reply statistics are the first extra field of assistant messages (see llm.generation_stats)
+_GENERATION_STATS = (
+    "SELECT json_extract(extra, '$[0].model') AS model, date(json_extract(extra, '$[0].at'), 'unixepoch') AS day, "
+    "COUNT(*), SUM(json_extract(extra, '$[0].prompt_eval_count')), SUM(json_extract(extra, '$[0].prompt_eval_duration')), "
+    "SUM(json_extract(extra, '$[0].eval_count')), SUM(json_extract(extra, '$[0].eval_duration')), "
+    "SUM(json_extract(extra, '$[0].total_duration')), json_group_array(json_extract(extra, '$[0].load_duration')) "
+    "FROM messages WHERE extra IS NOT NULL AND model IS NOT NULL AND json_extract(extra, '$[0].at') >= ? "
+    "GROUP BY model, day ORDER BY day, model"
+)
+
+_SELECT_CONVERSATION_PAGE = (
+    "SELECT id, data, created_at, updated_at FROM conversations WHERE id > ? ORDER BY id LIMIT ?"
+)
+_REPLACE_CONVERSATION = (
+    "INSERT INTO conversations (id, data, created_at, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, created_at = excluded.created_at, "
+    "updated_at = excluded.updated_at"
+)
+
+_memory_ids = itertools.count()
+
+def _epoch(value: Any, default: float) -> float:
+    """Epoch seconds of a stored timestamp given as a datetime or a number."""
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return value if isinstance(value, (int, float)) else default
+
+def _message_row(conversation_id: str, position: int, message: Sequence[Any]) -> tuple:
+    extra = json.dumps(list(message[2:]), ensure_ascii=False) if len(message) > 2 else None
+    return (conversation_id, position, message[0], message[1], extra)
+
+def _message_from_row(sender: str, content: str, extra: Optional[str]) -> tuple:
+    return (sender, content, *json.loads(extra)) if extra else (sender, content)
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversation storage in a local SQLite file."""
+
+    def __init__(self, path: str, pool_size: int = 4):
+        if path == ':memory:':
+            # A named shared-cache database so every pooled connection sees the same data
+            self._target = f"file:nicechat-{next(_memory_ids)}?mode=memory&cache=shared"
+        else:
+            self._target = path
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(max(1, pool_size)):
+            self._pool.put(self._open())
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+        logger.info(f"SQLite storage ready at {path} (pool of {pool_size})")
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._target, uri=self._target.startswith('file:'),
+                               check_same_thread=False, cached_statements=256, isolation_level=None)
+        if not self._target.startswith('file:'):
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _document(self, row: tuple, messages: List[tuple]) -> Dict[str, Any]:
+        _, data, created_at, updated_at = row
+        return {**json.loads(data), 'messages': messages, 'created_at': created_at, 'updated_at': updated_at}
+
+    def save_conversation(self, conversation_id: str, conversation_data: Dict[str, Any]) -> None:
+        now = time.time()
+        fields = {k: v for k, v in conversation_data.items() if k not in ('messages', 'created_at', 'updated_at')}
+        with self._transaction() as conn:
+            row = conn.execute(_SELECT_CONVERSATION, (conversation_id,)).fetchone()
+            data = {**json.loads(row[1]), **fields} if row else fields
+            if 'messages' in conversation_data:
+                data.pop('archive', None) # Fresh messages supersede an archived copy
+            conn.execute(_UPSERT_CONVERSATION, (conversation_id, json.dumps(data, ensure_ascii=False), now, now))
+            if 'messages' in conversation_data:
+                conn.execute(_DELETE_MESSAGES, (conversation_id,))
+                conn.executemany(_INSERT_MESSAGE, (
+                    _message_row(conversation_id, position, message)
+                    for position, message in enumerate(conversation_data['messages'])
+                ))
+
+    def append_messages(self, conversation_id: str, messages: Sequence[Sequence[Any]]) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(_TOUCH_CONVERSATION, (conversation_id, now, now))
+            start = conn.execute(_SELECT_NEXT_POSITION, (conversation_id,)).fetchone()[0]
+            conn.executemany(_INSERT_MESSAGE, (
+                _message_row(conversation_id, start + offset, message)
+                for offset, message in enumerate(messages)
+            ))
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute(_SELECT_CONVERSATION, (conversation_id,)).fetchone()
+            if row is None:
+                return None
+            messages = [_message_from_row(*m) for m in conn.execute(_SELECT_MESSAGES, (conversation_id,))]
+        return self._document(row, messages)
+
+    def list_conversations(self) -> Dict[str, Dict[str, Any]]:
+        with self._connection() as conn:
+            rows = conn.execute(_SELECT_CONVERSATIONS).fetchall()
+            messages: Dict[str, List[tuple]] = {}
+            for conversation_id, sender, content, extra in conn.execute(_SELECT_ALL_MESSAGES):
+                messages.setdefault(conversation_id, []).append(_message_from_row(sender, content, extra))
+        conversations = {}
+        for row in rows:
+            conversations[row[0]] = self._document(row[:4], messages.get(row[0], []))
+            if row[4]:
+                conversations[row[0]]['archived'] = True
+        return conversations
+
+    def delete_conversation(self, conversation_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(_DELETE_MESSAGES, (conversation_id,))
+            conn.execute(_DELETE_CONVERSATION, (conversation_id,))
+
+    def search_conversations(self, query: str, limit: int = 20) -> List[str]:
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"%{escaped}%"
+        with self._connection() as conn:
+            return [row[0] for row in conn.execute(_SEARCH, (pattern, pattern, pattern, limit))]
+
+    def iter_conversations(self, batch_size: int = 500) -> Iterator[tuple]:
+        # Keyset pagination, so no connection is held between batches
+        last_id = ''
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute(_SELECT_CONVERSATION_PAGE, (last_id, batch_size)).fetchall()
+                batch = [
+                    (row, [_message_from_row(*m) for m in conn.execute(_SELECT_MESSAGES, (row[0],))])
+                    for row in rows
+                ]
+            for row, messages in batch:
+                yield row[0], self._document(row, messages)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def bulk_upsert(self, conversations) -> int:
+        now = time.time()
+        count = 0
+        with self._transaction() as conn:
+            for conversation_id, doc in conversations:
+                data = {k: v for k, v in doc.items() if k not in ('messages', 'created_at', 'updated_at')}
+                conn.execute(_REPLACE_CONVERSATION, (
+                    conversation_id, json.dumps(data, ensure_ascii=False),
+                    _epoch(doc.get('created_at'), now), _epoch(doc.get('updated_at'), now),
+                ))
+                conn.execute(_DELETE_MESSAGES, (conversation_id,))
+                conn.executemany(_INSERT_MESSAGE, (
+                    _message_row(conversation_id, position, message)
+                    for position, message in enumerate(doc.get('messages', []))
+                ))
+                count += 1
+        return count
+
+    def idle_conversations(self, before: float, limit: int = 100) -> List[str]:
+        with self._connection() as conn:
+            return [row[0] for row in conn.execute(_SELECT_IDLE, (before, limit))]
+
+    def archive_conversation(self, conversation_id: str, archive: str, updated_at: Any) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute(_SELECT_CONVERSATION, (conversation_id,)).fetchone()
+            # Skip conversations that changed after they were read
+            if row is None or row[3] != updated_at:
+                return False
+            data = {**json.loads(row[1]), 'archive': archive}
+            conn.execute(_UPDATE_DATA, (json.dumps(data, ensure_ascii=False), conversation_id))
+            conn.execute(_DELETE_MESSAGES, (conversation_id,))
+        return True
+
+    def restore_conversation(self, conversation_id: str, messages: Sequence[Sequence[Any]]) -> None:
+        with self._transaction() as conn:
+            row = conn.execute(_SELECT_CONVERSATION, (conversation_id,)).fetchone()
+            if row is None:
+                return
+            data = json.loads(row[1])
+            data.pop('archive', None)
+            conn.execute(_UPDATE_DATA_TOUCH, (json.dumps(data, ensure_ascii=False), time.time(), conversation_id))
+            conn.execute(_DELETE_MESSAGES, (conversation_id,))
+            conn.executemany(_INSERT_MESSAGE, (
+                _message_row(conversation_id, position, message) for position, message in enumerate(messages)
+            ))
+
+    def generation_stats(self, since: float) -> List[Dict[str, Any]]:
+        fields = ('replies', 'prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration', 'total_duration')
+        with self._connection() as conn:
+            rows = conn.execute(_GENERATION_STATS, (since,)).fetchall()
+        return [
+            {'model': row[0], 'day': row[1], **{field: value or 0 for field, value in zip(fields, row[2:8])},
+             'load_durations': json.loads(row[8])}
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
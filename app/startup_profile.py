@@ -0,0 +1,88 @@
+"""
+Startup profiling for `python main.py --profile-startup`.
+Records how long each module import and each initialization phase takes and
+logs a report once the app is serving.
+"""
+import importlib._bootstrap as _bootstrap
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_started_at = time.perf_counter()
+# (module name, nesting depth, cumulative seconds, self seconds), in completion order
+_imports: List[Tuple[str, int, float, float]] = []
+_phases: List[Tuple[str, float]] = []
+_stack: List[float] = [] # Time spent in child imports, per active import
+_original_find_and_load = None
+
+def _timed_find_and_load(name, import_):
+    _stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_find_and_load(name, import_)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _imports.append((name, len(_stack), elapsed, elapsed - children))
+
+def enable() -> None:
+    """Start timing imports and phases. Call before the heavy imports in main.py."""
+    global _enabled, _started_at, _original_find_and_load
+    if _enabled:
+        return
+    _enabled = True
+    _started_at = time.perf_counter()
+    # Every import statement goes through importlib._bootstrap._find_and_load
+    if hasattr(_bootstrap, '_find_and_load'):
+        _original_find_and_load = _bootstrap._find_and_load
+        _bootstrap._find_and_load = _timed_find_and_load
+    else:
+        logger.warning("Import timing is not supported on this Python version; only phases are profiled")
+
+def is_enabled() -> bool:
+    return _enabled
+
+@contextmanager
+def phase(name: str):
+    """Time an initialization phase; a no-op unless profiling is enabled."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+def report(top: int = 25) -> str:
+    """Stop import timing and log the slowest imports and all phases."""
+    global _original_find_and_load
+    if _original_find_and_load is not None:
+        _bootstrap._find_and_load = _original_find_and_load
+        _original_find_and_load = None
+
+    # Aggregate by top-level package so a library's submodules are reported together
+    packages: Dict[str, float] = {}
+    for name, _, _, self_time in _imports:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + self_time
+
+    lines = [f"Startup profile: serving after {time.perf_counter() - _started_at:.3f}s"]
+    lines.append(f"Slowest imports (cumulative / self, {len(_imports)} modules):")
+    for name, depth, cumulative, self_time in sorted(_imports, key=lambda i: i[2], reverse=True)[:top]:
+        lines.append(f"  {cumulative * 1000:9.1f}ms {self_time * 1000:9.1f}ms  {'  ' * min(depth, 6)}{name}")
+    lines.append("Import time by package (self):")
+    for package, total in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:top]:
+        lines.append(f"  {total * 1000:9.1f}ms  {package}")
+    lines.append("Initialization phases:")
+    for name, elapsed in _phases:
+        lines.append(f"  {elapsed * 1000:9.1f}ms  {name}")
+    text = "\n".join(lines)
+    logger.info(text)
+    return text
@@ -0,0 +1,41 @@
+/* Chat page scripts (loaded once): code block copy buttons and keyboard shortcuts */
+function copyCode(button) {
+    const pre = button.parentElement;
+    const code = pre.querySelector('code');
+    if (navigator.clipboard && code) {
+        navigator.clipboard.writeText(code.innerText).then(() => { button.textContent='Copied!'; setTimeout(()=>button.textContent='Copy',2000); });
+    }
+}
+function enhanceCodeBlock(pre) {
+    if (pre.dataset.enhanced) return;
+    pre.dataset.enhanced = '1';
+    const btn = document.createElement('button'); btn.className='copy-button'; btn.textContent='Copy'; btn.onclick=function(){copyCode(this);}; pre.appendChild(btn);
+}
+// Enhance the code blocks of chat bubbles in (or at) a subtree
+function enhanceCodeBlocks(root) {
+    if (root.matches && root.matches('.chat-bubble pre')) enhanceCodeBlock(root);
+    root.querySelectorAll('.chat-bubble pre').forEach(enhanceCodeBlock);
+}
+// Code blocks are enhanced as they appear, so the server never has to ask for it.
+// A streaming reply only appends text nodes, which are skipped here; its code blocks
+// appear once the finished reply is swapped in as rendered HTML. Opening a conversation
+// adds many bubbles at once, so added subtrees are collected and handled once per
+// animation frame instead of rescanning the page per mutation.
+const pendingRoots = new Set();
+function flushPendingRoots() {
+    pendingRoots.forEach(root => { if (root.isConnected) enhanceCodeBlocks(root); });
+    pendingRoots.clear();
+}
+new MutationObserver((mutations) => {
+    const wasEmpty = pendingRoots.size === 0;
+    mutations.forEach(m => m.addedNodes.forEach(node => {
+        if (node.nodeType === 1 && (node.matches('pre') || node.querySelector('pre'))) pendingRoots.add(node);
+    }));
+    if (wasEmpty && pendingRoots.size) requestAnimationFrame(flushPendingRoots);
+}).observe(document.documentElement, { childList: true, subtree: true });
+// The script is deferred, so anything rendered before it ran is already in the DOM
+enhanceCodeBlocks(document);
+
+document.addEventListener('keydown', function(event) {
+    if (event.ctrlKey && (event.key==='c' || event.key==='C')) { event.preventDefault(); window.close(); }
+});
@@ -0,0 +1,75 @@
+"""
+Generation statistics per model and day, for sizing hardware and picking models.
+
+Every assistant reply stores Ollama's token counts and timings next to its
+text (see llm.generation_stats). This module turns the per-day sums from the
+storage backend into throughput and latency figures:
+
+    python -m app.stats [--days 30]
+    GET /api/admin/generation-stats?days=30   (admin only, see app/admin.py)
+
+Archived conversations (see app/archive.py) are not included.
+"""
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import Depends
+from nicegui import app
+
+from . import db
+from .admin import require_admin
+
+DEFAULT_DAYS = 30
+
+def _rate(tokens: float, duration_ns: float) -> Optional[float]:
+    return round(tokens / (duration_ns / 1e9), 1) if duration_ns else None
+
+def _percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of values, None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def summarize(group: Dict[str, Any]) -> Dict[str, Any]:
+    """Derive throughput and latency figures from one aggregated (model, day) group."""
+    replies = group['replies']
+    loads = [value / 1e6 for value in group.get('load_durations') or [] if value is not None]
+    return {
+        'model': group['model'],
+        'day': group['day'],
+        'replies': replies,
+        'output_tokens': group['eval_count'],
+        'prompt_tokens': group['prompt_eval_count'],
+        'tokens_per_sec': _rate(group['eval_count'], group['eval_duration']),
+        'prompt_tokens_per_sec': _rate(group['prompt_eval_count'], group['prompt_eval_duration']),
+        'prompt_eval_ms_per_reply': round(group['prompt_eval_duration'] / 1e6 / replies, 1) if replies else None,
+        'total_ms_per_reply': round(group['total_duration'] / 1e6 / replies, 1) if replies else None,
+        'load_ms_p50': _percentile(loads, 50),
+        'load_ms_p95': _percentile(loads, 95),
+        'load_ms_max': max(loads, default=None),
+    }
+
+def report(days: float = DEFAULT_DAYS) -> List[Dict[str, Any]]:
+    """Statistics for the last `days` days, one entry per model and day (blocking)."""
+    return [summarize(group) for group in db.generation_stats(time.time() - days * 86400)]
+
+@app.get('/api/admin/generation-stats', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def generation_stats_endpoint(days: float = DEFAULT_DAYS) -> List[Dict[str, Any]]:
+    return await db.run_async(report, days)
+
+def _format(value: Any) -> str:
+    if value is None:
+        return '-'
+    return f"{value:.1f}" if isinstance(value, float) else str(value)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print generation statistics per model and day.")
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS)
+    args = parser.parse_args()
+    columns = ('day', 'model', 'replies', 'output_tokens', 'tokens_per_sec', 'prompt_tokens_per_sec',
+               'prompt_eval_ms_per_reply', 'load_ms_p50', 'load_ms_p95')
+    print('\t'.join(columns))
+    for row in report(args.days):
+        print('\t'.join(_format(row[column]) for column in columns))
@@ -0,0 +1,100 @@
+"""
+Local conversation titles from keyphrase extraction, without a model call.
+
+Uses RAKE (Rapid Automatic Keyword Extraction): the opening user turns are
+split into candidate phrases at stopwords and punctuation, each word is scored
+by degree/frequency, and the best phrases are joined in their original order.
+"""
+import re
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+MAX_TITLE_WORDS = 6
+MAX_TITLE_PHRASES = 3
+# Only the opening user turns decide what a conversation is about
+TITLE_TURNS = 3
+FALLBACK_TITLE = 'Chat'
+
+# English function words plus the filler of chat requests ("can you please help me ...")
+STOPWORDS = frozenset('''
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing done down during each either else etc even ever every
+few for from further get gets getting give go going got had has have having he her here hers herself
+him himself his how however i if in into is it its itself just let lets like made make many may me
+might mine more most much must my myself need needs no nor not now of off on once one only or other
+our ours ourselves out over own please quite rather really same she should so some something such
+than that the their theirs them themselves then there these they thing things this those through to
+too under until up upon us use used using very via want wants was way we well were what whats when
+where whether which while who whom whose why will with within without would yes yet you your yours
+yourself yourselves hi hello hey thanks thank ok okay sure help tell show explain know think try
+trying question questions mean means anyone someone somebody best good new way ways instead im ive
+id dont doesnt cant isnt wont
+'''.split())
+
+_CODE_BLOCK = re.compile(r'```.*?(```|$)', re.DOTALL)
+_INLINE_CODE = re.compile(r'`[^`]*`')
+_URL = re.compile(r'https?://\S+')
+# Phrases never span punctuation or line breaks
+_FRAGMENT_SPLIT = re.compile(r'[,;:!?()\[\]{}<>"“”\n，、。；：！？（）「」]|\.(?=\s|$)')
+# Any Unicode letter or digit starts a word, so non-English prompts get titles too
+_WORD = re.compile(r"[^\W_][\w+#.'-]*")
+
+def _clean(text: str) -> str:
+    return _URL.sub(' ', _INLINE_CODE.sub(' ', _CODE_BLOCK.sub(' ', text)))
+
+def candidate_phrases(text: str) -> List[List[str]]:
+    """Split text into runs of consecutive non-stopwords, in order of appearance."""
+    phrases = []
+    for fragment in _FRAGMENT_SPLIT.split(_clean(text)):
+        phrase: List[str] = []
+        for word in _WORD.findall(fragment):
+            word = word.rstrip(".'-")
+            key = word.lower().replace("'", '')
+            if key in STOPWORDS or key.isdigit():
+                if phrase:
+                    phrases.append(phrase)
+                phrase = []
+            else:
+                phrase.append(word)
+        if phrase:
+            phrases.append(phrase)
+    return phrases
+
+def keyphrases(text: str) -> List[Tuple[float, int, List[str]]]:
+    """Return (score, position, words) for each distinct candidate phrase, best first."""
+    phrases = candidate_phrases(text)
+    frequency: Dict[str, int] = defaultdict(int)
+    degree: Dict[str, int] = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word.lower()] += 1
+            degree[word.lower()] += len(phrase)
+    ranked = {}
+    for position, phrase in enumerate(phrases):
+        key = ' '.join(word.lower() for word in phrase)
+        if key not in ranked:
+            score = sum(degree[word.lower()] / frequency[word.lower()] for word in phrase)
+            ranked[key] = (score, position, phrase)
+    return sorted(ranked.values(), key=lambda item: (-item[0], item[1]))
+
+def _title_case(word: str) -> str:
+    # Leave words with their own capitalization (NumPy, iOS, API) alone
+    return word[0].upper() + word[1:] if word.islower() else word
+
+def title_from_text(text: str) -> str:
+    """Build a short title from the best keyphrases of a text."""
+    chosen = []
+    words = 0
+    for score, position, phrase in keyphrases(text):
+        if len(chosen) == MAX_TITLE_PHRASES or words + len(phrase) > MAX_TITLE_WORDS:
+            if chosen:
+                break
+            phrase = phrase[:MAX_TITLE_WORDS] # A single phrase longer than a title
+        chosen.append((position, phrase))
+        words += len(phrase)
+    return ' '.join(_title_case(word) for _, phrase in sorted(chosen) for word in phrase)
+
+def title_from_messages(messages: Sequence[Sequence[str]], user_name: str = 'You') -> str:
+    """Title a conversation from its opening user turns."""
+    turns = [message[1] for message in messages if message[0] == user_name and message[1].strip()][:TITLE_TURNS]
+    return title_from_text('\n'.join(turns)) or FALLBACK_TITLE
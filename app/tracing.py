@@ -0,0 +1,244 @@
+"""
+Lightweight per-request span tracing.
+
+A trace starts when the user sends a message (`trace()` in chat_page.send) and
+gets a request ID. Spans opened while handling it (the LLM call, saving,
+summaries, storage writes) attach to it through a context variable, which
+asyncio tasks and db.run_async carry along. Once the last span has ended the
+trace is handed to a background thread that appends it as one JSON line to
+TRACE_FILE (the event loop never waits on the disk), with span offsets relative
+to the start of the request, so a slow reply can be laid out as a waterfall:
+
+    python -m app.tracing traces.jsonl [--last 5]
+
+TRACE_SAMPLE_RATE (0 to 1, default 0) decides which requests are recorded;
+unsampled requests still get a request ID but record nothing.
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+
+# Finished traces waiting for the writer thread; None stops it
+_pending: 'queue.SimpleQueue[Optional[Trace]]' = queue.SimpleQueue()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+class Trace:
+    """The spans recorded for one request."""
+
+    def __init__(self, name: str, sampled: bool):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._spans: List[Dict[str, Any]] = []
+        self._open = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.exported = False
+
+    def offset_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 2)
+
+    def _opened(self) -> int:
+        with self._lock:
+            self._open += 1
+            self._next_id += 1
+            return self._next_id
+
+    def _closed(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._spans.append(record)
+            self._open -= 1
+            finished = self._open == 0
+            self.exported = self.exported or finished
+        # Spans of background work (e.g. a title upgrade) keep the trace open until they end
+        if finished:
+            export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'request_id': self.request_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': max((s['start_ms'] + s['duration_ms'] for s in self._spans), default=0),
+            'spans': sorted(self._spans, key=lambda s: s['start_ms']),
+        }
+
+class Span:
+    """A timed operation within a trace; use as a context manager or call end()."""
+
+    def __init__(self, trace: Optional[Trace], name: str, parent: Optional['Span'], attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = trace._opened() if trace else 0
+        self.start_ms = trace.offset_ms() if trace else 0
+        self.events: List[Dict[str, Any]] = []
+        self._ended = False
+
+    def set(self, **attrs: Any) -> None:
+        """Add attributes to the span."""
+        if self.trace:
+            self.attrs.update(attrs)
+
+    def event(self, name: str, **attrs: Any) -> None:
+        """Mark a point in time within the span (e.g. the first token)."""
+        if self.trace:
+            self.events.append({'name': name, 'at_ms': self.trace.offset_ms(), **attrs})
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self._ended or not self.trace:
+            return
+        self._ended = True
+        if error is not None:
+            self.attrs['error'] = repr(error)
+        self.trace._closed({
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start_ms': self.start_ms,
+            'duration_ms': round(self.trace.offset_ms() - self.start_ms, 2),
+            'attrs': self.attrs,
+            'events': self.events,
+        })
+
+# Spans are only recorded for sampled traces; everything else gets this no-op span
+_NOOP = Span(None, '', None, {})
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('span', default=None)
+
+def request_id() -> Optional[str]:
+    """The request ID of the trace being handled, if any."""
+    current = _current_trace.get()
+    return current.request_id if current else None
+
+def start_span(name: str, **attrs: Any) -> Span:
+    """Open a child of the current span without making it current.
+
+    Use this in async generators, which can't safely set context variables
+    across yields; call end() on the returned span.
+    """
+    current = _current_trace.get()
+    # Work started after the trace was written can't be added to it
+    if current is None or not current.sampled or current.exported:
+        return _NOOP
+    return Span(current, name, _current_span.get(), attrs)
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """Time a block as a child of the current span."""
+    current = start_span(name, **attrs)
+    token = _current_span.set(current) if current is not _NOOP else None
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+        current.end()
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[Span]:
+    """Start a new trace for a request; its root span covers the block."""
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    trace_token = _current_trace.set(Trace(name, sampled))
+    span_token = _current_span.set(None)
+    try:
+        with span(name, **attrs) as root:
+            yield root
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+def _write_pending() -> None:
+    """Writer thread: append queued traces to TRACE_FILE, everything queued so far in one write."""
+    stopping = False
+    while not stopping:
+        batch = [_pending.get()]
+        while not _pending.empty():
+            batch.append(_pending.get())
+        stopping = None in batch
+        traces = [finished for finished in batch if finished is not None]
+        if not traces:
+            continue
+        lines = ''.join(json.dumps(finished.to_dict(), ensure_ascii=False, default=str) + '\n' for finished in traces)
+        try:
+            with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f"Failed to write {len(traces)} traces: {e}")
+
+def export(finished: Trace) -> None:
+    """Queue a finished trace to be appended to TRACE_FILE by the writer thread."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_pending, name='trace-writer', daemon=True)
+            _writer.start()
+    _pending.put(finished)
+
+def flush(timeout: float = 5) -> None:
+    """Write the queued traces and stop the writer thread; the next export starts a new one."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        _pending.put(None)
+        writer.join(timeout)
+
+# Traces still queued at shutdown are written before the process exits
+atexit.register(flush)
+
+def format_waterfall(doc: Dict[str, Any], width: int = 40) -> str:
+    """Render one exported trace as a text waterfall."""
+    total = doc['duration_ms'] or 1
+    depth = {None: -1}
+    lines = [f"{doc['request_id']} {doc['name']} {doc['duration_ms']:.0f} ms"]
+    for s in doc['spans']:
+        depth[s['id']] = depth.get(s['parent'], -1) + 1
+        start = int(s['start_ms'] / total * width)
+        length = max(1, int(s['duration_ms'] / total * width))
+        bar = ' ' * start + '#' * min(length, width - start)
+        label = '  ' * depth[s['id']] + s['name']
+        lines.append(f"  {label:<32} |{bar:<{width}}| {s['start_ms']:>8.0f} +{s['duration_ms']:.0f} ms")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print request latency waterfalls from a trace file.")
+    parser.add_argument('path', nargs='?', default=TRACE_FILE)
+    parser.add_argument('--last', type=int, default=5, help="number of most recent traces to show")
+    parser.add_argument('--request-id', help="show only this request")
+    args = parser.parse_args()
+    with open(args.path, encoding='utf-8') as f:
+        docs = [json.loads(line) for line in f if line.strip()]
+    if args.request_id:
+        docs = [d for d in docs if d['request_id'] == args.request_id]
+    for doc in docs[-args.last:]:
+        print(format_waterfall(doc))
+        print()
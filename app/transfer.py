@@ -0,0 +1,209 @@
+"""
+Streaming bulk export and import of conversations as JSONL.
+
+Each line is one conversation: {"id": ..., "messages": [...], "summary": ...}.
+Files ending in .gz (or starting with the gzip magic bytes) are compressed.
+Export streams from a storage cursor and import upserts in batches, so memory
+use stays flat regardless of the number of conversations. An interrupted file
+import resumes from the last committed line, recorded in <file>.progress.
+
+CLI:
+    python -m app.transfer export backup.jsonl.gz
+    python -m app.transfer import backup.jsonl.gz [--batch-size 500] [--restart]
+
+HTTP (admin only, see app/admin.py):
+    GET  /api/conversations/export?compress=true
+    POST /api/conversations/import?skip=<lines already imported>
+
+Timestamps are exported as ISO strings and turned back into datetimes on import.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import sys
+import zlib
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from nicegui import app
+
+from . import compression
+from . import db
+from .admin import require_admin
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+_GZIP_MAGIC = b'\x1f\x8b'
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, tuple):
+        return list(value)
+    return str(value)
+
+def to_line(conversation_id: str, conversation: Dict[str, Any]) -> bytes:
+    """Serialize one conversation as a JSONL line, with plain (uncompressed) messages."""
+    if conversation.get('archive') or conversation.get('messages'):
+        conversation = dict(conversation)
+        compression.messages_of(conversation)
+    return json.dumps({'id': conversation_id, **conversation}, ensure_ascii=False, default=_json_default).encode() + b'\n'
+
+def from_line(line: bytes) -> Tuple[str, Dict[str, Any]]:
+    """Parse one JSONL line into (id, conversation)."""
+    doc = json.loads(line)
+    return doc.pop('id'), doc
+
+def iter_export_lines(batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    """Yield every stored conversation as a JSONL line."""
+    for conversation_id, conversation in db.get_store().iter_conversations(batch_size):
+        yield to_line(conversation_id, conversation)
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compress a byte stream incrementally into gzip format."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_to_file(path: Path, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Export all conversations to a JSONL file, gzip-compressed if it ends in .gz."""
+    count = 0
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'wb') as f:
+        for line in iter_export_lines(batch_size):
+            f.write(line)
+            count += 1
+    logger.info(f"Exported {count} conversations to {path}")
+    return count
+
+def _open_input(path: Path) -> IO[bytes]:
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    return gzip.open(path, 'rb') if magic == _GZIP_MAGIC else open(path, 'rb')
+
+def import_lines(lines: Iterable[bytes], batch_size: int = DEFAULT_BATCH_SIZE, skip: int = 0,
+                 on_commit=None) -> int:
+    """Upsert conversations from JSONL lines in batches; returns the number of lines consumed.
+
+    Blank lines are not counted, here and in the HTTP import, so a `skip` offset
+    works for both. The first `skip` lines are ignored. `on_commit(lines_consumed)`
+    is called after each batch.
+    """
+    batch: List[Tuple[str, Dict[str, Any]]] = []
+    position = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        position += 1
+        if position <= skip:
+            continue
+        batch.append(from_line(line))
+        if len(batch) >= batch_size:
+            db.import_conversations(batch)
+            batch = []
+            if on_commit:
+                on_commit(position)
+    if batch:
+        db.import_conversations(batch)
+    if on_commit:
+        on_commit(max(position, skip))
+    return max(position, skip)
+
+def import_from_file(path: Path, batch_size: int = DEFAULT_BATCH_SIZE, resume: bool = True) -> int:
+    """Import a JSONL export, resuming after the last committed batch of an earlier run."""
+    progress_file = path.with_name(path.name + '.progress')
+    skip = int(progress_file.read_text() or 0) if resume and progress_file.exists() else 0
+    if skip:
+        logger.info(f"Resuming import of {path} after line {skip}")
+    with _open_input(path) as f:
+        consumed = import_lines(f, batch_size, skip, on_commit=lambda n: progress_file.write_text(str(n)))
+    progress_file.unlink(missing_ok=True)
+    logger.info(f"Imported {consumed - skip} lines from {path}")
+    return consumed
+
+@app.get('/api/conversations/export', include_in_schema=False, dependencies=[Depends(require_admin)])
+def export_endpoint(compress: bool = False, batch_size: int = DEFAULT_BATCH_SIZE) -> StreamingResponse:
+    # Starlette iterates sync generators on its thread pool, off the event loop
+    lines = iter_export_lines(batch_size)
+    if compress:
+        return StreamingResponse(iter_gzip(lines), media_type='application/gzip',
+                                 headers={'Content-Disposition': 'attachment; filename="conversations.jsonl.gz"'})
+    return StreamingResponse(lines, media_type='application/x-ndjson',
+                             headers={'Content-Disposition': 'attachment; filename="conversations.jsonl"'})
+
+async def _iter_request_lines(request: Request) -> AsyncIterator[bytes]:
+    decompressor: Optional[Any] = None
+    buffer = b''
+    first = True
+    async for chunk in request.stream():
+        if first:
+            first = False
+            if chunk[:2] == _GZIP_MAGIC:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line
+    if decompressor:
+        buffer += decompressor.flush()
+    for line in buffer.split(b'\n'):
+        yield line
+
+@app.post('/api/conversations/import', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def import_endpoint(request: Request, skip: int = 0, batch_size: int = DEFAULT_BATCH_SIZE) -> JSONResponse:
+    """Import a (optionally gzipped) JSONL body. On failure, retry with skip=<committed>."""
+    batch: List[Tuple[str, Dict[str, Any]]] = []
+    # Lines are counted from the top of the body, like import_lines, so the first `skip` are passed over
+    position = 0
+    committed = skip
+    try:
+        async for line in _iter_request_lines(request):
+            if not line.strip():
+                continue
+            position += 1
+            if position <= skip:
+                continue
+            batch.append(from_line(line))
+            if len(batch) >= batch_size:
+                await db.run_async(db.import_conversations, batch)
+                batch = []
+                committed = position
+        if batch:
+            await db.run_async(db.import_conversations, batch)
+        committed = max(position, skip)
+    except Exception as e:
+        logger.error(f"Import failed after line {committed}: {e}")
+        return JSONResponse({'committed': committed, 'error': str(e)}, status_code=500)
+    return JSONResponse({'committed': committed})
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m app.transfer', description='Export or import conversations as JSONL.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='write all conversations to a .jsonl or .jsonl.gz file')
+    export_parser.add_argument('path', type=Path)
+    import_parser = subparsers.add_parser('import', help='upsert conversations from a .jsonl or .jsonl.gz file')
+    import_parser.add_argument('path', type=Path)
+    import_parser.add_argument('--restart', action='store_true', help='ignore saved progress and start from the top')
+    for sub in (export_parser, import_parser):
+        sub.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        export_to_file(args.path, args.batch_size)
+    else:
+        import_from_file(args.path, args.batch_size, resume=not args.restart)
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -7,230 +7,83 @@ import os, json, datetime
 import re  # for cleaning titles
 
 # Use relative imports for modules within the app package
+from .. import admission
+from .. import assets
 from .. import config
+from .. import conversations
 from .. import llm
+from .. import memory
 from .. import db  # Import the new db module
+from .. import residency
+from .. import session_state
+from .. import tracing
+from . import compare_view
 from . import message_renderer  # Import the new message renderer
+from . import saved_list
+from . import streaming_message
 
 logger = logging.getLogger(__name__)
 
-# Store chat history per client (remains client-specific)
-chats: Dict[str, List[Tuple[str, str]]] = {}
+# Store chat history per client (remains client-specific), backed by the session store
+chats = session_state.SessionMap('chats')
 # Store selected model per client (client-specific selection)
-selected_models: Dict[str, str] = {}
-session_titles: Dict[str, str] = {}
-# Shared dictionary for saved conversations (now loaded from MongoDB)
+selected_models = session_state.SessionMap('selected_models')
+session_titles = session_state.SessionMap('session_titles')
+# Shared dictionary for saved conversations (a cache of the storage backend, reloaded on each page build)
 saved_conversations: Dict[str, Dict] = {}
+# Branches forked for a regenerated or edited reply, until their first save. Kept apart from
+# saved_conversations, which every page build replaces with a fresh copy from storage.
+pending_branches: Dict[str, Dict] = {}
+# Connected pages per session key; tabs of one browser share its state until the last one leaves
+session_clients: Dict[str, set] = {}
+
+def session_key(client: Client) -> str:
+    """Key of the browser's session state: the id in NiceGUI's session cookie, which
+    survives reloads and is the same on every worker. client.id changes per page load."""
+    try:
+        return f"browser:{app.storage.browser['id']}"
+    except (RuntimeError, KeyError): # No storage_secret configured
+        return client.id
 
 @ui.page('/')
 async def chat_page(client: Client):
-    client_id = client.id
+    client_id = session_key(client)
     cfg = config.get_config()
 
-    # Add consistent styling with config_page
-    ui.add_head_html("""<style>
-        /* Prevent body scrolling */
-        body {
-            overflow: hidden !important; 
-        }
-
-        /* Chat scroll area styling - Adjust height calculation */
-        #chat-scroll { 
-            /* Increase offset for better spacing: header (~60px) + footer (~80px) + padding/margins (~30px) = ~170px */
-            height: calc(100vh - 190px) !important; 
-            overflow-y: auto !important; 
-            scrollbar-width: none; /* Firefox */
-            -ms-overflow-style: none; /* IE and Edge */
-            border-radius: 16px !important;
-            border: 1px solid rgba(148, 163, 184, 0.1) !important;
-            background-color: #1e293b !important;
-        }
-        #chat-scroll::-webkit-scrollbar { 
-            width: 0; /* Webkit browsers - Hide default */
-            height: 0;
-        }
-        /* Optional: Show custom scrollbar on hover if desired */
-        /*
-        #chat-scroll:hover::-webkit-scrollbar { width: 6px; }
-        #chat-scroll:hover::-webkit-scrollbar-thumb { background-color: rgba(98, 114, 164, 0.5); border-radius: 3px; }
-        #chat-scroll:hover { scrollbar-width: thin; scrollbar-color: rgba(98, 114, 164, 0.5) transparent; } 
-        */
-
-        /* Chat bubble markdown styling - Enhanced for lists */
-        .chat-bubble h1 { font-size:1em; margin:0.4em 0; }
-        .chat-bubble h2 { font-size:0.95em; margin:0.35em 0; }
-        .chat-bubble h3 { font-size:0.9em; margin:0.3em 0; }
-        .chat-bubble p, .chat-bubble li { font-size:0.9em; line-height:1.4; }
-        .chat-bubble p { margin:0.2em 0 !important; }
-        .chat-bubble ul, .chat-bubble ol { margin-left:1em; margin-bottom:0.5em; }
-        /* Enhanced list styling for better spacing and clarity */
-        .chat-bubble ol { padding-left:1.5em !important; margin-top:0.5em !important; }
-        .chat-bubble ul { padding-left:1.5em !important; margin-top:0.5em !important; }
-        .chat-bubble li { margin-bottom:0.25em !important; }
-        .chat-bubble ol > li { padding-left:0.3em !important; }
-        .chat-bubble ul > li { padding-left:0.2em !important; }
-        .chat-bubble code { background:#334155; color:#f8fafc; padding:2px 4px; border-radius:4px; font-family:'Fira Code', monospace; font-size:0.85em; user-select:text; }
-        .chat-bubble pre { background:#334155; padding:12px; padding-top:30px; border-radius:12px; overflow-x:auto; font-family:'Fira Code', monospace; font-size:0.85em; margin:0.5em 0; position:relative; user-select:text; }
-        .chat-bubble pre code { background:none; }
-        
-        /* User message styling */
-        .user-message {
-            background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%) !important;
-            color: white !important;
-            border: none !important;
-            box-shadow: 0 4px 15px rgba(99, 102, 241, 0.2) !important;
-        }
-        
-        /* Bot message styling */
-        .bot-message {
-            background-color: #1e293b !important;
-            border: 1px solid rgba(148, 163, 184, 0.2) !important;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1) !important;
-        }
-        
-        /* Copy button styling */
-        .copy-button { 
-            position:absolute; 
-            top:5px; 
-            right:5px; 
-            background:#475569; 
-            color:#f8fafc; 
-            border:none; 
-            padding:3px 8px; 
-            border-radius:6px; 
-            cursor:pointer; 
-            font-size:0.75em; 
-            opacity:0.7; 
-            transition:opacity 0.2s; 
-        }
-        .copy-button:hover { opacity:1; background:#6366f1; }
-        .copy-button:active { background:#4f46e5; }
-        
-        /* Avatar styling */
-        .avatar-img {
-            border: 2px solid rgba(148, 163, 184, 0.2);
-            transition: all 0.2s;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.15);
-        }
-        .user-avatar {
-            border-color: rgba(99, 102, 241, 0.5) !important;
-        }
-        .bot-avatar {
-            border-color: rgba(6, 182, 212, 0.5) !important;
-        }
-        
-        /* Input styling - matching config_page */
-        .chat-input {
-            border-radius: 12px !important;
-            transition: all 0.2s !important;
-            border: 1px solid rgba(148, 163, 184, 0.2) !important;
-            background-color: #334155 !important;
-        }
-        .chat-input:focus {
-            border-color: #6366f1 !important;
-            box-shadow: 0 0 0 2px rgba(99, 102, 241, 0.3) !important;
-        }
-        
-        /* Button styling - matching config_page */
-        .chat-button {
-            transition: all 0.2s !important;
-            border-radius: 12px !important;
-            font-weight: 500 !important;
-        }
-        .chat-button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2) !important;
-        }
-        
-        /* Drawer styling - Allow vertical scroll ONLY if needed, hide default bar */
-        .chat-drawer {
-            background-color: #1e293b !important;
-            box-shadow: 0 0 20px rgba(0, 0, 0, 0.3) !important;
-            border-right: 1px solid rgba(148, 163, 184, 0.1) !important;
-            overflow-y: auto; /* Allow scroll if content overflows */
-            overflow-x: hidden; /* Prevent horizontal scroll */
-            scrollbar-width: none; /* Firefox */
-            -ms-overflow-style: none; /* IE and Edge */
-        }
-        .chat-drawer::-webkit-scrollbar {
-             width: 0; /* Webkit browsers - Hide default */
-             height: 0;
-        }
-        /* Ensure card inside drawer doesn't cause unexpected overflow */
-        .chat-drawer > .ni-card {
-             overflow: visible !important; /* Let drawer handle scroll */
-             box-shadow: none !important;
-        }
-        
-        /* Saved chat item styling */
-        .saved-chat-item {
-            border-radius: 12px !important;
-            transition: all 0.2s !important;
-            overflow: hidden !important;
-        }
-        .saved-chat-item:hover {
-            background-color: rgba(99, 102, 241, 0.1) !important;
-            transform: translateX(3px);
-        }
-        
-        /* Header and footer styling */
-        .chat-header, .chat-footer {
-            background-color: rgba(15, 23, 42, 0.8) !important;
-            backdrop-filter: blur(10px) !important;
-            border-bottom: 1px solid rgba(148, 163, 184, 0.1) !important;
-        }
-        .chat-footer {
-            border-top: 1px solid rgba(148, 163, 184, 0.1) !important;
-            border-bottom: none !important;
-        }
-        
-        /* Model selector styling */
-        .model-selector {
-            border-radius: 12px !important;
-            background-color: #334155 !important;
-            border: 1px solid rgba(148, 163, 184, 0.2) !important;
-        }
-    </style>""")
-    
-    ui.add_head_html("""<script>
-        function copyCode(button) {
-            const pre = button.parentElement;
-            const code = pre.querySelector('code');
-            if (navigator.clipboard && code) {
-                navigator.clipboard.writeText(code.innerText).then(() => { button.textContent='Copied!'; setTimeout(()=>button.textContent='Copy',2000); });
-            }
-        }
-        function addCopyButtons() {
-            document.querySelectorAll('.chat-bubble pre').forEach(pre => {
-                if (pre.querySelector('.copy-button')) return;
-                const btn = document.createElement('button'); btn.className='copy-button'; btn.textContent='Copy'; btn.onclick=function(){copyCode(this);}; pre.appendChild(btn);
-            });
-        }
-        // Wait for the DOM to be fully loaded before running scripts that access it
-        document.addEventListener('DOMContentLoaded', () => {
-            addCopyButtons(); // Initial call
-            // Initialize the observer *after* the DOM is ready
-            new MutationObserver((mutations) => { 
-                mutations.forEach(m => m.addedNodes.forEach(node => { 
-                    // Check if the added node is an element and contains or is a 'pre' tag
-                    if (node.nodeType === 1 && (node.matches('pre') || node.querySelector('pre'))) {
-                        addCopyButtons(); 
-                    }
-                })); 
-            }).observe(document.body, { childList: true, subtree: true });
-        });
-    </script>
-    <script>
-      document.addEventListener('keydown', function(event) {
-          if (event.ctrlKey && (event.key==='c' || event.key==='C')) { event.preventDefault(); window.close(); }
-      });
-    </script>""")
-
-    # Initialize client state
-    chats[client_id] = []
-    load_saved_conversations()
+    # Add consistent styling with config_page (content-hashed static files, cached by the browser)
+    ui.add_head_html(assets.link_tags('css/chat.css', 'css/codehilite.css', 'js/chat.js'))
+
+    # Pick up the state of an earlier page load (a reload, another tab or worker), else start empty
+    await asyncio.gather(*(state.load(client_id) for state in (chats, selected_models, session_titles)))
+    session_clients.setdefault(client_id, set()).add(client.id)
+    if client_id not in chats:
+        chats[client_id] = []
+    await load_saved_conversations()
     current_default_model = config.get_default_model() or ''
-    selected_models[client_id] = current_default_model
+    if not selected_models.get(client_id):
+        selected_models[client_id] = current_default_model
+    # A branch that was never saved is gone; its transcript is saved as a new conversation
+    if session_titles.get(client_id) not in saved_conversations and session_titles.get(client_id) not in pending_branches:
+        session_titles[client_id] = ''
+    elif session_titles[client_id]:
+        await conversations.load_archived(saved_conversations, session_titles[client_id])
+
+    # Local copies are dropped when the session's last page disconnects (another tab may
+    # still be streaming into them); the store keeps them until SESSION_TTL_SECONDS
+    def forget_session():
+        clients = session_clients.get(client_id, set())
+        clients.discard(client.id)
+        if clients:
+            return
+        session_clients.pop(client_id, None)
+        pending_branches.pop(session_titles.get(client_id), None)
+        for state in (chats, selected_models, session_titles):
+            state.forget(client_id)
+    client.on_disconnect(forget_session)
+    # Replies are admitted one at a time per page; rate limits apply per browser session,
+    # since clients behind one proxy or NAT share an address
+    conversation_key = f"client:{client_id}"
+    user_key = f"user:{client_id}"
 
     # Helper: reset to a new chat session
     def new_chat():
@@ -244,65 +97,195 @@ async def chat_page(client: Client):
             title_label.set_text('New Conversation')
             title_label.update()
 
-    # Helper: load a saved conversation
-    def load_conversation(title: str):
+    # Helper: load a saved conversation (or one of its branches)
+    async def load_conversation(title: str):
+        # Archived conversations are listed without their messages; opening one restores it
+        await conversations.load_archived(saved_conversations, title)
         entry = saved_conversations.get(title, {})
-        chats[client_id] = entry.get('messages', [])
-        chat_messages.refresh()
-        # set session title to this key
+        # Reuse HTML rendered when the conversation was saved, if it was persisted
+        message_renderer.prime_cache(entry.get('rendered'))
+        # Branches store only their own messages; the shared prefix comes from the parent
+        chats[client_id] = conversations.resolve_messages(saved_conversations.get, title)
+        # set session title to this key (before rendering, branch navigation depends on it)
         session_titles[client_id] = title
+        chat_messages.refresh()
         # display only the human title (strip timestamp, Title Case)
         display_title = format_display_title(title, max_len=70)  # Use longer title in header
         if title_label:
             title_label.set_text(display_title)
             title_label.update()
 
-    # initialize per-session title (empty until first save)
-    session_titles[client_id] = ''
-
     # Placeholder for header title label
     title_label = None
 
+    # Storage cell of a message in the current conversation, None before the first save
+    def message_cell(idx: int):
+        conversation_id = session_titles.get(client_id)
+        if idx < 0 or not conversation_id:
+            return None
+        return conversations.message_cell(lookup_conversation, conversation_id, idx)
+
     # Handler: send user message and stream assistant response
     async def send(e=None):
         user_text = text.value.strip()
         if not user_text:
             return
-        chats[client_id].append(('You', user_text))
-        chat_messages.refresh()
+        queued = admission.controller.busy(conversation_key)
+        ticket = admit(user_text)
+        if ticket is None:
+            return
         text.value = ''
-        # Include summary if this conversation was previously saved
-        last_title = list(saved_conversations.keys())[-1] if saved_conversations else None
-        summary = saved_conversations.get(last_title, {}).get('summary', '') if last_title else ''
-        system_prompt = summary + '\n\n' if summary else None
+        if queued:
+            ui.notify('Message queued until the current reply is finished', color='info', position='top')
+        # Everything until the reply is saved is timed under one request ID
+        with tracing.trace('chat.send', client_id=client_id, model=selected_models.get(client_id) or ''):
+            with tracing.span('admission.wait'):
+                await ticket.acquire()
+            try:
+                # Appended only now, so queued messages never interleave with a streaming reply
+                chats[client_id].append(('You', user_text))
+                chats.sync(client_id)
+                await stream_reply(user_text)
+            finally:
+                ticket.release()
+
+    # Check the limits for a new reply; notifies the user and returns None if it is refused
+    def admit(user_text: str, key: str = conversation_key):
+        try:
+            return admission.controller.admit(key, user_key, user_text)
+        except admission.AdmissionError as error:
+            ui.notify(str(error), color='warning', position='top')
+            return None
+
+    # Fork the conversation before message idx and answer user_text in the new branch
+    async def branch_from(idx: int, user_text: str, edited: bool):
+        if streaming['idx'] is not None:
+            return
+        ticket = admit(user_text)
+        if ticket is None:
+            return
+        async with ticket:
+            with tracing.trace('chat.edit' if edited else 'chat.regenerate', client_id=client_id, index=idx):
+                if not session_titles.get(client_id):
+                    await save_current_conversation(open_drawer=False)
+                branch_id, branch = conversations.fork(lookup_conversation, session_titles[client_id], idx)
+                # Kept in memory only until the reply is saved; nothing is copied from the parent
+                pending_branches[branch_id] = branch
+                saved_conversations[branch_id] = branch
+                session_titles[client_id] = branch_id
+                chats[client_id] = chats[client_id][:idx] + ([('You', user_text)] if edited else [])
+                chats.sync(client_id)
+                await stream_reply(user_text)
+
+    # Handler: answer the user message before reply idx again, in a new branch
+    async def regenerate(idx: int):
+        await branch_from(idx, chats[client_id][idx - 1][1], edited=False)
+
+    # Handler: edit user message idx and continue from it in a new branch
+    async def edit_message(idx: int):
+        if streaming['idx'] is not None:
+            return
+        edit_input.value = chats[client_id][idx][1]
+        edited = await edit_dialog
+        if edited and edited.strip():
+            await branch_from(idx, edited.strip(), edited=True)
+
+    async def switch_branch(branch_id: str):
+        if streaming['idx'] is None and branch_id != session_titles.get(client_id):
+            await load_conversation(branch_id)
+
+    async def stream_reply(user_text: str):
+        chat_messages.refresh()
+        # This conversation's summary (once saved) plus summaries of related past conversations
+        conversation_id = session_titles.get(client_id)
+        summary = saved_conversations.get(conversation_id, {}).get('summary', '') if conversation_id else ''
+        # Other branches of this conversation would only repeat it
+        own_tree = conversations.tree_members(saved_conversations, conversation_id) if conversation_id in saved_conversations else []
+        with tracing.span('memory.recall', indexed=len(memory.index)):
+            system_prompt = conversations.system_prompt_from_summary(await memory.recall(user_text, summary, own_tree))
         
         bot_name = cfg.get('bot_name', 'Bot')
         chats[client_id].append((bot_name, ''))
         # Get the current message index for selective update
         current_msg_idx = len(chats[client_id]) - 1
+        # Stream the reply into an append-only element instead of re-rendering it per token
+        streaming['idx'] = current_msg_idx
         chat_messages.refresh()
+        model_name = selected_models.get(client_id) or ''
+        # Continue from the model context after the previous reply (shared with the parent on a fresh branch)
+        context = conversations.cached_context(model_name, message_cell(current_msg_idx - 2))
+        final = {}
+        # Reasoning of thinking models, kept apart from the reply
+        reasoning = []
+
+        def on_thinking(delta: str):
+            reasoning.append(delta)
+            if len(reasoning) == 1:
+                streaming['thinking'] = True
+                if current_msg_idx in message_components:
+                    message_components[current_msg_idx].refresh()
         
         try:
-            async for chunk in llm.generate_ollama_response(
-                client_id,
-                user_text,
-                selected_models.get(client_id) or '',
-                system_prompt,
-            ):
-                name, prev = chats[client_id][current_msg_idx]
-                chats[client_id][current_msg_idx] = (name, prev + chunk)
-                # Only refresh the specific message component being updated
+            with tracing.span('chat.stream') as stream_span:
+                chunks = 0
+                async for chunk in llm.generate_ollama_response(
+                    client_id,
+                    user_text,
+                    model_name,
+                    system_prompt,
+                    keep_alive=residency.manager.keep_alive_for('chat'),
+                    context=context,
+                    on_done=final.update,
+                    options=admission.generation_options(),
+                    on_thinking=on_thinking,
+                ):
+                    if not chunks:
+                        stream_span.event('first_token')
+                    chunks += 1
+                    name, prev = chats[client_id][current_msg_idx]
+                    chats[client_id][current_msg_idx] = (name, prev + chunk)
+                    # Send just the new text to the streaming bubble
+                    element = streaming['element']
+                    if element is not None and not element.is_deleted:
+                        element.append(chunk)
+                    elif current_msg_idx in message_components:
+                        # The answer started after reasoning (or the bubble was rebuilt)
+                        streaming['thinking'] = False
+                        message_components[current_msg_idx].refresh()
+                    else:
+                        # Fallback to full refresh if message component not found
+                        chat_messages.refresh()
+                stream_span.set(chunks=chunks, chars=len(chats[client_id][current_msg_idx][1]),
+                                reasoning_chars=sum(map(len, reasoning)))
+            # Token counts and timings are stored with the reply, and so is its reasoning unless it is dropped
+            meta = llm.generation_stats(model_name, final) if final else {}
+            if reasoning and config.get_config().get('store_reasoning', True):
+                meta['reasoning'] = ''.join(reasoning)
+            if meta:
+                name, reply = chats[client_id][current_msg_idx]
+                chats[client_id][current_msg_idx] = (name, reply, meta)
+            # Replace the streamed text with the rendered reply, this time through the render cache
+            streaming.update(idx=None, element=None, thinking=False)
+            with tracing.span('chat.render'):
                 if current_msg_idx in message_components:
                     message_components[current_msg_idx].refresh()
-                else:
-                    # Fallback to full refresh if message component not found
-                    chat_messages.refresh()
+            # Tokens were appended in place; write the finished reply back to the session store
+            chats.sync(client_id)
             # auto-save conversation after assistant response
             # Pass open_drawer=False to prevent automatic drawer opening
             await save_current_conversation(open_drawer=False)
+            # Ollama's context holds the reasoning tokens too, so it is not continued from
+            conversations.remember_context(model_name, message_cell(current_msg_idx), None if reasoning else final.get('context'))
+            # A branch's first save makes it an alternative at its fork point
+            fork_point = saved_conversations.get(session_titles[client_id], {}).get('fork_point')
+            update_branch_points()
+            if fork_point in message_components:
+                message_components[fork_point].refresh()
         except Exception as e:
             logger.error(f"Error generating response from Ollama: {e}")
+            streaming.update(idx=None, element=None, thinking=False)
             chats[client_id][current_msg_idx] = (bot_name, "Error: Could not connect to Ollama service. Please ensure it's running.")
+            chats.sync(client_id)
             if current_msg_idx in message_components:
                 message_components[current_msg_idx].refresh()
             else:
@@ -310,25 +293,25 @@ async def chat_page(client: Client):
             ui.notify("Failed to get response from Ollama service.", color='negative', position='top')
 
     # Define delete_conversation helper before drawer creation
-    def delete_conversation(title):
+    async def delete_conversation(title):
         if title in saved_conversations:
-            db.delete_conversation(title)
-            del saved_conversations[title]
-            # Use drawer_saved_list instead of saved_list 
-            if drawer_saved_list:
-                drawer_saved_list.refresh()
+            # A drawer entry stands for the conversation and all of its branches
+            members = conversations.tree_members(saved_conversations, title)
+            for member in members:
+                saved_conversations.pop(member, None)
+                await memory.index.remove(member)
+                await db.run_async(db.delete_conversation, member)
+            # Drop just this row from every open drawer
+            saved_list.remove(title)
             ui.notify(f"Conversation deleted", color='info', position='top')
             # Reset to new chat if the current one was deleted
-            if session_titles.get(client_id) == title:
+            if session_titles.get(client_id) in members:
                 new_chat()
     
     # --- Navigation drawer with save/load conversations ---
     # Ensure the drawer itself handles scrolling, not necessarily the card inside
     left_drawer = ui.left_drawer(value=False).props("width=450").classes('chat-drawer')
     
-    # Declare drawer_saved_list before using it
-    drawer_saved_list = None
-    
     with left_drawer:
         # Use nonlocal inside functions, not at this level
         # Removed the wrapping ui.card here, apply styles directly or to drawer items
@@ -340,33 +323,14 @@ async def chat_page(client: Client):
             .props('flat') \
             .classes('w-full text-left text-sm text-white hover:text-primary py-3 mb-3 chat-button mx-4')
         
-        @ui.refreshable
-        def render_saved_list():
-            ui.label('Saved Chats').classes('text-xs text-center opacity-70 my-3 px-4')
-            # sort by timestamp prefix descending
-            # Apply margin/padding to the container or items directly
-            with ui.column().classes('w-full px-4'): # Add padding to the column
-                for key in sorted(saved_conversations.keys(), key=lambda t: t.split('_')[0], reverse=True):
-                    display_title = format_display_title(key, max_len=42)  # Shorter title for drawer items
-                    # Card for item styling, ensure it doesn't cause overflow itself
-                    with ui.card().classes('w-full mb-2 p-0 saved-chat-item bg-transparent border-0 shadow-none'):
-                        with ui.row().classes('w-full justify-between items-center'):
-                            btn = ui.button(display_title, on_click=lambda e, t=key: load_conversation(t)) \
-                                .props('no-caps text-left align=left flat') \
-                                .classes('flex-grow text-left text-sm text-gray-200 hover:text-primary py-2')
-                            # Add delete button
-                            ui.button(icon='delete', on_click=lambda e, t=key: delete_conversation(t)) \
-                                .props('flat round text-negative') \
-                                .classes('text-xs opacity-50 hover:opacity-100')
-        # Assign the drawer_saved_list reference inside the drawer
-        # drawer_saved_list = render_saved_list
-        drawer_saved_list = render_saved_list
-        # Initial render of saved list
-        drawer_saved_list()
-
-    # Remove the old references to saved_list that were outside the drawer
-    # saved_list = render_saved_list  # REMOVED
-    # saved_list()  # REMOVED
+        ui.label('Saved Chats').classes('text-xs text-center opacity-70 my-3 px-4')
+        # One row per conversation tree; saves and deletes update single rows from here on
+        saved_list.SavedChatsList(
+            [(key, drawer_title(key)) for key in saved_conversations if conversations.is_root(saved_conversations, key)],
+            # Open the most recent branch of the conversation
+            on_open=lambda key: load_conversation(conversations.latest_branch(saved_conversations, key)),
+            on_delete=delete_conversation,
+        )
 
     # Helper: save current conversation with summary (title is generated once)
     async def save_current_conversation(open_drawer=True):
@@ -374,24 +338,24 @@ async def chat_page(client: Client):
         if not messages:
             ui.notify("No messages to save", color='warning', position='top')
             return
-        # generate title only once per session
-        if not session_titles[client_id]:
-            raw_title = await generate_conversation_title(messages)
-            # prefix with timestamp for uniqueness
-            prefix = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-            title = f"{prefix}_{raw_title}"
-            session_titles[client_id] = title
-        else:
-            title = session_titles[client_id]
-        summary = await summarize_conversation(messages)
-        saved_conversations[title] = {'messages': messages, 'summary': summary}
-        
-        # Save to MongoDB instead of JSON file
-        db.save_conversation(title, saved_conversations[title])
+        extra = {}
+        if cfg.get('persist_rendered_html'):
+            # Store signed, rendered HTML next to the messages so reopening skips markdown rendering
+            extra['rendered'] = message_renderer.persistable_html([msg for _, msg, *_ in messages])
+        # The title (and with it the storage key) is generated only once per session
+        entry = lookup_conversation(session_titles[client_id]) or {}
+        with tracing.span('chat.save', messages=len(messages)):
+            title, conversation = await conversations.save_conversation(
+                messages, session_titles[client_id], extra, entry.get('parent'), entry.get('fork_point', 0),
+                on_title=show_upgraded_title,
+            )
+        session_titles[client_id] = title
+        saved_conversations[title] = conversation
+        pending_branches.pop(title, None)
         
-        # re-render saved list in drawer
-        if drawer_saved_list:
-            drawer_saved_list.refresh()
+        # Insert (or retitle) this conversation's row in the open drawers
+        if conversations.is_root(saved_conversations, title):
+            saved_list.upsert(title, drawer_title(title))
         
         # Only open drawer if explicitly requested
         if open_drawer:
@@ -404,6 +368,12 @@ async def chat_page(client: Client):
             title_label.set_text(display_title)
             title_label.update()
 
+    # Callback: a background LLM title replaced the local one
+    def show_upgraded_title(conversation_id: str, title: str):
+        saved_list.upsert(conversation_id, drawer_title(conversation_id))
+        if title_label and session_titles.get(client_id) == conversation_id:
+            title_label.set_text(format_display_title(conversation_id, max_len=100))
+
     # Placeholder for dropdown to be referenced by fetch helper
     model_selector = None
 
@@ -455,6 +425,10 @@ async def chat_page(client: Client):
                 ui.button(icon='refresh', on_click=fetch_models_and_update_ui) \
                     .props('flat round') \
                     .classes('text-light ml-2 chat-button')
+                ui.button(icon='compare_arrows',
+                          on_click=lambda: compare_dialog.open([selected_models.get(client_id) or ''], text.value)) \
+                    .props('flat round') \
+                    .classes('text-light ml-2 chat-button').tooltip('Compare models')
                 ui.button(icon='settings', on_click=lambda: ui.navigate.to('/config')) \
                     .props('flat round') \
                     .classes('text-light ml-2 chat-button')
@@ -470,6 +444,15 @@ async def chat_page(client: Client):
         with scroll_container:
              # Dictionary to store message components for selective refreshing
              message_components = {}
+             # Index of the message currently streaming, if any, and the element its tokens are appended to
+             streaming = {'idx': None, 'element': None, 'thinking': False}
+             # Messages with alternatives in other branches: {idx: (branch ids, current position)}
+             branch_nav = {'points': {}}
+
+             def update_branch_points():
+                 conversation_id = session_titles.get(client_id)
+                 branch_nav['points'] = conversations.branch_points(saved_conversations, conversation_id) \
+                     if conversation_id in saved_conversations else {}
              
              # Create a refreshable component for a single message
              def create_message_component(msg_idx):
@@ -477,25 +460,59 @@ async def chat_page(client: Client):
                  def message_content(idx=msg_idx):
                      if idx >= len(chats.get(client_id, [])):
                          return
-                     name, message = chats.get(client_id, [])[idx]
-                     with ui.card().classes(f'chat-bubble p-3 mb-2 shadow-md {"user-message" if name == "You" else "bot-message"} rounded-2xl max-w-[80%]'):
-                         # Use the enhanced message renderer instead of direct ui.markdown
-                         message_renderer.render_message(message)
-                     # Run JavaScript to add copy buttons after content is updated
-                     ui.run_javascript("addCopyButtons()")
+                     messages = chats.get(client_id, [])
+                     name, message = messages[idx][:2]
+                     meta = messages[idx][2] if len(messages[idx]) > 2 and isinstance(messages[idx][2], dict) else {}
+                     with ui.column().classes(f'max-w-[80%] gap-0 {"items-end" if name == "You" else "items-start"}'):
+                         with ui.card().classes(f'chat-bubble p-3 mb-2 shadow-md {"user-message" if name == "You" else "bot-message"} rounded-2xl'):
+                             if meta.get('reasoning'):
+                                 message_renderer.render_reasoning(meta['reasoning'])
+                             if idx == streaming['idx'] and streaming['thinking']:
+                                 # The reasoning itself is not sent while it streams
+                                 with ui.row().classes('items-center gap-2'):
+                                     ui.spinner(size='sm')
+                                     ui.label('Thinking...').classes('text-xs opacity-70')
+                                 streaming['element'] = None
+                             elif idx == streaming['idx']:
+                                 # Tokens are appended on the client until the reply is complete
+                                 streaming['element'] = streaming_message.StreamingMessage(message)
+                             else:
+                                 # Use the enhanced message renderer instead of direct ui.markdown
+                                 message_renderer.render_message(message)
+                         if streaming['idx'] is None:
+                             render_message_actions(idx, name, messages)
+                     # Copy buttons are added by chat.js as code blocks appear
                  return message_content
              
+             # Branch navigation (< 2/3 >) and edit/regenerate buttons under a message
+             def render_message_actions(idx, name, messages):
+                 with ui.row().classes('items-center gap-0 message-actions'):
+                     if idx in branch_nav['points']:
+                         targets, position = branch_nav['points'][idx]
+                         ui.button(icon='chevron_left', on_click=lambda t=targets[max(position - 1, 0)]: switch_branch(t)) \
+                             .props('flat dense round size=sm').set_enabled(position > 0)
+                         ui.label(f'{position + 1}/{len(targets)}').classes('text-xs opacity-70')
+                         ui.button(icon='chevron_right', on_click=lambda t=targets[min(position + 1, len(targets) - 1)]: switch_branch(t)) \
+                             .props('flat dense round size=sm').set_enabled(position < len(targets) - 1)
+                     if name == 'You':
+                         ui.button(icon='edit', on_click=lambda i=idx: edit_message(i)) \
+                             .props('flat dense round size=sm').classes('opacity-50 hover:opacity-100').tooltip('Edit')
+                     elif idx > 0 and messages[idx - 1][0] == 'You':
+                         ui.button(icon='refresh', on_click=lambda i=idx: regenerate(i)) \
+                             .props('flat dense round size=sm').classes('opacity-50 hover:opacity-100').tooltip('Regenerate')
+                     if len(messages[idx]) > 2 and isinstance(messages[idx][2], dict) and format_stats(messages[idx][2]):
+                         ui.label(format_stats(messages[idx][2])).classes('text-xs opacity-50 ml-2')
+
              @ui.refreshable
              def chat_messages() -> None:
+                 update_branch_points()
                  bot_name = config.get_config().get("bot_name", "Bot")
                  with ui.column().classes('w-full p-4 space-y-4'):
                      # Render messages with custom bubbles and avatars
-                     for idx, (name, message) in enumerate(chats.get(client_id, [])):
+                     for idx, (name, message, *_) in enumerate(chats.get(client_id, [])):
                          is_user = (name == 'You')
-                         # Use different RoboHash sets for user and bot
-                         avatar_id = 'User' if is_user else bot_name
-                         robo_set = 'set4' if is_user else 'set2'
-                         avatar_url = f'https://robohash.org/{avatar_id}?set={robo_set}'
+                         # Locally generated avatars, cached by the browser after the first load
+                         avatar_url = assets.avatar_url('User', 'user') if is_user else assets.avatar_url(bot_name, 'bot')
                          # Row for message and avatar
                          with ui.row().classes(f"w-full {'justify-end' if is_user else 'justify-start'} items-start"):
                              # Bot avatar on left
@@ -517,7 +534,16 @@ async def chat_page(client: Client):
              
              # Initial rendering of chat messages
              chat_messages()
-             ui.run_javascript("addCopyButtons()")
+
+    # Dialog for editing an earlier message; resolves to the new text or None
+    with ui.dialog() as edit_dialog, ui.card().classes('w-[600px] max-w-full'):
+        edit_input = ui.textarea().props('autogrow outlined').classes('w-full')
+        with ui.row().classes('w-full justify-end'):
+            ui.button('Cancel', on_click=lambda: edit_dialog.submit(None)).props('flat')
+            ui.button('Send', on_click=lambda: edit_dialog.submit(edit_input.value)).props('color=primary')
+
+    # Side-by-side comparison of several models; runs separately from the chat's own queue
+    compare_dialog = compare_view.CompareDialog(admit=lambda prompt: admit(prompt, f"compare:{client_id}"))
 
     # Input area - Footer as top-level element with improved styling
     with ui.footer().classes('px-4 py-4 chat-footer'): # Approx 60-70px height
@@ -538,97 +564,37 @@ async def chat_page(client: Client):
     # fetch model list and populate dropdown on connect
     await fetch_models_and_update_ui()
 
-# Utilities for loading/saving conversations from MongoDB
-def load_saved_conversations():
+# Utilities for loading/saving conversations from the storage backend
+def lookup_conversation(conversation_id: str):
+    """A stored conversation, or a branch whose first reply isn't saved yet."""
+    return saved_conversations.get(conversation_id) or pending_branches.get(conversation_id)
+
+async def load_saved_conversations():
     global saved_conversations
     try:
-        saved_conversations = db.get_all_conversations()
+        saved_conversations = await db.run_async(db.get_all_conversations)
     except Exception as e:
-        logger.error(f"Failed to load saved conversations from MongoDB: {e}")
+        logger.error(f"Failed to load saved conversations: {e}")
         saved_conversations = {}
 
-# The following helpers remain the same as they don't interact with storage directly
-async def generate_conversation_title(messages: List[Tuple[str, str]]) -> str:
-    """Generate a short descriptive title for the conversation using the LLM."""
-    # Take last up to 10 messages for context
-    snippet = "\n".join(f"{name}: {msg}" for name, msg in messages[-10:])
-    prompt = (
-    "Generate a concise, relevant title (under 8 words, title case, no markdown) "
-    "for the following conversation:\n\n"
-    f"{snippet}"
-    )
-    title = ""
-    model_name = config.get_default_model() or ''
-    
-    try:
-        async for chunk in llm.generate_ollama_response(
-            client_id="system",
-            user_input=prompt,
-            model_name=model_name,
-            system_prompt=None
-        ):
-            title += chunk
-    except Exception as e:
-        logger.error(f"Failed to generate title via Ollama: {e}")
-        return "Chat" # Default title on error
-        
-    title = title.strip().strip('"')
-    # fallback to first user message if empty
-    if not title:
-        for name, msg in messages:
-            if name.lower() == 'you' and msg.strip():
-                title = msg.strip().split('.')[0][:50].strip()
-                break
-    return title
-
-async def summarize_conversation(messages: List[Tuple[str, str]]) -> str:
-    # Use the LLM to produce a concise summary of the chat
-    convo_text = "\n".join(f"{name}: {msg}" for name, msg in messages)
-    prompt = (
-        "Summarize the following conversation between a user and an assistant in 3 concise sentences:\n\n" \
-        + convo_text
-    )
-    summary = ""
-    # stream the summary
-    model_name = config.get_default_model() or ''
-    
-    try:
-        async for chunk in llm.generate_ollama_response(
-            client_id="system", user_input=prompt, model_name=model_name, system_prompt=None
-        ):
-            summary += chunk
-    except Exception as e:
-        logger.error(f"Failed to generate summary via Ollama: {e}")
-        return "" # Return empty summary on error
-        
-    return summary.strip()
-
-async def should_generate_title(new_message: str, messages: List[Tuple[str, str]]) -> bool:
-    """Use the LLM to judge if this user message introduces the main topic for the chat title."""
-    snippet = "\n".join(f"{name}: {msg}" for name, msg in messages[-10:])
-    prompt = (
-        f"Given the conversation context:\n{snippet}\n\n"
-        f"And the new user message:\n'{new_message}'\n\n"
-        "Answer 'Yes' if this should be used as the conversation title; otherwise answer 'No'."
-    )
-    response = ""
-    model_name = config.get_default_model() or ''
-    
-    try:
-        async for chunk in llm.generate_ollama_response(
-            client_id="system", user_input=prompt, model_name=model_name, system_prompt=None
-        ):
-            response += chunk
-    except Exception as e:
-        logger.error(f"Failed to check title generation via Ollama: {e}")
-        return False # Default to not generating title on error
-        
-    return response.strip().lower().startswith('yes')
+# Caption under a reply with its generation statistics
+def format_stats(stats: Dict) -> str:
+    """One-line summary of a reply's generation statistics, e.g. "llama3.2 · 212 tokens · 38.5 tok/s"."""
+    parts = [stats.get('model', '')]
+    if stats.get('eval_count'):
+        parts.append(f"{stats['eval_count']} tokens")
+        if stats.get('eval_duration'):
+            parts.append(f"{stats['eval_count'] / (stats['eval_duration'] / 1e9):.1f} tok/s")
+    return ' · '.join(part for part in parts if part)
+
+# Shorter title for drawer items
+def drawer_title(key: str) -> str:
+    return format_display_title(key, max_len=42)
 
 # Helper: format display title by stripping special chars, preserving case, and truncating
 def format_display_title(key: str, max_len: int = 30) -> str:
-    raw = key.split('_', 1)[1] if '_' in key else key
+    raw = conversations.display_title(saved_conversations.get, key)
     # remove leading non-alphanumeric chars
-    raw = re.sub(r'^[^A-Za-z0-9]+', '', raw)
+    raw = re.sub(r'^[\W_]+', '', raw)
     # truncate longer titles with ellipsis
     return raw if len(raw) <= max_len else raw[:max_len-3] + '...'
\ No newline at end of file
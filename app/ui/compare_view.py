@@ -0,0 +1,110 @@
+"""
+Compare dialog of the chat page: one prompt, several models, side by side.
+
+Each selected model gets a column that streams its reply with its time to
+first token and tokens per second (see app/compare.py). Replies stream as
+plain-text deltas and are rendered as markdown once complete. A comparison is
+admitted like a chat message, so it counts against the user's limits.
+"""
+from typing import Callable, Dict, List, Optional
+
+from nicegui import ui
+
+from .. import admission
+from .. import compare
+from .. import config
+from . import message_renderer
+from . import streaming_message
+
+class CompareDialog:
+    """A maximized dialog that runs comparisons; call open() to show it."""
+
+    def __init__(self, admit: Callable[[str], Optional[admission.Ticket]]):
+        self._admit = admit
+        self._columns: Dict[str, Dict[str, ui.element]] = {}
+        self._running = False
+        with ui.dialog().props('maximized') as self.dialog, ui.card().classes('w-full h-full chat-compare'):
+            with ui.row().classes('w-full items-center gap-2'):
+                ui.label('Compare models').classes('text-lg font-semibold')
+                ui.space()
+                ui.button(icon='close', on_click=self.dialog.close).props('flat round')
+            with ui.row().classes('w-full items-start gap-2'):
+                self.model_select = ui.select(options=[], multiple=True, label='Models') \
+                    .props('outlined dense use-chips').classes('min-w-[300px]')
+                self.prompt = ui.textarea(placeholder='Prompt to send to every model...') \
+                    .props('autogrow outlined dense').classes('flex-grow')
+                self.run_button = ui.button('Run', icon='play_arrow', on_click=self.run).props('color=primary')
+            self.results = ui.row().classes('w-full flex-nowrap items-stretch gap-3 overflow-x-auto')
+
+    def open(self, models: List[str], prompt: str = '') -> None:
+        """Show the dialog, preselecting `models` and prefilling the prompt."""
+        options = config.get_available_models_cache()
+        self.model_select.options = options
+        self.model_select.value = [model for model in models if model in options]
+        self.model_select.update()
+        if prompt:
+            self.prompt.value = prompt
+        self.dialog.open()
+
+    def _build_columns(self, models: List[str]) -> None:
+        self.results.clear()
+        self._columns = {}
+        with self.results:
+            for model in models:
+                with ui.card().classes('flex-1 min-w-[320px] p-3 bot-message'):
+                    ui.label(model).classes('font-semibold')
+                    metrics = ui.label('Queued').classes('text-xs opacity-70')
+                    with ui.element('div').classes('w-full') as body:
+                        text = streaming_message.StreamingMessage()
+                self._columns[model] = {'metrics': metrics, 'body': body, 'text': text}
+
+    def _update(self, stream: compare.CompareStream) -> None:
+        column = self._columns.get(stream.model)
+        if column is None:
+            return
+        column['metrics'].set_text(format_metrics(stream))
+        if not stream.done:
+            # Only the text added since the last update is sent
+            column['text'].append(stream.text[len(column['text'].text):])
+            return
+        # Finished replies are rendered once, through the render cache like chat messages
+        column['body'].clear()
+        with column['body']:
+            message_renderer.render_message(stream.text)
+
+    async def run(self) -> None:
+        models = list(self.model_select.value or [])
+        prompt = (self.prompt.value or '').strip()
+        if self._running or not prompt or not models:
+            if not models:
+                ui.notify('Select at least one model to compare', color='warning', position='top')
+            return
+        ticket = self._admit(prompt)
+        if ticket is None:
+            return
+        self._running = True
+        self.run_button.disable()
+        try:
+            async with ticket:
+                self._build_columns(models)
+                await compare.compare(prompt, models, on_update=self._update, options=admission.generation_options())
+        finally:
+            self._running = False
+            self.run_button.enable()
+
+def format_metrics(stream: compare.CompareStream) -> str:
+    """Status line of a stream, e.g. "TTFT 0.42 s · 38.5 tok/s · done"."""
+    if stream.started_at is None:
+        return 'Queued'
+    parts = []
+    if stream.ttft is not None:
+        parts.append(f"TTFT {stream.ttft:.2f} s")
+    if stream.tokens_per_sec is not None:
+        parts.append(f"{stream.tokens_per_sec:.1f} tok/s")
+    if stream.error:
+        parts.append('failed')
+    elif stream.done:
+        parts.append(f"done in {stream.finished_at - stream.started_at:.1f} s")
+    else:
+        parts.append('streaming...')
+    return ' · '.join(parts)
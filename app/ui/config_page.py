@@ -2,6 +2,7 @@ from nicegui import ui, app
 import logging
 
 # Use relative imports for modules within the app package
+from .. import assets
 from .. import config
 from .. import llm
 
@@ -11,80 +12,8 @@ logger = logging.getLogger(__name__)
 async def config_page():
     cfg = config.get_config() # Load current config
 
-    # Add enhanced CSS for modern UI
-    ui.add_head_html("""<style>
-        /* Modern form styling */
-        .config-card {
-            border-radius: 16px !important;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1) !important;
-            transition: transform 0.2s, box-shadow 0.2s !important;
-            overflow: hidden !important;
-            border: 1px solid rgba(148, 163, 184, 0.1) !important;
-            background-color: #1e293b !important;
-        }
-        .config-card:hover {
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.15) !important;
-        }
-        
-        /* Input styling */
-        .config-input {
-            border-radius: 12px !important;
-            transition: all 0.2s !important;
-            border: 1px solid rgba(148, 163, 184, 0.2) !important;
-            background-color: #334155 !important;
-        }
-        .config-input:focus {
-            border-color: #6366f1 !important;
-            box-shadow: 0 0 0 2px rgba(99, 102, 241, 0.3) !important;
-        }
-        
-        /* Button styling */
-        .config-button {
-            transition: all 0.2s !important;
-            border-radius: 12px !important;
-            font-weight: 500 !important;
-        }
-        .config-button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2) !important;
-        }
-        
-        /* Section styling */
-        .config-section {
-            border-left: 3px solid #6366f1 !important;
-            padding-left: 16px !important;
-            margin-bottom: 24px !important;
-        }
-        
-        /* Label styling */
-        .config-label {
-            font-weight: 500 !important;
-            margin-bottom: 4px !important;
-            color: #f8fafc !important;
-        }
-        
-        /* Help text styling */
-        .help-text {
-            font-size: 0.8rem !important;
-            opacity: 0.7 !important;
-            margin-top: 4px !important;
-        }
-        
-        /* Tab styling */
-        .ni-tab {
-            border-radius: 12px 12px 0 0 !important;
-            transition: all 0.2s !important;
-        }
-        .ni-tab--selected {
-            background-color: rgba(99, 102, 241, 0.1) !important;
-            border-bottom: 2px solid #6366f1 !important;
-        }
-        
-        /* Switch styling */
-        .ni-switch {
-            transition: all 0.2s !important;
-        }
-    </style>""")
+    # Add enhanced CSS for modern UI (a content-hashed static file, cached by the browser)
+    ui.add_head_html(assets.link_tags('css/config.css'))
 
     # --- Helper Functions ---
     async def refresh_models_list():
@@ -114,12 +43,15 @@ async def config_page():
         # Update config dictionary from UI elements before saving
         config.update_config_value("bot_name", bot_name_input.value)
         config.update_config_value("default_model", model_select.value)
-        config.update_config_value("ollama_base_url", ollama_url_input.value)
+        # A single URL stays a string, several become a backend pool
+        base_urls = [url.strip() for url in ollama_url_input.value.split(',') if url.strip()]
+        config.update_config_value("ollama_base_url", base_urls if len(base_urls) > 1 else (base_urls[0] if base_urls else ""))
         config.update_config_value("ollama_timeout", timeout_input.value)
         # Simple handling for comma-separated URLs
         urls = [url.strip() for url in source_urls_input.value.split(',') if url.strip()]
         config.update_config_value("source_urls", urls)
         config.update_config_value("theme_dark_mode", dark_mode_switch.value)
+        config.update_config_value("llm_titles", llm_titles_switch.value)
 
         if config.save_config():
             ui.notify("Configuration saved successfully!", color='positive', position='top-right', 
@@ -172,8 +104,8 @@ async def config_page():
                             ui.label('Ollama Connection').classes('text-lg font-medium text-primary mb-4')
                             
                             ui.label('Ollama Base URL').classes('config-label')
-                            ollama_url_input = ui.input(value=cfg.get("ollama_base_url", "")).classes('w-full config-input').props('outlined dark color=primary')
-                            ui.label('The URL where your Ollama instance is running (e.g., http://localhost:11434)').classes('help-text')
+                            ollama_url_input = ui.input(value=', '.join(config.get_ollama_base_urls())).classes('w-full config-input').props('outlined dark color=primary')
+                            ui.label('The URL where your Ollama instance is running (e.g., http://localhost:11434). Separate several URLs with commas to load-balance across a pool').classes('help-text')
                             
                             ui.label('Request Timeout (seconds)').classes('config-label mt-4')
                             timeout_input = ui.number(value=cfg.get("ollama_timeout", 60), min=5, step=1).classes('w-full config-input').props('outlined dark color=primary')
@@ -219,6 +151,12 @@ async def config_page():
                             source_urls_input = ui.textarea(value=','.join(cfg.get("source_urls", []))).classes('w-full config-input').props('outlined dark color=primary')
                             ui.label('URLs to use as sources for responses').classes('help-text')
 
+                            with ui.row().classes('items-center justify-between'):
+                                with ui.column().classes('flex-grow'):
+                                    ui.label('LLM Titles').classes('config-label')
+                                    ui.label('Replace the instant keyword title of new chats with a model-written one in the background').classes('help-text')
+                                llm_titles_switch = ui.switch(value=cfg.get("llm_titles", False)).props('color=primary')
+
         # Save Button at bottom
         with ui.row().classes('w-full max-w-3xl mx-auto justify-end mt-6'):
             ui.button('Save Configuration', icon='save', on_click=save_and_notify).props('color=primary').classes('config-button px-6 py-2')
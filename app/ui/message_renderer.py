@@ -1,28 +1,123 @@
 """
 Module for enhanced rendering of chat messages in the UI.
 Provides preprocessing and formatting for better display of markdown elements.
+
+Messages are rendered to sanitized HTML on the server (markdown2 with Pygments
+highlighting) and cached by content hash, so re-rendering a finished message
+is a dictionary lookup.
+
+With `persist_rendered_html`, the HTML is stored next to a conversation,
+signed with STORAGE_SECRET. Stored HTML is only reused if its signature
+checks out, so an edited database or imported export can't inject markup.
 """
+import hashlib
+import hmac
+import os
 import re
+import secrets
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import markdown2
+from dotenv import load_dotenv
 from nicegui import ui
-from typing import Optional
 
-def render_message(content: str, container=None) -> None:
+# Load environment variables
+load_dotenv()
+
+# Markdown features used for chat messages; code highlighting comes from Pygments
+MARKDOWN_EXTRAS = ['fenced-code-blocks', 'tables', 'code-friendly', 'cuddled-lists']
+RENDER_CACHE_SIZE = 2000
+
+# content hash -> rendered HTML, least recently used first
+_render_cache: "OrderedDict[str, str]" = OrderedDict()
+
+# Without STORAGE_SECRET, HTML stored by earlier runs is rendered again
+_SIGNING_KEY = (os.getenv('STORAGE_SECRET') or secrets.token_urlsafe(32)).encode()
+
+def content_hash(content: str) -> str:
+    """Return the cache key for a message body."""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def markdown_to_html(content: str) -> str:
+    """Preprocess and convert markdown to HTML, escaping any raw HTML in the source."""
+    return markdown2.markdown(preprocess_markdown(content), extras=MARKDOWN_EXTRAS, safe_mode='escape')
+
+def render_html(content: str, cache: bool = True) -> str:
+    """
+    Return the sanitized HTML for a message, using the render cache.
+
+    Args:
+        content: Raw markdown content
+        cache: Set to False for content that is still changing (e.g. a streaming reply)
+    """
+    if not cache:
+        return markdown_to_html(content)
+    key = content_hash(content)
+    html = _render_cache.get(key)
+    if html is None:
+        html = markdown_to_html(content)
+        _render_cache[key] = html
+        if len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    else:
+        _render_cache.move_to_end(key)
+    return html
+
+def _signature(key: str, html: str) -> str:
+    return hmac.new(_SIGNING_KEY, f"{key}\n{html}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+def persistable_html(contents: List[str]) -> Dict[str, List[str]]:
+    """Rendered HTML of message bodies for storage: {content hash: [html, signature]}."""
+    rendered = {}
+    for content in contents:
+        key = content_hash(content)
+        html = render_html(content)
+        rendered[key] = [html, _signature(key, html)]
+    return rendered
+
+def prime_cache(rendered: Optional[Dict[str, List[str]]]) -> None:
+    """Seed the render cache with HTML persisted alongside a conversation.
+
+    Entries without a valid signature (tampered, imported from elsewhere, or
+    from the old unsigned format) are skipped and rendered again when shown.
+    """
+    for key, entry in (rendered or {}).items():
+        if key in _render_cache or not isinstance(entry, list) or len(entry) != 2:
+            continue
+        html, signature = entry
+        if isinstance(html, str) and isinstance(signature, str) and hmac.compare_digest(signature, _signature(key, html)):
+            _render_cache[key] = html
+    while len(_render_cache) > RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+
+def render_message(content: str, container=None, cache: bool = True) -> None:
     """
     Render a message with enhanced markdown and styling.
     
     Args:
         content: The message content to render
         container: Optional UI container to render into (if None, renders in current context)
+        cache: Whether to cache the rendered HTML (disable while the message is streaming)
     """
-    # Pre-process the content
-    enhanced_content = preprocess_markdown(content)
+    html = render_html(content, cache=cache)
     
     # Use container if provided, otherwise render in current context
     if container:
         with container:
-            ui.markdown(enhanced_content)
+            ui.html(html).classes('nicegui-markdown')
     else:
-        ui.markdown(enhanced_content)
+        ui.html(html).classes('nicegui-markdown')
+
+def render_reasoning(reasoning: str) -> None:
+    """Render a reply's reasoning as a collapsed section; its markdown is only rendered when first opened."""
+    section = ui.expansion('Reasoning', icon='psychology').props('dense').classes('w-full reasoning')
+
+    def fill(event) -> None:
+        if event.value and not section.default_slot.children:
+            with section:
+                ui.html(render_html(reasoning)).classes('nicegui-markdown')
+    section.on_value_change(fill)
 
 def preprocess_markdown(content: str) -> str:
     """
@@ -125,7 +220,8 @@ def fix_code_blocks(content: str) -> str:
     replacement = r'\1\n```'
     result = re.sub(pattern, replacement, content)
     
-    pattern = r'```([^\n])'
+    # Keep language identifiers on the opening fence (```python) so highlighting works
+    pattern = r'```(?![\w+#.-]+[ \t]*\n)([^\n])'
     replacement = r'```\n\1'
     result = re.sub(pattern, replacement, result)
     
@@ -0,0 +1,152 @@
+"""
+Saved-chats drawer list backed by a sorted, keyed model.
+
+Rows are grouped into Today, This Week and Older by the timestamp prefix of
+the conversation key and kept in order with bisect. A save or delete inserts,
+retitles or removes a single row in every open drawer instead of rebuilding
+the list, and the Older group is only built when it is first expanded.
+"""
+import bisect
+import datetime
+import weakref
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from nicegui import ui
+
+GROUPS = ('Today', 'This Week', 'Older')
+# Groups whose rows are only built once the user expands them
+LAZY_GROUPS = ('Older',)
+
+# Drawers of all open pages, updated together by upsert() and remove()
+_instances: 'weakref.WeakSet[SavedChatsList]' = weakref.WeakSet()
+
+def created_on(key: str) -> Optional[datetime.date]:
+    """The creation date encoded in a conversation key's timestamp prefix."""
+    try:
+        return datetime.datetime.strptime(key.split('_', 1)[0][:8], '%Y%m%d').date()
+    except ValueError:
+        return None
+
+def group_for(key: str, today: datetime.date) -> str:
+    day = created_on(key)
+    if day == today:
+        return 'Today'
+    if day and 0 <= (today - day).days < 7:
+        return 'This Week'
+    return 'Older'
+
+@dataclass
+class _Row:
+    group: str
+    sort_key: Tuple[str, str] # (timestamp prefix, key), ascending
+    title: str
+    element: Optional[ui.card] = None
+    button: Optional[ui.button] = None
+
+class SavedChatsList:
+    """The drawer list of one page; rows carry their precomputed display title."""
+
+    def __init__(self, entries: Iterable[Tuple[str, str]],
+                 on_open: Callable[[str], Awaitable[None]], on_delete: Callable[[str], Awaitable[None]]):
+        self._on_open = on_open
+        self._on_delete = on_delete
+        self._today = datetime.date.today()
+        self._rows: Dict[str, _Row] = {}
+        # Sort keys per group in ascending order; rows are displayed newest first
+        self._order: Dict[str, List[Tuple[str, str]]] = {group: [] for group in GROUPS}
+        self._built = {group: group not in LAZY_GROUPS for group in GROUPS}
+        self._sections: Dict[str, ui.element] = {}
+        self._containers: Dict[str, ui.column] = {}
+
+        for key, title in entries:
+            row = _Row(group_for(key, self._today), (key.split('_', 1)[0], key), title)
+            self._rows[key] = row
+            self._order[row.group].append(row.sort_key)
+        for order in self._order.values():
+            order.sort()
+
+        with ui.column().classes('w-full px-4 gap-0') as self._root:
+            for group in GROUPS:
+                if group in LAZY_GROUPS:
+                    section = ui.expansion(group, on_value_change=lambda e, g=group: e.value and self._build(g)) \
+                        .props('dense').classes('w-full text-xs opacity-90')
+                    with section:
+                        self._containers[group] = ui.column().classes('w-full gap-0')
+                else:
+                    with ui.column().classes('w-full gap-0') as section:
+                        ui.label(group).classes('text-xs opacity-70 my-2')
+                        self._containers[group] = ui.column().classes('w-full gap-0')
+                self._sections[group] = section
+                if self._built[group]:
+                    self._build(group)
+                section.set_visibility(bool(self._order[group]))
+        _instances.add(self)
+
+    @property
+    def is_deleted(self) -> bool:
+        """True once the page holding this list is gone."""
+        return self._root.is_deleted
+
+    def _build(self, group: str) -> None:
+        """Render all rows of a group, newest first."""
+        self._built[group] = True
+        for _, key in reversed(self._order[group]):
+            if self._rows[key].element is None:
+                self._render_row(key)
+
+    def _render_row(self, key: str) -> None:
+        row = self._rows[key]
+        with self._containers[row.group]:
+            # Card for item styling, ensure it doesn't cause overflow itself
+            with ui.card().classes('w-full mb-2 p-0 saved-chat-item bg-transparent border-0 shadow-none') as row.element:
+                with ui.row().classes('w-full justify-between items-center'):
+                    row.button = ui.button(row.title, on_click=lambda e, k=key: self._on_open(k)) \
+                        .props('no-caps text-left align=left flat') \
+                        .classes('flex-grow text-left text-sm text-gray-200 hover:text-primary py-2')
+                    ui.button(icon='delete', on_click=lambda e, k=key: self._on_delete(k)) \
+                        .props('flat round text-negative') \
+                        .classes('text-xs opacity-50 hover:opacity-100')
+
+    def upsert(self, key: str, title: str) -> None:
+        """Add a conversation, or update its title if it is already listed."""
+        row = self._rows.get(key)
+        if row is not None:
+            if row.title != title:
+                row.title = title
+                if row.button is not None:
+                    row.button.set_text(title)
+            return
+        row = _Row(group_for(key, self._today), (key.split('_', 1)[0], key), title)
+        self._rows[key] = row
+        order = self._order[row.group]
+        position = bisect.bisect(order, row.sort_key)
+        order.insert(position, row.sort_key)
+        self._sections[row.group].set_visibility(True)
+        if self._built[row.group]:
+            self._render_row(key)
+            row.element.move(target_index=len(order) - 1 - position)
+
+    def remove(self, key: str) -> None:
+        """Drop a conversation's row."""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        order = self._order[row.group]
+        order.pop(bisect.bisect_left(order, row.sort_key))
+        if row.element is not None:
+            row.element.delete()
+        if not order:
+            self._sections[row.group].set_visibility(False)
+
+def upsert(key: str, title: str) -> None:
+    """Insert or retitle a conversation in every open drawer."""
+    for saved_list in list(_instances):
+        if not saved_list.is_deleted:
+            saved_list.upsert(key, title)
+
+def remove(key: str) -> None:
+    """Remove a conversation from every open drawer."""
+    for saved_list in list(_instances):
+        if not saved_list.is_deleted:
+            saved_list.remove(key)
@@ -0,0 +1,21 @@
+// Client side of StreamingMessage (streaming_message.py): appends deltas to one text node
+export default {
+  template: `<div class="streaming-message"></div>`,
+  props: {
+    text: String,
+    chunks: Number,
+  },
+  mounted() {
+    this.textNode = document.createTextNode(this.text || "");
+    this.$el.appendChild(this.textNode);
+    // Deltas numbered below this are already part of the initial text
+    this.received = this.chunks || 0;
+  },
+  methods: {
+    append(delta, seq) {
+      if (seq < this.received) return;
+      this.textNode.appendData(delta);
+      this.received = seq + 1;
+    },
+  },
+};
@@ -0,0 +1,37 @@
+"""
+Append-only element for a reply that is still streaming.
+
+Rebuilding a message bubble for every token would send the whole reply so far
+each time, so the traffic for one reply grows with the square of its length.
+This element sends every token once instead: append() ships only the new
+text, which the browser adds to the end of a text node. Once the reply is
+complete, the chat page replaces the element with the fully rendered
+markdown.
+
+Tokens are numbered. The full text also stays in the element's props, so a
+client that builds the element late (after a reconnect, say) starts from the
+current text and skips the tokens it already contains.
+"""
+from nicegui import ui
+
+class StreamingMessage(ui.element, component='streaming_message.js'):
+    """Plain-text view of an in-progress reply that grows by appended deltas."""
+
+    def __init__(self, text: str = ''):
+        super().__init__()
+        self._props['text'] = text
+        self._props['chunks'] = 0 # Number of appended deltas contained in `text`
+
+    @property
+    def text(self) -> str:
+        return self._props['text']
+
+    def append(self, delta: str) -> None:
+        """Send one delta to the browser without re-sending what it already has."""
+        if not delta:
+            return
+        seq = self._props['chunks']
+        # Kept up to date without update(), which would send the whole text again
+        self._props['text'] += delta
+        self._props['chunks'] = seq + 1
+        self.run_method('append', delta, seq)
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
-import sys, asyncio
+import sys, asyncio, os, secrets
+# Enable startup profiling before the heavy imports below so they are timed too
+from app import startup_profile
+if '--profile-startup' in sys.argv:
+    startup_profile.enable()
 from nicegui import ui, app
 import logging
 import platform  # Import platform to detect operating system
 
 # Import necessary modules from the app package
+from app import assets
 from app import config
+from app import db
+from app import archive
+from app import memory
+from app import residency
+from app import api # Registers the headless chat API
+from app import transfer # Registers the export/import endpoints
+from app import diagnostics # Loop-lag monitor and the admin profiler endpoints
+from app import stats # Registers the generation statistics endpoint
 from app.ui import chat_page, config_page # Import the page modules
 
 # Configure logging
@@ -24,9 +37,24 @@ async def startup_handler():
     loop = asyncio.get_running_loop()
     loop.set_exception_handler(handle_asyncio_exception)
     logger.info("Custom asyncio exception handler set.")
+    # Log stack samples whenever something blocks the event loop
+    diagnostics.monitor.start()
+    # Connect to MongoDB off the event loop; requests reconnect lazily if this fails
+    db.connect_in_background()
+    # Warm up configured models so the first chat request doesn't pay the cold load
+    residency.manager.start()
+    # Move conversations idle for ARCHIVE_AFTER_DAYS to the compressed archive tier
+    archive.archiver.start()
+    # Embed stored conversation summaries for memory recall (only with an embedding_model)
+    memory.index.start()
+    if startup_profile.is_enabled():
+        startup_profile.report()
 
 # Register the startup handler
 app.on_startup(startup_handler)
+app.on_shutdown(residency.manager.stop)
+app.on_shutdown(archive.archiver.stop)
+app.on_shutdown(diagnostics.monitor.stop)
 
 # Handle Ctrl+C in terminal to stop the app
 import signal
@@ -34,7 +62,8 @@ signal.signal(signal.SIGINT, lambda sig, frame: app.shutdown())
 
 def main():
     # Load configuration at startup
-    cfg = config.load_config()
+    with startup_profile.phase("load config"):
+        cfg = config.load_config()
     logger.info("Application starting with loaded configuration.")
 
     # Apply modern color theme with a professional palette
@@ -51,149 +80,17 @@ def main():
         light='#f8fafc'       # Slate 50
     )
     
-    # Add global CSS for enhanced theme and better UX
-    ui.add_head_html('''
-    <style>
-        /* Base styling */
-        body {
-            font-family: 'Inter', 'Segoe UI', Roboto, sans-serif;
-            background-color: #0f172a !important;
-            color: #f8fafc !important;
-            transition: background-color 0.3s, color 0.3s;
-        }
-        
-        /* Card styling */
-        .ni-card {
-            border-radius: 16px !important;
-            overflow: hidden !important;
-            transition: transform 0.2s, box-shadow 0.2s !important;
-            border: 1px solid rgba(148, 163, 184, 0.1) !important;
-            background-color: #1e293b !important;
-        }
-        .ni-card:hover {
-            box-shadow: 0 8px 25px rgba(0, 0, 0, 0.2) !important;
-        }
-        
-        /* Input styling */
-        .ni-input {
-            border-radius: 12px !important;
-            background-color: #334155 !important;
-            color: #f8fafc !important;
-            transition: all 0.2s !important;
-            border: 1px solid rgba(148, 163, 184, 0.2) !important;
-        }
-        .ni-input:focus {
-            border-color: #6366f1 !important;
-            box-shadow: 0 0 0 2px rgba(99, 102, 241, 0.3) !important;
-        }
-        
-        /* Button styling */
-        .ni-button {
-            border-radius: 12px !important;
-            transition: all 0.2s !important;
-            font-weight: 500 !important;
-        }
-        .ni-button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15) !important;
-        }
-        
-        /* Drawer styling */
-        .ni-drawer {
-            background-color: #1e293b !important;
-            box-shadow: 0 0 20px rgba(0, 0, 0, 0.3) !important;
-            border-right: 1px solid rgba(148, 163, 184, 0.1) !important;
-        }
-        .ni-drawer-item {
-            border-radius: 12px !important;
-            margin: 4px 8px !important;
-            transition: all 0.2s !important;
-        }
-        .ni-drawer-item:hover {
-            background-color: rgba(99, 102, 241, 0.1) !important;
-            transform: translateX(3px);
-        }
-        
-        /* Scrollbar styling */
-        ::-webkit-scrollbar {
-            width: 6px;
-            height: 6px;
-        }
-        ::-webkit-scrollbar-track {
-            background: rgba(15, 23, 42, 0.2);
-            border-radius: 3px;
-        }
-        ::-webkit-scrollbar-thumb {
-            background-color: rgba(99, 102, 241, 0.5);
-            border-radius: 3px;
-            transition: background-color 0.3s;
-        }
-        ::-webkit-scrollbar-thumb:hover {
-            background-color: rgba(99, 102, 241, 0.8);
-        }
-        
-        /* Tooltip styling */
-        .ni-tooltip {
-            background-color: #334155 !important;
-            color: #f8fafc !important;
-            border-radius: 8px !important;
-            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.2) !important;
-        }
-        
-        /* Notification styling */
-        .ni-notification {
-            border-radius: 12px !important;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2) !important;
-        }
-        
-        /* Animation for page transitions */
-        .page-transition {
-            animation: fadeIn 0.3s ease-in-out;
-        }
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(10px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        /* Header styling */
-        .ni-header {
-            background-color: rgba(15, 23, 42, 0.8) !important;
-            backdrop-filter: blur(10px) !important;
-            border-bottom: 1px solid rgba(148, 163, 184, 0.1) !important;
-        }
-        
-        /* Footer styling */
-        .ni-footer {
-            background-color: rgba(15, 23, 42, 0.8) !important;
-            backdrop-filter: blur(10px) !important;
-            border-top: 1px solid rgba(148, 163, 184, 0.1) !important;
-        }
-        
-        /* Tab styling */
-        .ni-tab {
-            border-radius: 12px 12px 0 0 !important;
-            transition: all 0.2s !important;
-        }
-        .ni-tab--selected {
-            background-color: rgba(99, 102, 241, 0.1) !important;
-            border-bottom: 2px solid #6366f1 !important;
-        }
-        
-        /* Switch styling */
-        .ni-switch {
-            transition: all 0.2s !important;
-        }
-        
-        /* Add Font Awesome for better icons */
-        @import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css');
-        
-        /* Add Inter font for better typography */
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-        
-        /* Add Fira Code for code blocks */
-        @import url('https://fonts.googleapis.com/css2?family=Fira+Code:wght@400;500;600&display=swap');
-    </style>
-    ''')
+    # Add global CSS for enhanced theme and better UX, shared by every page
+    ui.add_head_html(assets.link_tags('css/theme.css'), shared=True)
+
+    # Inter and Fira Code are self-hosted (see app/assets.py); icons come bundled with NiceGUI
+    ui.add_head_html(assets.head_html(), shared=True)
+
+    # Signs the session cookie that keys each browser's chat state (see app/session_state.py)
+    storage_secret = os.getenv('STORAGE_SECRET')
+    if not storage_secret:
+        logger.warning("STORAGE_SECRET is not set; chat sessions won't survive a restart or move between processes")
+        storage_secret = secrets.token_urlsafe(32)
 
     # Determine if we should use native mode based on the OS
     is_windows = platform.system() == 'Windows'
@@ -203,12 +100,13 @@ def main():
         title=cfg.get("bot_name", "NiceGUI Chat"),
         dark=True,  # Always use dark mode for modern theme
         native=is_windows,  # Use native mode only on Windows
+        port=int(os.getenv('PORT', '8080')) if not is_windows else None,  # Set PORT to run several processes side by side
         fullscreen=True,  # Fullscreen mode for immersive experience
         reload=False,  # Disable auto-reload for native mode
         show=True,
-        favicon='https://raw.githubusercontent.com/zauberzeug/nicegui/main/nicegui/static/favicon.ico',
+        favicon=None,  # NiceGUI's bundled favicon, served locally
         viewport='width=device-width, initial-scale=1, shrink-to-fit=no',
-        # storage_secret='YOUR_SECRET_KEY_HERE'  # Recommended for production
+        storage_secret=storage_secret,
     )
 
 if __name__ in {"__main__", "__mp_main__"}:
@@ -0,0 +1,21 @@
+"""Admin endpoints need ADMIN_TOKEN, whatever address the request comes from."""
+import pytest
+from fastapi.testclient import TestClient
+from nicegui import app
+
+from app import admin
+from app import diagnostics  # noqa: F401 (registers /api/admin/loop-lag)
+
+@pytest.fixture
+def client():
+    return TestClient(app, client=('127.0.0.1', 50000))
+
+def test_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(admin, 'ADMIN_TOKEN', '')
+    assert client.get('/api/admin/loop-lag').status_code == 403
+
+def test_token_required(client, monkeypatch):
+    monkeypatch.setattr(admin, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/api/admin/loop-lag').status_code == 403
+    assert client.get('/api/admin/loop-lag', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/api/admin/loop-lag', headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,39 @@
+"""HTTP import of conversations: resuming with ?skip= after a partial import."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from nicegui import app
+
+from app import db
+from app import transfer
+from app.admin import require_admin
+from app.sqlite_store import SQLiteConversationStore
+
+@pytest.fixture
+def store():
+    previous = db._store
+    store = SQLiteConversationStore(':memory:')
+    db.set_store(store)
+    # Admin access is covered by app/admin.py; these tests only exercise the import
+    app.dependency_overrides[require_admin] = lambda: None
+    yield store
+    app.dependency_overrides.pop(require_admin, None)
+    store.close()
+    db.set_store(previous)
+
+def _body(count: int) -> bytes:
+    lines = [json.dumps({'id': f'c{i}', 'messages': [['You', f'message {i}']], 'summary': ''}) for i in range(count)]
+    # Blank lines are not counted towards skip
+    return ('\n\n'.join(lines) + '\n').encode()
+
+def test_import_resumes_after_skip(store):
+    response = TestClient(app).post('/api/conversations/import?skip=3', content=_body(5))
+    assert response.status_code == 200
+    assert response.json() == {'committed': 5}
+    assert sorted(store.list_conversations()) == ['c3', 'c4']
+
+def test_import_skip_past_end_imports_nothing(store):
+    response = TestClient(app).post('/api/conversations/import?skip=7', content=_body(5))
+    assert response.json() == {'committed': 7}
+    assert store.list_conversations() == {}